@@ -0,0 +1,603 @@
+"""
+Замеры производительности операций библиотеки на синтетических каталогах разного размера.
+Запуск: python bench.py [operations|resident|indexes|search|ids|memory|streaming|concurrency|server|
+                        listing|circulation|durability|instrumentation|binary] [размер ...]
+                        [--output results.json] [--compare previous.json] [--threshold 0.1]
+Замер operations проверяет основные операции на реалистичном каталоге (generate_realistic_catalogue): загрузку, сохранение,
+добавление, удаление, поиск и изменение статуса, с числом операций в секунду, процентилями задержки и пиковой памятью.
+Результаты можно записать в json (--output) и сравнить с результатами предыдущего запуска (--compare): при ухудшении
+больше чем на threshold скрипт завершается с кодом 1.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+from urllib.parse import quote
+
+from binary_storage import BinaryCatalogue, BinaryStorage, json_to_binary
+from circulation import Loan, LoanTable
+from main import Book, Catalogue, Library
+from instrumentation import Instrumentation
+from persistence import SaveScheduler
+from search import paginate
+from server import send_request, serve
+from storage import IdAllocator, JournalStorage, JsonStorage, write_json_atomic
+
+try:
+    import resource
+except ImportError: # на Windows модуля resource нет, максимальный размер процесса не выводится
+    resource = None
+
+DEFAULT_SIZES: Dict[str, List[int]] = {
+    'operations': [1000, 10000, 100000, 1000000],
+    'resident': [1000, 10000, 100000],
+    'indexes': [10000, 100000, 1000000],
+    'search': [10000, 100000, 1000000],
+    'ids': [10000, 100000],
+    'memory': [100000, 1000000],
+    'streaming': [100000, 1000000],
+    'concurrency': [1000, 10000],
+    'server': [10000, 100000],
+    'listing': [100000, 1000000],
+    'circulation': [100000, 1000000],
+    'durability': [10000, 100000],
+    'instrumentation': [10000, 100000],
+    'binary': [10000, 100000, 1000000],
+}
+
+
+def generate_catalogue(size: int, seed: int = 0) -> Iterator[Dict[str, Union[str, int]]]: # генерирует записи книг в формате library.json
+    rnd = random.Random(seed)
+    for book_id in range(1, size + 1):
+        yield {
+            'id': book_id,
+            'title': f"Книга {rnd.randrange(size)}",
+            'author': f"Автор {rnd.randrange(max(size // 10, 1))}",
+            'year': str(rnd.randrange(1800, 2020)),
+            'status': rnd.choice(['в наличии', 'выдана'])
+        }
+
+
+FIRST_NAMES: List[str] = ["Александр", "Анна", "Борис", "Вера", "Владимир", "Галина", "Дмитрий", "Елена", "Иван",
+                          "Ирина", "Константин", "Лев", "Мария", "Михаил", "Надежда", "Николай", "Ольга", "Павел",
+                          "Сергей", "Татьяна", "Фёдор", "Юлия"]
+SURNAMES: List[str] = ["Ахматова", "Булгаков", "Бунин", "Гоголь", "Горький", "Грибоедов", "Достоевский", "Есенин",
+                       "Зощенко", "Ильф", "Куприн", "Лермонтов", "Набоков", "Островский", "Пастернак", "Петров", "Платонов",
+                       "Пушкин", "Салтыков", "Толстой", "Тургенев", "Цветаева", "Чехов", "Шолохов"]
+TITLE_WORDS: List[str] = ["Тихий", "Белая", "Мёртвые", "Записки", "Война", "Мир", "Преступление", "Наказание", "Дон",
+                          "Гвардия", "Души", "Сад", "Вишнёвый", "Отцы", "Дети", "Горе", "Ума", "Идиот", "Братья", "Мастер",
+                          "Маргарита", "Поле", "Дорога", "Время", "Ночь", "Зима", "Осень", "Море", "Город", "Дом", "Сердце",
+                          "Собачье", "Капитанская", "Дочка", "Двенадцать", "Стульев", "Золотой", "Телёнок", "Степь"]
+ZIPF_EXPONENT: float = 1.1
+
+
+def generate_realistic_catalogue(size: int, seed: int = 0,
+                                 authors: Optional[int] = None) -> Iterator[Dict[str, Union[str, int]]]: # каталог с кириллическими названиями и популярными авторами
+    rnd = random.Random(seed)
+    author_names = [f"{FIRST_NAMES[number % len(FIRST_NAMES)]} {SURNAMES[number // len(FIRST_NAMES) % len(SURNAMES)]}"
+                    + (f" {number // (len(FIRST_NAMES) * len(SURNAMES))}" if number >= len(FIRST_NAMES) * len(SURNAMES) else '')
+                    for number in range(authors or max(size // 20, 10))]
+    weights = list(accumulate(1 / rank ** ZIPF_EXPONENT for rank in range(1, len(author_names) + 1)))
+    for chunk_start in range(1, size + 1, 10000):
+        chunk_size = min(10000, size + 1 - chunk_start)
+        chunk_authors = rnd.choices(author_names, cum_weights=weights, k=chunk_size)
+        for book_id, author in zip(range(chunk_start, chunk_start + chunk_size), chunk_authors):
+            words = rnd.sample(TITLE_WORDS, rnd.randint(1, 3))
+            yield {
+                'id': book_id,
+                'title': ' '.join(words).capitalize(),
+                'author': author,
+                'year': str(min(int(rnd.triangular(1800, 2024, 2010)), 2023)),
+                'status': 'выдана' if rnd.random() < 0.3 else 'в наличии'
+            }
+
+
+def write_catalogue(filename: str, size: int,
+                    generator: Callable[[int], Iterable[Dict[str, Union[str, int]]]] = generate_catalogue) -> None: # записывает синтетический каталог в файл по одной записи
+    with open(filename, 'w') as f:
+        f.write('[')
+        for number, record in enumerate(generator(size)):
+            f.write((',' if number else '') + json.dumps(record))
+        f.write(']')
+
+
+def measure(operation: Callable[[], None], repeat: int) -> float: # среднее время одной операции в миллисекундах
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            operation()
+        elapsed = time.perf_counter() - start
+    return elapsed / repeat * 1000
+
+
+def measure_each(operation: Callable[[Any], Any], arguments: List[Any]) -> float: # среднее время операции на наборе аргументов в миллисекундах
+    start = time.perf_counter()
+    for argument in arguments:
+        operation(argument)
+    return (time.perf_counter() - start) / len(arguments) * 1000
+
+
+def measure_latencies(operation: Callable[[Any], Any], arguments: Iterable[Any]) -> List[float]: # время каждого вызова в миллисекундах
+    latencies: List[float] = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for argument in arguments:
+            start = time.perf_counter()
+            operation(argument)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(name: str, latencies: List[float]) -> Dict[str, float]: # число операций в секунду и процентили задержки
+    return {
+        f"{name}.ops_per_sec": len(latencies) / (sum(latencies) / 1000),
+        f"{name}.p50_ms": percentile(latencies, 0.5),
+        f"{name}.p95_ms": percentile(latencies, 0.95),
+        f"{name}.p99_ms": percentile(latencies, 0.99),
+    }
+
+
+def bench_operations(size: int, repeat: int = 200) -> Dict[str, float]: # основные операции библиотеки на реалистичном каталоге
+    # изменения пишутся в журнал, чтобы замер показывал стоимость самих операций; стоимость записи снимка - отдельно (save)
+    results: Dict[str, float] = {}
+    rnd = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'library.json')
+        write_catalogue(filename, size, generate_realistic_catalogue)
+        sample = list(generate_realistic_catalogue(repeat, seed=2))
+        tracemalloc.start()
+        Library(storage=JournalStorage(filename)).load_from_file_list_book()
+        results['load.peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        library = Library(storage=JournalStorage(filename, compact_threshold=10 ** 9))
+        start = time.perf_counter()
+        library.load_from_file_list_book()
+        results['load.total_ms'] = (time.perf_counter() - start) * 1000
+        snapshot = JsonStorage(os.path.join(tmp, 'snapshot.json'))
+        saves = max(3, min(repeat, 10 ** 6 // size))
+        results.update(summarize('save', measure_latencies(
+            lambda _: snapshot.save(book.to_dict() for book in library.books), range(saves))))
+        results.update(summarize('add', measure_latencies(
+            lambda record: library.add_book(record['title'], record['author'], record['year']), sample)))
+        start = time.perf_counter()
+        next(library.find_books("книга"), None)
+        results['search.build_index_ms'] = (time.perf_counter() - start) * 1000
+        queries = [' '.join(record['title'].split()[:1] + record['author'].split()[1:])[:-1] for record in sample]
+        results.update(summarize('search', measure_latencies(
+            lambda query: next(library.find_books(query), []), queries)))
+        ids = rnd.sample(range(1, size + 1), min(repeat, size))
+        results.update(summarize('change_status', measure_latencies(
+            lambda id: library.change_book_status(str(id), rnd.choice(['в наличии', 'выдана'])), ids)))
+        results.update(summarize('remove', measure_latencies(lambda id: library.remove_book(str(id)), ids)))
+    if resource is not None:
+        results['process.max_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return results
+
+
+def bench_resident(size: int, repeat: int = 20) -> Dict[str, float]: # сравнивает режимы работы и хранилища библиотеки
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'library.json')
+        write_catalogue(filename, size)
+        modes = [('reload', False, JsonStorage), ('resident', True, JsonStorage), ('journal', True, JournalStorage)]
+        for mode, resident, storage_class in modes:
+            library = Library(storage=storage_class(filename))
+            library.resident = resident
+            with contextlib.redirect_stdout(io.StringIO()):
+                library.load_from_file_list_book()
+            results[f"{mode}.search_book"] = measure(lambda: library.search_book("Книга 1"), repeat)
+            results[f"{mode}.change_book_status"] = measure(
+                lambda: library.change_book_status(str(random.randint(1, size)), 'выдана'), repeat)
+    return results
+
+
+def bench_indexes(size: int, repeat: int = 1000, scan_repeat: int = 5) -> Dict[str, float]: # сравнивает индексы Catalogue с перебором списка
+    books = [Book.from_dict(record) for record in generate_catalogue(size)]
+    catalogue = Catalogue(books)
+    ids = [random.randint(1, size) for _ in range(repeat)]
+    titles = [f"Книга {random.randrange(size)}" for _ in range(repeat)]
+
+    def scan_get_by_id(id: int) -> Book:
+        return next(book for book in books if book.id == id)
+
+    def scan_search_title(title: str) -> List[Book]:
+        return [book for book in books if book.title == title]
+
+    return {
+        'scan.get_by_id': measure_each(scan_get_by_id, ids[:scan_repeat]),
+        'index.get_by_id': measure_each(catalogue.get, ids),
+        'scan.search_title': measure_each(scan_search_title, titles[:scan_repeat]),
+        'index.search_title': measure_each(lambda title: catalogue.find('title', title), titles),
+    }
+
+
+def bench_search(size: int, repeat: int = 1000) -> Dict[str, float]: # время полнотекстового поиска (первая страница результатов)
+    catalogue = Catalogue(Book.from_dict(record) for record in generate_catalogue(size))
+    start = time.perf_counter()
+    next(catalogue.search("книга"), None)
+    build = (time.perf_counter() - start) * 1000
+    words = [f"Книга {random.randrange(size)}" for _ in range(repeat)]
+    prefixes = [f"автор {random.randrange(max(size // 10, 1))}"[:-1] for _ in range(repeat)]
+    return {
+        'search.build_index': build,
+        'search.exact_words': measure_each(lambda query: next(paginate(catalogue.search(query), 20), []), words),
+        'search.prefix': measure_each(lambda query: next(paginate(catalogue.search(query), 20), []), prefixes),
+    }
+
+
+def legacy_get_id_counter(filename: str) -> int: # прежняя выдача id: чтение и перезапись файла счетчика на каждую книгу
+    with open(filename, 'r') as f:
+        id_counter = int(f.read())
+    with open(filename, 'w') as f:
+        f.write(str(id_counter + 1))
+    return id_counter
+
+
+def bench_ids(size: int) -> Dict[str, float]: # пропускная способность выдачи id при массовом добавлении (id в секунду)
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'counter.txt')
+        with open(filename, 'w') as f:
+            f.write('1')
+        start = time.perf_counter()
+        for _ in range(size):
+            legacy_get_id_counter(filename)
+        results['ids.legacy_per_sec'] = size / (time.perf_counter() - start)
+        allocator = IdAllocator(filename)
+        start = time.perf_counter()
+        for _ in range(size):
+            allocator.next_id()
+        results['ids.blocks_per_sec'] = size / (time.perf_counter() - start)
+        start = time.perf_counter()
+        allocator.allocate(size)
+        results['ids.allocate_per_sec'] = size / (time.perf_counter() - start)
+    return results
+
+
+def bench_memory(size: int) -> Dict[str, float]: # память на книгу и время загрузки каталога с валидацией и без нее
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'library.json')
+        write_catalogue(filename, size)
+        for mode, trusted in (('validated', False), ('trusted', True)):
+            library = Library(filename)
+            library.trusted_load = trusted
+            start = time.perf_counter()
+            library.load_from_file_list_book()
+            results[f"load.{mode}_ms"] = (time.perf_counter() - start) * 1000
+            library = Library(filename)
+            library.trusted_load = trusted
+            tracemalloc.start()
+            library.load_from_file_list_book()
+            results[f"load.{mode}_bytes_per_book"] = tracemalloc.get_traced_memory()[0] / size
+            tracemalloc.stop()
+            del library
+    return results
+
+
+def bench_streaming(size: int) -> Dict[str, float]: # время до первой книги и пиковая память: полная загрузка против потокового чтения
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'library.json')
+        write_catalogue(filename, size)
+        for mode in ('load', 'stream'):
+            library = Library(filename)
+            tracemalloc.start()
+            start = time.perf_counter()
+            if mode == 'load':
+                library.load_from_file_list_book()
+                books = iter(library.books)
+            else:
+                books = library.iter_books()
+            next(books)
+            results[f"{mode}.first_book_ms"] = (time.perf_counter() - start) * 1000
+            for _ in books:
+                pass
+            results[f"{mode}.peak_bytes_per_book"] = tracemalloc.get_traced_memory()[1] / size
+            tracemalloc.stop()
+            del library, books
+    return results
+
+
+def change_statuses(filename: str, journal: bool, ids: List[int]) -> None: # меняет статусы книг в отдельном процессе
+    library = Library(storage=JournalStorage(filename) if journal else JsonStorage(filename))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for id in ids:
+            library.change_book_status(str(id), random.choice(['в наличии', 'выдана']))
+
+
+def bench_concurrency(size: int, processes: int = 4, changes: int = 200) -> Dict[str, float]: # пропускная способность изменений из нескольких процессов
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'library.json')
+        for mode, journal in (('json', False), ('journal', True)):
+            write_catalogue(filename, size)
+            workers = [multiprocessing.Process(target=change_statuses,
+                                               args=(filename, journal, [random.randint(1, size) for _ in range(changes)]))
+                       for _ in range(processes)]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            results[f"{mode}.changes_per_sec"] = processes * changes / (time.perf_counter() - start)
+    return results
+
+
+def percentile(values: List[float], fraction: float) -> float: # значение, которое не превышают fraction значений
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def run_server(filename: str, port: int) -> None: # запускает сервис библиотеки в отдельном процессе
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(serve(Library(storage=JournalStorage(filename)), '127.0.0.1', port))
+
+
+async def generate_load(port: int, size: int, requests: int, connections: int,
+                        write_share: float) -> List[float]: # задержки запросов смешанной нагрузки в миллисекундах
+    latencies: List[float] = []
+
+    async def client(count: int) -> None:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for _ in range(count):
+            id = random.randint(1, size)
+            if random.random() < write_share:
+                request = ('PUT', f"/books/{id}/status", {'status': random.choice(['в наличии', 'выдана'])})
+            else:
+                request = random.choice([('GET', f"/books/{id}"), ('GET', f"/search?q={quote(f'Автор {id % (size // 10 or 1)}')}"),
+                                         ('GET', f"/books?offset={id}&limit=20")])
+            start = time.perf_counter()
+            await send_request(reader, writer, *request)
+            latencies.append((time.perf_counter() - start) * 1000)
+        writer.close()
+
+    await asyncio.gather(*(client(requests // connections) for _ in range(connections)))
+    return latencies
+
+
+def bench_server(size: int, requests: int = 4000, connections: int = 32) -> Dict[str, float]: # задержки и пропускная способность HTTP-сервиса
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'library.json')
+        write_catalogue(filename, size)
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        server = multiprocessing.Process(target=run_server, args=(filename, port))
+        server.start()
+        try:
+            while True:
+                try:
+                    socket.create_connection(('127.0.0.1', port)).close()
+                    break
+                except ConnectionError:
+                    time.sleep(0.05)
+            for mode, write_share in (('read', 0.0), ('mixed', 0.1)):
+                start = time.perf_counter()
+                latencies = asyncio.run(generate_load(port, size, requests, connections, write_share))
+                results[f"{mode}.requests_per_sec"] = len(latencies) / (time.perf_counter() - start)
+                results[f"{mode}.p50_ms"] = percentile(latencies, 0.5)
+                results[f"{mode}.p99_ms"] = percentile(latencies, 0.99)
+        finally:
+            server.terminate()
+            server.join()
+    return results
+
+
+def bench_listing(size: int, repeat: int = 100) -> Dict[str, float]: # страница каталога по названию: сортировка на каждый вызов против индекса
+    catalogue = Catalogue(Book.from_dict(record, trusted=True) for record in generate_catalogue(size))
+    offsets = [random.randrange(size) for _ in range(repeat)]
+
+    def sort_each_time(offset: int) -> List[Book]:
+        return sorted(catalogue, key=lambda book: (book.title.casefold(), book.id))[offset:offset + 20]
+
+    start = time.perf_counter()
+    next(catalogue.page(0, 20, 'title'), None)
+    build = (time.perf_counter() - start) * 1000
+    return {
+        'sorted.page': measure_each(sort_each_time, offsets[:5]),
+        'index.build_ms': build,
+        'index.page': measure_each(lambda offset: list(catalogue.page(offset, 20, 'title')), offsets),
+        'index.page_status': measure_each(lambda offset: list(catalogue.page(offset // 2, 20, 'title', 'выдана')), offsets),
+    }
+
+
+def bench_circulation(size: int, repeat: int = 100) -> Dict[str, float]: # подсчет выданных книг и поиск просроченных выдач: перебор против индексов
+    catalogue = Catalogue(Book.from_dict(record, trusted=True) for record in generate_catalogue(size))
+    authors = [f"Автор {random.randrange(max(size // 10, 1))}" for _ in range(repeat)]
+    start_date = date(2024, 1, 1)
+    loans = [Loan(book.id, f"Читатель {book.id % 1000}", start_date + timedelta(days=book.id % 365))
+             for book in catalogue if book.status == 'выдана']
+    table = LoanTable(loans)
+    today = start_date + timedelta(days=7)
+
+    def scan_available_by_author(author: str) -> int:
+        return sum(1 for book in catalogue if book.author == author and book.status == 'в наличии')
+
+    catalogue.count('выдана')
+    return {
+        'scan.count_issued': measure_each(lambda _: sum(1 for book in catalogue if book.status == 'выдана'), [None] * 5),
+        'counters.count_issued': measure_each(lambda _: catalogue.count('выдана'), [None] * repeat),
+        'scan.available_by_author': measure_each(scan_available_by_author, authors[:5]),
+        'counters.available_by_author': measure_each(lambda author: catalogue.count('в наличии', author), authors),
+        'scan.overdue': measure_each(lambda day: [loan for loan in loans if loan.due < day], [today] * 5),
+        'index.overdue': measure_each(table.overdue, [today] * repeat),
+    }
+
+
+def bench_durability(size: int, repeat: int = 50) -> Dict[str, float]: # время изменения статуса при разных уровнях надежности сохранения
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'library.json')
+        for mode in ('indent', 'sync', 'group', 'async'):
+            write_catalogue(filename, size)
+            library = Library(filename)
+            if mode == 'indent':
+                library.storage.indent = 4
+            scheduler = SaveScheduler(library, 'sync' if mode == 'indent' else mode)
+            with contextlib.redirect_stdout(io.StringIO()):
+                library.load_from_file_list_book()
+            results[f"{mode}.change_book_status"] = measure(
+                lambda: library.change_book_status(str(random.randint(1, size)), 'выдана'), repeat)
+            start = time.perf_counter()
+            scheduler.close()
+            results[f"{mode}.close_ms"] = (time.perf_counter() - start) * 1000
+            results[f"{mode}.avg_flush_ms"] = scheduler.stats()['avg_flush_ms']
+    return results
+
+
+def bench_instrumentation(size: int, repeat: int = 1000) -> Dict[str, float]: # стоимость сбора статистики: выключенный и включенный сбор
+    results: Dict[str, float] = {}
+    instrumentation = Instrumentation(Library, Book)
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'library.json')
+        write_catalogue(filename, size, generate_realistic_catalogue)
+        library = Library(filename)
+        library.load_from_file_list_book()
+        ids = [random.randint(1, size) for _ in range(repeat)]
+        for mode in ('disabled', 'enabled'):
+            if mode == 'enabled':
+                instrumentation.enable()
+            try:
+                results[f"{mode}.count_books"] = measure(library.count_books, repeat)
+                results[f"{mode}.list_books"] = measure_each(lambda offset: list(library.list_books(offset)), ids)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results[f"{mode}.change_book_status"] = measure_each(
+                        lambda id: library.change_book_status(str(id), 'выдана'), ids[:repeat // 10])
+            finally:
+                instrumentation.disable()
+    return results
+
+
+def bench_binary(size: int, repeat: int = 1000) -> Dict[str, float]: # размер и скорость двоичного формата против json
+    results: Dict[str, float] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'library.json')
+        binary_filename = os.path.join(tmp, 'library.bin')
+        write_catalogue(filename, size, generate_realistic_catalogue)
+        records = JsonStorage(filename).load()
+        write_json_atomic(filename, records, indent=4)
+        results['json_indent.size_per_book'] = os.path.getsize(filename) / size
+        write_json_atomic(filename, records)
+        results['json.size_per_book'] = os.path.getsize(filename) / size
+        start = time.perf_counter()
+        json_to_binary(filename, binary_filename)
+        results['convert_ms'] = (time.perf_counter() - start) * 1000
+        results['binary.size_per_book'] = os.path.getsize(binary_filename) / size
+        del records
+        results['json.load_ms'] = measure(lambda: JsonStorage(filename).load(), 3)
+        results['binary.load_ms'] = measure(lambda: BinaryStorage(binary_filename).load(), 3)
+        ids = [random.randint(1, size) for _ in range(repeat)]
+
+        def open_and_get(id: int) -> Optional[Dict[str, Any]]:
+            with BinaryCatalogue(binary_filename) as catalogue:
+                return catalogue.get(id)
+
+        results['binary.open_get'] = measure_each(open_and_get, ids)
+        with BinaryCatalogue(binary_filename, writable=True) as catalogue:
+            results['binary.get'] = measure_each(catalogue.get, ids)
+            results['binary.set_status'] = measure_each(lambda id: catalogue.set_status(id, 'выдана'), ids)
+        for name, storage in (('json', JsonStorage(filename)), ('binary', BinaryStorage(binary_filename))):
+            library = Library(storage=storage)
+            with contextlib.redirect_stdout(io.StringIO()):
+                library.load_from_file_list_book()
+                results[f"{name}.change_book_status"] = measure_each(
+                    lambda id: library.change_book_status(str(id), 'в наличии'), ids[:20])
+    return results
+
+
+BENCHMARKS: Dict[str, Callable[[int], Dict[str, float]]] = {
+    'operations': bench_operations,
+    'resident': bench_resident,
+    'indexes': bench_indexes,
+    'search': bench_search,
+    'ids': bench_ids,
+    'memory': bench_memory,
+    'streaming': bench_streaming,
+    'concurrency': bench_concurrency,
+    'server': bench_server,
+    'listing': bench_listing,
+    'circulation': bench_circulation,
+    'durability': bench_durability,
+    'instrumentation': bench_instrumentation,
+    'binary': bench_binary,
+}
+
+
+UNITS: Dict[str, str] = {'_per_sec': 'оп/с', '_per_book': 'байт', '_bytes': 'байт', '_ms': 'мс'}
+Results = Dict[str, Dict[str, Dict[str, float]]]
+
+
+def unit_of(operation: str) -> str: # единица измерения результата по суффиксу его имени
+    return next((unit for suffix, unit in UNITS.items() if operation.endswith(suffix)), 'мс/оп')
+
+
+def higher_is_better(operation: str) -> bool:
+    return operation.endswith('_per_sec')
+
+
+def compare_results(previous: Results, current: Results, threshold: float) -> List[str]: # сравнивает результаты двух запусков, возвращает ухудшения
+    regressions: List[str] = []
+    for name, sizes in current.items():
+        for size, operations in sizes.items():
+            for operation, value in operations.items():
+                old = previous.get(name, {}).get(size, {}).get(operation)
+                if not old:
+                    continue
+                change = value / old - 1
+                worse = -change if higher_is_better(operation) else change
+                mark = ''
+                if worse > threshold:
+                    mark = 'УХУДШЕНИЕ'
+                    regressions.append(f"{name} {size} {operation}")
+                print(f"{size:>10} {name + '.' + operation:<40} {old:12.4f} -> {value:12.4f} {unit_of(operation):<6} "
+                      f"{change:+8.1%} {mark}")
+    return regressions
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description="Замеры производительности библиотеки")
+    parser.add_argument('benchmarks', nargs='*', help=f"замеры ({', '.join(BENCHMARKS)}) и размеры каталогов")
+    parser.add_argument('--output', help="записать результаты в json-файл")
+    parser.add_argument('--compare', help="сравнить с результатами из json-файла предыдущего запуска")
+    parser.add_argument('--threshold', type=float, default=0.1, help="допустимое ухудшение (доля), по умолчанию 0.1")
+    args = parser.parse_args(argv)
+    unknown = [arg for arg in args.benchmarks if arg not in BENCHMARKS and not arg.isdigit()]
+    if unknown:
+        parser.error(f"неизвестные замеры: {', '.join(unknown)}")
+    names = [arg for arg in args.benchmarks if arg in BENCHMARKS] or list(BENCHMARKS)
+    sizes = [int(arg) for arg in args.benchmarks if arg.isdigit()]
+    results: Results = {}
+    for name in names:
+        for size in sizes or DEFAULT_SIZES[name]:
+            for operation, value in BENCHMARKS[name](size).items():
+                print(f"{size:>10} {operation:<30} {value:12.4f} {unit_of(operation)}")
+                results.setdefault(name, {}).setdefault(str(size), {})[operation] = value
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'created': datetime.now().isoformat(timespec='seconds'), 'python': sys.version.split()[0],
+                       'results': results}, f, ensure_ascii=False, indent=4)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)['results']
+        print(f"Сравнение с {args.compare}:")
+        regressions = compare_results(previous, results, args.threshold)
+        if regressions:
+            print(f"Ухудшение больше {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
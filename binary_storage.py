@@ -0,0 +1,227 @@
+"""
+Компактный двоичный формат каталога с индексом для чтения отдельных книг без разбора всего файла.
+Устройство файла (все числа little-endian):
+- заголовок: сигнатура b'LIBB', версия формата (2 байта), 2 резервных байта;
+- записи книг подряд: длина записи (4 байта), id (8 байт), номера строк статуса, автора и года в таблице строк
+  (по 4 байта), название в UTF-8 до конца записи;
+- таблица строк: число строк (4 байта), смещения начала каждой строки и конца последней (по 4 байта), байты строк в UTF-8;
+- индекс: пары (id, смещение записи) по 8 байт, упорядоченные по id;
+- концовка: смещение таблицы строк, смещение индекса, число книг (по 8 байт) и сигнатура b'LIBE'.
+Повторяющиеся строки (статусы, авторы, годы) хранятся в таблице один раз, а в записи - только их номера.
+Первые строки таблицы - статусы BookStatus в порядке объявления, поэтому номер статуса известен без чтения таблицы.
+Файл открывается через mmap: книга по id находится двоичным поиском по индексу, строки таблицы декодируются
+по мере обращения к ним, статус книги меняется на месте записью 4 байт, остальные записи при этом не читаются.
+Перевод каталога между форматами:
+python binary_storage.py to-binary library.json library.bin
+python binary_storage.py to-json library.bin library.json
+"""
+import mmap
+import os
+import struct
+import sys
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from circulation import BookStatus, parse_status
+from storage import Change, FileStorage, Record, Signature, file_signature, iter_records, write_json_atomic
+
+MAGIC: bytes = b'LIBB'
+END_MAGIC: bytes = b'LIBE'
+VERSION: int = 1
+HEADER = struct.Struct('<4sHH')
+RECORD = struct.Struct('<IqIII') # длина записи, id, статус, автор, год
+STATUS_OFFSET: int = struct.calcsize('<Iq') # смещение номера статуса от начала записи
+UINT = struct.Struct('<I')
+STRING_SPAN = struct.Struct('<II')
+INDEX_ENTRY = struct.Struct('<qQ')
+TRAILER = struct.Struct('<QQQ4s')
+FIELDS: Tuple[str, ...] = ('id', 'title', 'author', 'year', 'status')
+STATUS_NUMBERS: Dict[BookStatus, int] = {status: number for number, status in enumerate(BookStatus)}
+
+
+def write_binary(filename: str, records: Iterable[Record]) -> int: # записывает каталог в двоичном формате, возвращает число книг
+    strings: Dict[str, int] = {status.value: number for status, number in STATUS_NUMBERS.items()}
+    index: List[Tuple[int, int]] = []
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0))
+        offset = HEADER.size
+        for record in records:
+            if record.keys() != set(FIELDS) or not isinstance(record['id'], int) \
+                    or not all(isinstance(record[field], str) for field in FIELDS[1:]):
+                raise ValueError(f"Запись {record} не может быть сохранена в двоичном формате.")
+            numbers = [strings.setdefault(record[field], len(strings)) for field in ('status', 'author', 'year')]
+            title = record['title'].encode('utf-8')
+            f.write(RECORD.pack(RECORD.size - UINT.size + len(title), record['id'], *numbers) + title)
+            index.append((record['id'], offset))
+            offset += RECORD.size + len(title)
+        strings_offset = offset
+        data = [string.encode('utf-8') for string in strings] # словарь хранит строки в порядке их номеров
+        f.write(UINT.pack(len(data)))
+        f.write(b''.join(UINT.pack(position) for position in accumulate((len(string) for string in data), initial=0)))
+        f.write(b''.join(data))
+        index_offset = f.tell()
+        index.sort()
+        for (id, _), (next_id, _) in zip(index, index[1:]):
+            if id == next_id:
+                raise ValueError(f"Книга с ID {id} встречается в каталоге несколько раз.")
+        f.write(b''.join(INDEX_ENTRY.pack(id, offset) for id, offset in index))
+        f.write(TRAILER.pack(strings_offset, index_offset, len(index), END_MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+    return len(index)
+
+
+class BinaryCatalogue:
+    """
+    Класс BinaryCatalogue - каталог в двоичном формате, открытый через mmap.
+    Описание методов класса:
+    'get' - книга по id (двоичный поиск по индексу и чтение одной записи)
+    'set_status' - изменение статуса книги на месте, без перезаписи файла (только при writable = True)
+    'offset_of' - смещение записи книги в файле
+    '__iter__' - все книги в порядке хранения
+
+    При открытии читается только концовка файла. Объект нужно закрыть (close или with),
+    изменения статусов записываются в файл сразу и видны всем, кто открыл этот же файл.
+    """
+    def __init__(self, filename: str, writable: bool = False):
+        self.filename: str = filename
+        self._file = open(filename, 'r+b' if writable else 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._read_layout()
+        except (ValueError, struct.error, OSError):
+            self.close()
+            raise ValueError(f"Файл {filename} не является каталогом в двоичном формате.")
+
+    def __enter__(self) -> 'BinaryCatalogue':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Record]:
+        offset = HEADER.size
+        while offset < self._strings_offset:
+            record, offset = self._read_record(offset)
+            yield record
+
+    def close(self) -> None:
+        if getattr(self, '_mmap', None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def offset_of(self, id: int) -> Optional[int]: # двоичный поиск по индексу
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry_id, offset = INDEX_ENTRY.unpack_from(self._mmap, self._index_offset + middle * INDEX_ENTRY.size)
+            if entry_id == id:
+                return offset
+            if entry_id < id:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def get(self, id: int) -> Optional[Record]:
+        offset = self.offset_of(id)
+        return None if offset is None else self._read_record(offset)[0]
+
+    def set_status(self, id: int, status: str) -> None: # статус меняется записью номера строки поверх прежнего
+        offset = self.offset_of(id)
+        if offset is None:
+            raise KeyError(id)
+        os.pwrite(self._file.fileno(), UINT.pack(STATUS_NUMBERS[parse_status(status)]), offset + STATUS_OFFSET)
+
+    def flush(self) -> None: # сбрасывает изменения статусов на диск
+        os.fsync(self._file.fileno())
+
+    def _read_layout(self) -> None: # концовка и начало таблицы строк
+        if self._mmap[:len(MAGIC)] != MAGIC or HEADER.unpack_from(self._mmap)[1] != VERSION:
+            raise ValueError("Неизвестный формат")
+        self._strings_offset, self._index_offset, self._count, end_magic = TRAILER.unpack_from(
+            self._mmap, len(self._mmap) - TRAILER.size)
+        if end_magic != END_MAGIC or self._index_offset + self._count * INDEX_ENTRY.size != len(self._mmap) - TRAILER.size:
+            raise ValueError("Файл поврежден")
+        count, = UINT.unpack_from(self._mmap, self._strings_offset)
+        self._string_positions: int = self._strings_offset + UINT.size
+        self._string_data: int = self._string_positions + (count + 1) * UINT.size
+        self._strings: Dict[int, str] = {}
+
+    def _string(self, number: int) -> str: # строка таблицы по номеру, декодируется при первом обращении
+        string = self._strings.get(number)
+        if string is None:
+            start, end = STRING_SPAN.unpack_from(self._mmap, self._string_positions + number * UINT.size)
+            string = self._strings[number] = sys.intern(
+                self._mmap[self._string_data + start:self._string_data + end].decode('utf-8'))
+        return string
+
+    def _read_record(self, offset: int) -> Tuple[Record, int]: # запись по смещению и смещение следующей записи
+        length, id, status, author, year = RECORD.unpack_from(self._mmap, offset)
+        end = offset + UINT.size + length
+        title = self._mmap[offset + RECORD.size:end].decode('utf-8')
+        string = self._string
+        return {'id': id, 'title': title, 'author': string(author), 'year': string(year), 'status': string(status)}, end
+
+
+class BinaryStorage(FileStorage):
+    """
+    Хранилище каталога в двоичном формате (см. BinaryCatalogue) для Library.
+    Если сохраняемые изменения - только смены статусов книг, которые уже есть в файле, статусы меняются на месте;
+    при добавлении и удалении книг файл перезаписывается целиком (атомарно, как JsonStorage).
+    Изменение на месте не меняет размер и inode файла, а время изменения может совпасть с предыдущим,
+    поэтому в сигнатуру хранилища входит номер поколения каталога.
+    """
+    def __init__(self, filename: str = 'library.bin'):
+        super().__init__(filename)
+
+    def signature(self) -> Optional[Tuple[Signature, int]]:
+        signature = file_signature(self.filename)
+        return None if signature is None else (signature, self.generation())
+
+    def load(self) -> List[Record]:
+        return list(self.iter_records())
+
+    def iter_records(self) -> Iterator[Record]:
+        with BinaryCatalogue(self.filename) as catalogue:
+            yield from catalogue
+
+    def create(self) -> None: # создает пустой каталог
+        write_binary(self.filename, [])
+
+    def save(self, records: Iterable[Record], changes: Tuple[Change, ...] = ()) -> None:
+        with self.write_lock():
+            if changes and all(change['op'] == 'status' for change in changes) and os.path.exists(self.filename):
+                with BinaryCatalogue(self.filename, writable=True) as catalogue:
+                    if all(catalogue.offset_of(change['id']) is not None for change in changes):
+                        for change in changes:
+                            catalogue.set_status(change['id'], change['status'])
+                        catalogue.flush()
+                        return
+            write_binary(self.filename, records)
+
+
+def json_to_binary(json_filename: str, binary_filename: str) -> int: # переводит каталог из json в двоичный формат
+    return write_binary(binary_filename, iter_records(json_filename))
+
+
+def binary_to_json(binary_filename: str, json_filename: str, indent: Optional[int] = None) -> int: # переводит каталог из двоичного формата в json
+    with BinaryCatalogue(binary_filename) as catalogue:
+        write_json_atomic(json_filename, catalogue, indent)
+        return len(catalogue)
+
+
+if __name__ == '__main__':
+    commands = {'to-binary': json_to_binary, 'to-json': binary_to_json}
+    if len(sys.argv) != 4 or sys.argv[1] not in commands:
+        print("Использование: python binary_storage.py to-binary library.json library.bin\n"
+              "               python binary_storage.py to-json library.bin library.json")
+        sys.exit(1)
+    count = commands[sys.argv[1]](sys.argv[2], sys.argv[3])
+    print(f"Переведено книг: {count}")
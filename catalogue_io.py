@@ -0,0 +1,115 @@
+"""
+Массовый импорт и экспорт каталога в форматах CSV и JSON Lines.
+Файлы читаются и пишутся потоком по одной записи, поэтому память не зависит от размера входного файла.
+Некорректные записи при импорте не прерывают загрузку, а попадают в файл отклоненных записей (JSON Lines).
+Запуск: python catalogue_io.py import books.csv [--rejects rejects.jsonl]
+        python catalogue_io.py export books.jsonl
+"""
+import argparse
+import csv
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, Optional, TextIO, Tuple
+
+from main import Book, Library
+
+FIELDS: Tuple[str, ...] = ('id', 'title', 'author', 'year', 'status')
+
+
+def detect_format(filename: str) -> str: # формат файла по расширению: csv или jsonl
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    raise ValueError(f"Неизвестный формат файла {filename}: ожидается .csv или .jsonl")
+
+
+def read_rows(f: TextIO, file_format: str) -> Iterator[Dict[str, Any]]: # читает записи из открытого файла по одной
+    if file_format == 'csv':
+        yield from csv.DictReader(f)
+        return
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            row = {'line': line_number, 'raw': line.rstrip('\n'), 'error': str(e)}
+        yield row if isinstance(row, dict) else {'line': line_number, 'raw': line.rstrip('\n')}
+
+
+def write_rows(f: TextIO, file_format: str, books: Iterable[Book]) -> int: # пишет книги в открытый файл, возвращает их число
+    count = 0
+    if file_format == 'csv':
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for book in books:
+            writer.writerow(book.to_dict())
+            count += 1
+        return count
+    for book in books:
+        f.write(json.dumps(book.to_dict(), ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+
+class RejectsWriter:
+    """
+    Класс RejectsWriter записывает отклоненные при импорте записи с причиной отказа.
+    Файл создается только при появлении первой отклоненной записи.
+    """
+    def __init__(self, filename: str):
+        self.filename: str = filename
+        self.count: int = 0
+        self._file: Optional[TextIO] = None
+
+    def __call__(self, row: Dict[str, Any], error: Exception) -> None:
+        if self._file is None:
+            self._file = open(self.filename, 'w', encoding='utf-8')
+        self._file.write(json.dumps({'row': row, 'error': str(error)}, ensure_ascii=False) + '\n')
+        self.count += 1
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+def import_catalogue(library: Library, filename: str, rejects_filename: Optional[str] = None) -> Tuple[int, int]: # возвращает число добавленных и отклоненных записей
+    rejects = RejectsWriter(rejects_filename or f"{filename}.rejects.jsonl")
+    try:
+        with open(filename, 'r', encoding='utf-8', newline='') as f:
+            added = library.add_books(read_rows(f, detect_format(filename)), on_reject=rejects)
+    finally:
+        rejects.close()
+    return added, rejects.count
+
+
+def export_catalogue(library: Library, filename: str) -> int: # выгружает каталог в файл, возвращает число книг
+    library.load_from_file_list_book()
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        return write_rows(f, detect_format(filename), library.books)
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Импорт и экспорт каталога библиотеки (CSV, JSON Lines)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help="добавить книги из файла")
+    import_parser.add_argument('filename')
+    import_parser.add_argument('--rejects', help="файл для отклоненных записей")
+    export_parser = subparsers.add_parser('export', help="выгрузить каталог в файл")
+    export_parser.add_argument('filename')
+    args = parser.parse_args(argv)
+
+    library = Library()
+    if args.command == 'import':
+        added, rejected = import_catalogue(library, args.filename, args.rejects)
+        if rejected:
+            print(f"Отклонено записей: {rejected}, подробности в файле {args.rejects or args.filename + '.rejects.jsonl'}")
+    else:
+        count = export_catalogue(library, args.filename)
+        print(f"Выгружено книг: {count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""
+Выдача книг читателям. Модуль работает со статусами и id книг и не зависит от классов Book и Library,
+поэтому main использует его перечисление статусов и счетчики доступности.
+Описание классов:
+'BookStatus' - допустимые статусы книги
+'AvailabilityCounters' - число книг по статусам и по авторам, обновляется при каждом изменении каталога
+'Loan' - запись о выдаче книги: id книги, читатель, срок возврата
+'LoanTable' - таблица выдач с индексами по читателю и по сроку возврата
+'Circulation' - выдача и возврат книг пачками с сохранением статусов в библиотеке и выдач в файле <каталог>.loans
+"""
+import json
+import os
+from bisect import bisect_left, insort
+from datetime import date, timedelta
+from enum import Enum
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from storage import Signature, file_signature, write_json_atomic
+
+
+class BookStatus(str, Enum):
+    """
+    Статус книги. Значения совпадают со строками, которые хранятся в файле библиотеки, и равны им при сравнении.
+    """
+    AVAILABLE = 'в наличии'
+    ISSUED = 'выдана'
+
+    def __str__(self) -> str:
+        return self.value
+
+
+STATUS_BY_VALUE: Dict[str, BookStatus] = {status.value: status for status in BookStatus}
+
+
+def parse_status(value: str) -> BookStatus: # статус по строке без учета регистра
+    status = STATUS_BY_VALUE.get(value) or STATUS_BY_VALUE.get(value.lower())
+    if status is None:
+        raise ValueError(f"Статус должен быть одним из следующих: {', '.join(STATUS_BY_VALUE)}")
+    return status
+
+
+class AvailabilityCounters:
+    """
+    Класс AvailabilityCounters хранит число книг в каждом статусе, всего и по каждому автору.
+    Счетчики меняются вместе с каталогом (add при добавлении книги, remove при удалении), поэтому ответ на вопросы
+    "сколько книг выдано" и "сколько книг автора в наличии" не требует перебора каталога.
+    """
+    def __init__(self):
+        self._by_status: Dict[str, int] = {}
+        self._by_author: Dict[str, Dict[str, int]] = {}
+
+    def add(self, author: str, status: str, delta: int = 1) -> None:
+        self._by_status[status] = self._by_status.get(status, 0) + delta
+        statuses = self._by_author.setdefault(author, {})
+        statuses[status] = statuses.get(status, 0) + delta
+        if not statuses[status]:
+            del statuses[status]
+            if not statuses:
+                del self._by_author[author]
+
+    def remove(self, author: str, status: str) -> None:
+        self.add(author, status, -1)
+
+    def count(self, status: str) -> int:
+        return self._by_status.get(status, 0)
+
+    def count_by_author(self, author: str, status: Optional[str] = None) -> int:
+        statuses = self._by_author.get(author, {})
+        return sum(statuses.values()) if status is None else statuses.get(status, 0)
+
+
+class Loan(NamedTuple):
+    id: int
+    borrower: str
+    due: date
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'id': self.id, 'borrower': self.borrower, 'due': self.due.isoformat()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Loan':
+        return cls(int(data['id']), data['borrower'], date.fromisoformat(data['due']))
+
+
+class LoanTable:
+    """
+    Класс LoanTable - таблица выдач книг.
+    Описание методов класса:
+    'add' - запись выдачи (прежняя выдача той же книги заменяется)
+    'remove' - удаление выдачи по id книги
+    'get' - выдача по id книги
+    'borrowed_by' - книги на руках у читателя, по сроку возврата
+    'overdue' - просроченные выдачи, от самой давней
+
+    Выдачи хранятся в словаре по id книги, индекс по читателю - словарь "читатель -> множество id", индекс по сроку -
+    отсортированный список (срок, id). Поиск просроченных выдач - срез этого списка до сегодняшней даты,
+    поэтому его стоимость зависит только от числа найденных выдач.
+    """
+    def __init__(self, loans: Iterable[Loan] = ()):
+        self._by_id: Dict[int, Loan] = {loan.id: loan for loan in loans}
+        self._by_borrower: Dict[str, Set[int]] = {}
+        for loan in self._by_id.values():
+            self._by_borrower.setdefault(loan.borrower, set()).add(loan.id)
+        self._by_due: List[Tuple[date, int]] = sorted((loan.due, loan.id) for loan in self._by_id.values())
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Loan]:
+        return iter(self._by_id.values())
+
+    def __contains__(self, id: int) -> bool:
+        return id in self._by_id
+
+    def get(self, id: int) -> Optional[Loan]:
+        return self._by_id.get(id)
+
+    def add(self, loan: Loan) -> None:
+        self.remove(loan.id)
+        self._by_id[loan.id] = loan
+        self._by_borrower.setdefault(loan.borrower, set()).add(loan.id)
+        insort(self._by_due, (loan.due, loan.id))
+
+    def remove(self, id: int) -> Optional[Loan]: # удаляет выдачу и возвращает ее, если она была
+        loan = self._by_id.pop(id, None)
+        if loan is not None:
+            ids = self._by_borrower[loan.borrower]
+            ids.discard(id)
+            if not ids:
+                del self._by_borrower[loan.borrower]
+            del self._by_due[bisect_left(self._by_due, (loan.due, id))]
+        return loan
+
+    def borrowed_by(self, borrower: str) -> List[Loan]:
+        return sorted((self._by_id[id] for id in self._by_borrower.get(borrower, ())), key=lambda loan: loan.due)
+
+    def overdue(self, today: date) -> List[Loan]: # выдачи со сроком возврата раньше today
+        end = bisect_left(self._by_due, (today, 0))
+        return [self._by_id[id] for _, id in self._by_due[:end]]
+
+
+class Circulation:
+    """
+    Класс Circulation выдает и возвращает книги библиотеки.
+    Описание методов класса:
+    'checkout' - выдача нескольких книг одному читателю
+    'checkin' - возврат нескольких книг
+    'overdue' - просроченные выдачи
+    'borrowed_by' - книги на руках у читателя
+
+    Выдача и возврат выполняются пачкой в одной транзакции библиотеки: сначала проверяются все книги, затем статусы
+    меняются одним сохранением каталога (Library.change_statuses), после чего одной записью сохраняется файл выдач.
+    Файл выдач пишется после каталога, поэтому при загрузке выдачи книг, которые по каталогу не выданы, отбрасываются.
+    Работает с библиотеками на файловых хранилищах (JsonStorage, JournalStorage).
+    """
+    loan_days: int = 14
+
+    def __init__(self, library: Any, filename: Optional[str] = None):
+        self.library = library
+        self.filename: str = filename or f"{library.filename}.loans"
+        self.loans: LoanTable = LoanTable()
+        self._signature: Signature = None
+
+    def load(self, force: bool = False) -> None: # читает файл выдач, если он изменился
+        self.library.load_from_file_list_book()
+        signature = file_signature(self.filename)
+        if not force and signature is not None and signature == self._signature:
+            return
+        if not os.path.exists(self.filename):
+            loans = []
+        else:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                loans = [Loan.from_dict(record) for record in json.load(f)]
+        self.loans = LoanTable(loan for loan in loans
+                               if (book := self.library.books.get(loan.id)) is not None and book.status == BookStatus.ISSUED)
+        self._signature = signature
+
+    def save(self) -> None:
+        write_json_atomic(self.filename, (loan.to_dict() for loan in self.loans))
+        self._signature = file_signature(self.filename)
+
+    def checkout(self, ids: Iterable[int], borrower: str, due: Optional[date] = None) -> List[Loan]: # выдает книги читателю одной операцией
+        if not borrower.strip():
+            raise ValueError("Имя читателя должно быть не пустой строкой.")
+        due = due or date.today() + timedelta(days=self.loan_days)
+        with self.library.write_transaction():
+            self.load()
+            books = self._get_books(ids)
+            for book in books:
+                if book.status != BookStatus.AVAILABLE:
+                    raise ValueError(f"Книга \"{book.title}\" (ID {book.id}) уже выдана.")
+            self.library.change_statuses({book.id: BookStatus.ISSUED for book in books})
+            loans = [Loan(book.id, borrower, due) for book in books]
+            for loan in loans:
+                self.loans.add(loan)
+            self.save()
+        return loans
+
+    def checkin(self, ids: Iterable[int]) -> List[Loan]: # принимает книги одной операцией, возвращает закрытые выдачи
+        with self.library.write_transaction():
+            self.load()
+            books = self._get_books(ids)
+            for book in books:
+                if book.status != BookStatus.ISSUED:
+                    raise ValueError(f"Книга \"{book.title}\" (ID {book.id}) не выдана.")
+            self.library.change_statuses({book.id: BookStatus.AVAILABLE for book in books})
+            loans = [loan for loan in map(self.loans.remove, (book.id for book in books)) if loan is not None]
+            self.save()
+        return loans
+
+    def overdue(self, today: Optional[date] = None) -> List[Loan]:
+        self.load()
+        return self.loans.overdue(today or date.today())
+
+    def borrowed_by(self, borrower: str) -> List[Loan]:
+        self.load()
+        return self.loans.borrowed_by(borrower)
+
+    def _get_books(self, ids: Iterable[int]) -> List[Any]: # книги по id, все id должны быть в каталоге и не повторяться
+        books = []
+        seen: Set[int] = set()
+        for id in ids:
+            book = self.library.books.get(int(id))
+            if book is None:
+                raise ValueError(f"Книга с ID {id} не найдена.")
+            if book.id in seen:
+                raise ValueError(f"Книга с ID {id} указана несколько раз.")
+            seen.add(book.id)
+            books.append(book)
+        return books
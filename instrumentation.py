@@ -0,0 +1,258 @@
+"""
+Сбор статистики производительности библиотеки (включается по требованию).
+Пока сбор выключен, классы библиотеки не изменены и ничего не замеряется, поэтому накладных расходов нет.
+Instrumentation.enable подменяет методы классов обертками, которые считают вызовы и время, а disable возвращает
+исходные методы. Замеряются:
+- время и число вызовов методов Library, хранилищ (load, save, compact) и выдачи id (IdAllocator._reserve);
+- байты, прочитанные и записанные хранилищем;
+- число книг, созданных из записей хранилища (Book.from_dict);
+- попадания и промахи резидентного кэша каталога (load_from_file_list_book без перечитывания файла и с ним).
+Команды меню дополнительно можно профилировать через cProfile и tracemalloc (Instrumentation.command).
+"""
+import cProfile
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from binary_storage import BinaryStorage
+from storage import IdAllocator, JournalStorage, JsonStorage, file_signature
+
+LIBRARY_METHODS: Tuple[str, ...] = ('add_book', 'add_books', 'remove_book', 'search_book', 'find_books', 'list_books',
+                                    'count_books', 'available_books', 'change_statuses', 'change_book_status',
+                                    'save_list_book', 'write_changes', 'load_from_file_list_book', 'print_list_books')
+STORAGE_METHODS: Dict[type, Tuple[str, ...]] = {
+    JsonStorage: ('load', 'save'),
+    JournalStorage: ('load', 'save', 'compact'),
+    BinaryStorage: ('load', 'save'),
+    IdAllocator: ('_reserve',),
+}
+
+
+def storage_files(storage: Any) -> List[str]: # файлы, которые читает и пишет хранилище
+    return [storage.filename] + ([storage.journal_filename] if hasattr(storage, 'journal_filename') else [])
+
+
+def written_bytes(before: List[Any], after: List[Any]) -> int: # объем записи по сигнатурам файлов до и после сохранения
+    total = 0
+    for old, new in zip(before, after):
+        if new is None or new == old:
+            continue
+        if old is None or old[0] != new[0]: # файл создан или подменен новым - записан целиком
+            total += new[1]
+        else:
+            total += max(new[1] - old[1], 0)
+    return total
+
+
+class Instrumentation:
+    """
+    Класс Instrumentation собирает статистику вызовов классов библиотеки.
+    Описание методов класса:
+    'enable' - включение сбора: методы классов подменяются обертками
+    'disable' - выключение сбора: исходные методы возвращаются на место
+    'command' - замер одной команды меню (с профилем cProfile при profile = True и пиковой памятью при trace_memory = True)
+    'stats' - собранные счетчики в виде словаря
+    'report' - те же счетчики в виде текста
+    'reset' - обнуление счетчиков
+
+    Время вызова включает вложенные вызовы (например, время add_book включает save_list_book и JsonStorage.save).
+    Обертки подменяют методы на уровне классов, поэтому сбор затрагивает все экземпляры и все потоки процесса,
+    в том числе фоновую запись SaveScheduler; одновременно включенным может быть только один объект Instrumentation.
+    """
+    active: Optional['Instrumentation'] = None
+    profile_lines: int = 15
+
+    def __init__(self, library_class: type, book_class: type, profile: bool = False, trace_memory: bool = False,
+                 output: Optional[TextIO] = None):
+        self.library_class = library_class
+        self.book_class = book_class
+        self.profile: bool = profile
+        self.trace_memory: bool = trace_memory
+        self.output: Optional[TextIO] = output
+        self._lock = threading.Lock()
+        self._io_calls = threading.local() # вложенные вызовы хранилища в текущем потоке (save вызывает compact)
+        self._originals: List[Tuple[type, str, Any]] = []
+        self.reset()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._originals)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls: Dict[str, List[float]] = {} # имя -> [число вызовов, суммарное время, максимальное время]
+            self.commands: Dict[str, Dict[str, float]] = {}
+            self.bytes_read: int = 0
+            self.bytes_written: int = 0
+            self.books_materialized: int = 0
+            self.cache_hits: int = 0
+            self.cache_misses: int = 0
+
+    def enable(self) -> None:
+        if self.enabled:
+            return
+        if Instrumentation.active is not None:
+            raise RuntimeError("Сбор статистики уже включен другим объектом Instrumentation.")
+        Instrumentation.active = self
+        try:
+            for name in LIBRARY_METHODS:
+                wrapper = self._cache_wrapper if name == 'load_from_file_list_book' else self._timed
+                self._patch(self.library_class, name, wrapper)
+            for cls, names in STORAGE_METHODS.items():
+                for name in names:
+                    self._patch(cls, name, self._io_wrapper if cls is not IdAllocator else self._timed)
+            original = self.book_class.__dict__['from_dict']
+            self._originals.append((self.book_class, 'from_dict', original))
+            setattr(self.book_class, 'from_dict', classmethod(self._materialize_wrapper(original.__func__)))
+        except Exception: # уже подмененные методы возвращаются на место
+            self.disable()
+            raise
+
+    def disable(self) -> None:
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals = []
+        if Instrumentation.active is self:
+            Instrumentation.active = None
+
+    @contextmanager
+    def command(self, name: str) -> Iterator[None]: # замер команды меню, при выключенном сборе ничего не делает
+        if not self.enabled:
+            yield
+            return
+        profiler = cProfile.Profile() if self.profile else None
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            elapsed = (time.perf_counter() - start) * 1000
+            peak = tracemalloc.get_traced_memory()[1] if started_tracing else 0
+            if started_tracing:
+                tracemalloc.stop()
+            with self._lock:
+                entry = self.commands.setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'peak_bytes': 0})
+                entry['count'] += 1
+                entry['total_ms'] += elapsed
+                entry['max_ms'] = max(entry['max_ms'], elapsed)
+                entry['peak_bytes'] = max(entry['peak_bytes'], peak)
+            if profiler is not None:
+                output = self.output or sys.stderr
+                output.write(f"Профиль команды \"{name}\":\n")
+                pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(self.profile_lines)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'calls': {name: {'count': int(count), 'total_ms': total, 'avg_ms': total / count, 'max_ms': maximum}
+                          for name, (count, total, maximum) in self.calls.items()},
+                'commands': {name: dict(entry) for name, entry in self.commands.items()},
+                'bytes_read': self.bytes_read,
+                'bytes_written': self.bytes_written,
+                'books_materialized': self.books_materialized,
+                'cache_hits': self.cache_hits,
+                'cache_misses': self.cache_misses,
+            }
+
+    def report(self) -> str: # текстовый отчет: вызовы по убыванию суммарного времени и счетчики
+        stats = self.stats()
+        lines = [f"{'вызов':<40} {'число':>8} {'всего, мс':>12} {'среднее, мс':>12} {'макс., мс':>12}"]
+        for name, call in sorted(stats['calls'].items(), key=lambda item: -item[1]['total_ms']):
+            lines.append(f"{name:<40} {call['count']:>8} {call['total_ms']:>12.3f} {call['avg_ms']:>12.3f} "
+                         f"{call['max_ms']:>12.3f}")
+        for name, entry in stats['commands'].items():
+            lines.append(f"команда \"{name}\": {entry['count']} раз, всего {entry['total_ms']:.3f} мс"
+                         + (f", пик памяти {entry['peak_bytes']} байт" if entry['peak_bytes'] else ''))
+        lines.append(f"прочитано байт: {stats['bytes_read']}, записано байт: {stats['bytes_written']}")
+        lines.append(f"создано книг из хранилища: {stats['books_materialized']}")
+        lines.append(f"кэш каталога: попаданий {stats['cache_hits']}, промахов {stats['cache_misses']}")
+        return '\n'.join(lines) + '\n'
+
+    def _patch(self, cls: type, name: str, wrapper: Callable[[str, Callable], Callable]) -> None:
+        original = cls.__dict__[name]
+        self._originals.append((cls, name, original))
+        setattr(cls, name, wrapper(f"{cls.__name__}.{name}", original))
+
+    def _record(self, name: str, elapsed: float) -> None:
+        with self._lock:
+            call = self.calls.get(name)
+            if call is None:
+                self.calls[name] = [1, elapsed, elapsed]
+            else:
+                call[0] += 1
+                call[1] += elapsed
+                call[2] = max(call[2], elapsed)
+
+    def _timed(self, name: str, method: Callable) -> Callable:
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._record(name, (time.perf_counter() - start) * 1000)
+        return wrapper
+
+    def _io_wrapper(self, name: str, method: Callable) -> Callable: # методы хранилища: время и объем чтения или записи
+        reading = name.endswith('.load')
+
+        @wraps(method)
+        def wrapper(storage, *args, **kwargs):
+            outer = not getattr(self._io_calls, 'active', False) # байты считает только внешний вызов, иначе запись учтется дважды
+            files = storage_files(storage)
+            before = [file_signature(filename) for filename in files] if outer else []
+            self._io_calls.active = True
+            start = time.perf_counter()
+            try:
+                return method(storage, *args, **kwargs)
+            finally:
+                elapsed = (time.perf_counter() - start) * 1000
+                self._record(name, elapsed)
+                if outer:
+                    self._io_calls.active = False
+                    self._record_io(reading, before, [file_signature(filename) for filename in files])
+        return wrapper
+
+    def _record_io(self, reading: bool, before: List[Any], after: List[Any]) -> None:
+        with self._lock:
+            if reading:
+                self.bytes_read += sum(signature[1] for signature in before if signature is not None)
+            else:
+                self.bytes_written += written_bytes(before, after)
+
+    def _cache_wrapper(self, name: str, method: Callable) -> Callable: # загрузка каталога: попадание, если каталог не перечитан
+        timed = self._timed(name, method)
+
+        @wraps(method)
+        def wrapper(library, *args, **kwargs):
+            books, signature = library.books, library._file_signature
+            try:
+                return timed(library, *args, **kwargs)
+            finally:
+                with self._lock:
+                    if library.books is books and library._file_signature == signature:
+                        self.cache_hits += 1
+                    else:
+                        self.cache_misses += 1
+        return wrapper
+
+    def _materialize_wrapper(self, function: Callable) -> Callable: # Book.from_dict: число созданных книг
+        @wraps(function)
+        def wrapper(cls, *args, **kwargs):
+            book = function(cls, *args, **kwargs)
+            with self._lock:
+                self.books_materialized += 1
+            return book
+        return wrapper
@@ -1,23 +1,44 @@
 import json
-import os
-import uuid
+import signal
+import sys
+from contextlib import contextmanager, nullcontext, redirect_stdout
 from datetime import datetime
-from typing import NoReturn, Optional, List, Dict, Union
+from bisect import bisect_left, insort
+from itertools import islice
+from array import array
+from typing import NoReturn, Optional, List, Dict, Union, Any, Iterable, Iterator, Set, Callable, Tuple, TYPE_CHECKING
+
+from circulation import AvailabilityCounters, BookStatus, STATUS_BY_VALUE, parse_status
+from search import SearchIndex, paginate, record_matcher
+from storage import JsonStorage, JournalStorage, Change, IdAllocator, apply_change
+
+if TYPE_CHECKING: # модули фоновой записи и статистики импортируются только при использовании, чтобы команды запускались быстрее
+    import argparse
+    from instrumentation import Instrumentation
+    from persistence import SaveScheduler
 
 
 class Book:
     """
     Класс Book содержит в себе поля, описывающие одну книгу, позволяет создать объект книги.
-    Инициализируемые поля проходят валидацию, id для новой книги читается из файла, увеличивается на 1, обновленное значение записывается в файл.
+    Инициализируемые поля проходят валидацию, id для новой книги выдает id_allocator (счетчик в файле counter.txt,
+    id резервируются в нем блоками под блокировкой файла, см. storage.IdAllocator).
     Методы to_dict и from_dict позволяют преобразовать объект класса Book в элемент словарь, и обратно из словаря в объект Book соответственно.
             Описание полей класса:
             'id' - уникальный номер книги,
             'title' - название книги,
             'author' - автор книги,
             'year' - год первой публикации книги,
-            'status' - статус книги в библиотеке (выдана или в наличии)
+            'status' - статус книги в библиотеке (выдана или в наличии), значение перечисления circulation.BookStatus
+
+    Объекты Book хранятся в __slots__ без словаря атрибутов, а повторяющиеся строки (автор, год, статус) интернируются,
+    поэтому большой каталог занимает меньше памяти. from_dict(data, trusted=True) создает книгу без повторной валидации
+    полей - для данных, которые уже были проверены при записи в хранилище.
     """
+    __slots__ = ('_title', '_author', '_year', '_status', 'id')
+    valid_statuses = tuple(STATUS_BY_VALUE)
     id_counter: int = 0
+    id_allocator: IdAllocator = IdAllocator('counter.txt')
 
     def __init__(self, title: str, author: str, year: str, id: Optional[int] = None, status: str = 'в наличии'):
 
@@ -48,7 +69,7 @@ class Book:
     def author(self, value: str) -> NoReturn:
         if len(value.strip()) == 0 or not isinstance(value, str):
             raise ValueError("Имя автора должно быть не пустой строкой.")
-        self._author = value
+        self._author = sys.intern(value)
 
     @property
     def year(self) -> str:
@@ -59,7 +80,7 @@ class Book:
         if len(value.strip()) != 4 or not value.isdigit() or int(value) > datetime.now().year:
             raise ValueError(
                 "Год публикации книги должен быть числом от 1000 до текущего года.")
-        self._year = value
+        self._year = sys.intern(value)
 
     @property
     def status(self) -> str:
@@ -67,24 +88,11 @@ class Book:
 
     @status.setter
     def status(self, value: str) -> NoReturn:
-        valid_statuses = ['в наличии', 'выдана']
-        if value.lower() not in [s for s in valid_statuses]:
-            raise ValueError(f"Статус должен быть одним из следующих: {', '.join(valid_statuses)}")
-        self._status = value
+        self._status = parse_status(value)
 
-    @classmethod #Получает id для книги и записывает в файл значение уваеличенное на 1
+    @classmethod #Получает следующий свободный id для книги
     def get_id_counter(cls) -> int:
-        counter_filename: str = 'counter.txt'
-        if os.path.exists(counter_filename):
-            with open(counter_filename, 'r') as f:
-                cls.id_counter = f.read()
-                cls.id_counter = int(cls.id_counter) 
-            with open(counter_filename, 'w') as f:
-                f.write(str(cls.id_counter + 1))
-            return cls.id_counter
-        else:
-            with open(counter_filename, 'w') as f:
-                f.write(str(cls.id_counter))
+        cls.id_counter = cls.id_allocator.next_id()
         return cls.id_counter
 
     def to_dict(self) -> Dict[str, Union[str, int]]: #Преобразует Book в словарь
@@ -97,113 +105,501 @@ class Book:
         }
 
     @classmethod
-    def from_dict(cls, data: Dict[str, Union[str, int]]) -> 'Book': #Преобразует словарь в Book
-        return cls(data['title'], data['author'], data['year'], data['id'], data['status'])
+    def from_dict(cls, data: Dict[str, Union[str, int]], trusted: bool = False) -> 'Book': #Преобразует словарь в Book
+        if not trusted:
+            return cls(data['title'], data['author'], data['year'], data['id'], data['status'])
+        book = cls.__new__(cls)
+        book._title = data['title']
+        book._author = sys.intern(data['author'])
+        book._year = sys.intern(data['year'])
+        try: # статус из хранилища записан значением перечисления, поэтому сначала - прямой поиск в словаре
+            book._status = STATUS_BY_VALUE[data['status']]
+        except KeyError:
+            book._status = parse_status(data['status'])
+        book.id = data['id']
+        return book
 
     def __str__(self) -> str:
         return f"id: {self.id}\nНазвание: {self.title}\nАвтор: {self.author}\nГод издания: {self.year}\nСтатус: {self.status}\n"
 
 
+class Catalogue:
+    """
+    Класс Catalogue хранит книги библиотеки в словаре по id и поддерживает вторичные индексы
+    (значение поля title, author или year -> множество id книг), которые обновляются при каждом изменении.
+    Поиск книги по id выполняется за O(1), поиск по точному значению поля - за O(k), где k - число найденных книг.
+    Описание методов класса:
+    'append' - добавление книги (книга с тем же id уже в каталоге - ValueError)
+    'replace' - замена книги с тем же id (или добавление, если ее нет)
+    'get' - получение книги по id
+    'remove' - удаление книги по id
+    'find' - поиск книг по точному значению поля
+    'update' - изменение полей книги с обновлением индексов
+    'search' - полнотекстовый поиск по названию, автору и году (см. модуль search)
+    'page' - страница книг, упорядоченных по полю (с отбором по статусу)
+    'count' - число книг (с отбором по статусу и автору)
+
+    Индексы по полям и полнотекстовый индекс строятся при первом обращении к ним и дальше обновляются при каждом изменении,
+    поэтому загрузка каталога сводится к заполнению словаря по id.
+    Для постраничного вывода хранятся отсортированные списки ключей (значение поля без учета регистра, id) для каждой
+    запрошенной пары "поле сортировки, статус": страница получается срезом списка, а сортировка не повторяется при каждом вызове.
+    Число книг по статусам и авторам хранится в счетчиках (circulation.AvailabilityCounters), которые строятся при первом
+    подсчете и дальше меняются вместе с каталогом.
+    """
+    indexed_fields = ('title', 'author', 'year')
+    sortable_fields = ('id', 'title', 'author', 'year')
+
+    def __init__(self, books: Iterable[Book] = ()):
+        self._by_id: Dict[int, Book] = {book.id: book for book in books}
+        self._indexes: Dict[str, Dict[str, Set[int]]] = {}
+        self._search_index: Optional[SearchIndex] = None
+        self._sorted: Dict[Tuple[str, Optional[str]], List[Tuple[Any, int]]] = {}
+        self._counters: Optional[AvailabilityCounters] = None
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Book]:
+        return iter(self._by_id.values())
+
+    def __getitem__(self, position: int) -> Book: # книга по порядковому номеру (в порядке добавления)
+        if position < 0:
+            position += len(self._by_id)
+        book = next(islice(self._by_id.values(), position, None), None) if position >= 0 else None
+        if book is None:
+            raise IndexError("Индекс книги вне диапазона.")
+        return book
+
+    def __contains__(self, id: int) -> bool:
+        return id in self._by_id
+
+    def append(self, book: Book) -> None:
+        if book.id in self._by_id:
+            raise ValueError(f"Книга с ID {book.id} уже есть в каталоге.")
+        self._by_id[book.id] = book
+        for field, index in self._indexes.items():
+            index.setdefault(getattr(book, field), set()).add(book.id)
+        if self._search_index is not None:
+            self._search_index.add(book.id, title=book.title, author=book.author, year=book.year)
+        self._sort_insert(book)
+        self._count(book, 1)
+
+    def replace(self, book: Book) -> Optional[Book]: # заменяет книгу с тем же id и возвращает прежнюю, если она была
+        previous = self.remove(book.id)
+        self.append(book)
+        return previous
+
+    def get(self, id: int) -> Optional[Book]:
+        return self._by_id.get(id)
+
+    def remove(self, id: int) -> Optional[Book]: # удаляет книгу и возвращает ее, если она была в каталоге
+        book = self._by_id.pop(id, None)
+        if book is not None:
+            for field in self._indexes:
+                self._unindex(field, getattr(book, field), id)
+            if self._search_index is not None:
+                self._search_index.remove(id)
+            self._sort_remove(book)
+            self._count(book, -1)
+        return book
+
+    def find(self, field: str, value: str) -> List[Book]:
+        return [self._by_id[id] for id in self._index(field).get(value, ())]
+
+    def update(self, id: int, **fields: str) -> Book: # изменяет поля книги (с валидацией) и перестраивает ее записи в индексах
+        book = self._by_id[id]
+        self._sort_remove(book)
+        self._count(book, -1)
+        try:
+            for field, value in fields.items():
+                old_value = getattr(book, field)
+                setattr(book, field, value)
+                if field in self._indexes:
+                    self._unindex(field, old_value, id)
+                    self._indexes[field].setdefault(value, set()).add(id)
+        finally:
+            self._sort_insert(book)
+            self._count(book, 1)
+        if self._search_index is not None and set(self.indexed_fields) & fields.keys():
+            self._search_index.add(id, title=book.title, author=book.author, year=book.year)
+        return book
+
+    def search(self, query: str) -> Iterator[Book]: # книги, подходящие под запрос, от наиболее релевантных (лениво)
+        if self._search_index is None:
+            self._search_index = SearchIndex()
+            for book in self._by_id.values():
+                self._search_index.add(book.id, title=book.title, author=book.author, year=book.year)
+        return (self._by_id[id] for id in self._search_index.search(query))
+
+    def page(self, offset: int, limit: int, sort_by: str = 'id', status: Optional[str] = None) -> Iterator[Book]: # книги с offset по offset + limit в порядке поля sort_by (лениво)
+        self.validate_page(offset, limit, sort_by, status)
+        return (self._by_id[id] for _, id in self._sorted_index(sort_by, status)[offset:offset + limit])
+
+    def count(self, status: Optional[str] = None, author: Optional[str] = None) -> int: # число книг за O(1) по счетчикам
+        self.validate_page(0, 0, 'id', status)
+        if author is not None:
+            return self._availability().count_by_author(author, status)
+        return len(self._by_id) if status is None else self._availability().count(status)
+
+    @classmethod
+    def validate_page(cls, offset: int, limit: int, sort_by: str, status: Optional[str]) -> None: # проверка параметров страницы
+        if offset < 0 or limit < 0:
+            raise ValueError("Смещение и размер страницы должны быть неотрицательными.")
+        if sort_by not in cls.sortable_fields:
+            raise ValueError(f"Сортировка возможна по полям: {', '.join(cls.sortable_fields)}")
+        if status is not None and status not in Book.valid_statuses:
+            raise ValueError(f"Статус должен быть одним из следующих: {', '.join(Book.valid_statuses)}")
+
+    def _availability(self) -> AvailabilityCounters: # счетчики по статусам и авторам, при первом обращении считаются по всем книгам
+        if self._counters is None:
+            self._counters = AvailabilityCounters()
+            for book in self._by_id.values():
+                self._counters.add(book.author, book.status)
+        return self._counters
+
+    def _count(self, book: Book, delta: int) -> None:
+        if self._counters is not None:
+            self._counters.add(book.author, book.status, delta)
+
+    @staticmethod
+    def _sort_key(book: Book, field: str) -> Tuple[Any, int]:
+        return (book.id if field == 'id' else getattr(book, field).casefold()), book.id
+
+    def _sorted_index(self, field: str, status: Optional[str]) -> List[Tuple[Any, int]]: # отсортированные ключи книг, при первом обращении строятся по всем книгам
+        index = self._sorted.get((field, status))
+        if index is None:
+            index = self._sorted[field, status] = sorted(
+                self._sort_key(book, field) for book in self._by_id.values() if status is None or book.status == status)
+        return index
+
+    def _sort_insert(self, book: Book) -> None:
+        for (field, status), index in self._sorted.items():
+            if status is None or book.status == status:
+                insort(index, self._sort_key(book, field))
+
+    def _sort_remove(self, book: Book) -> None:
+        for (field, status), index in self._sorted.items():
+            if status is None or book.status == status:
+                key = self._sort_key(book, field)
+                position = bisect_left(index, key)
+                if position < len(index) and index[position] == key:
+                    del index[position]
+
+    def _index(self, field: str) -> Dict[str, Set[int]]: # индекс по полю, при первом обращении строится по всем книгам
+        index = self._indexes.get(field)
+        if index is None:
+            if field not in self.indexed_fields:
+                raise KeyError(f"Поле {field} не индексируется.")
+            index = self._indexes[field] = {}
+            for book in self._by_id.values():
+                index.setdefault(getattr(book, field), set()).add(book.id)
+        return index
+
+    def _unindex(self, field: str, value: str, id: int) -> None:
+        ids = self._indexes[field].get(value)
+        if ids is not None:
+            ids.discard(id)
+            if not ids:
+                del self._indexes[field][value]
+
+
 class Library:
     """
     Класс Library отвечает за управление книгами в библиотеке.
     Описание методов класса:
     'add_book' - создание нового объекта Book и запись в библиотеку
+    'add_books' - массовое добавление книг из потока словарей с одной записью в хранилище в конце
     'remove_book' - удаление книги из библиотеки по id
-    'search_book' - поиск книги в библиотеке (производится по полным значениям полей title, author, year. 
-                    Будут найдены все книги, у которых есть совпадение по любому из этих полей)
+    'search_book' - поиск книги в библиотеке (производится по словам и началам слов в полях title, author, year.
+                    Будут найдены книги, содержащие все слова запроса, более релевантные выводятся первыми)
+    'find_books' - тот же поиск, но результаты возвращаются ленивым итератором по страницам
+    'list_books' - страница книг, упорядоченных по id, title, author или year, с отбором по статусу
+    'count_books' - число книг в библиотеке (с отбором по статусу и автору)
+    'available_books' - книги автора, которые есть в наличии
+    'change_statuses' - изменение статусов нескольких книг одним сохранением (используется circulation.Circulation)
+    'write_transaction' - блокировка записи на время загрузки, изменения и сохранения каталога
+    'batch' - выполнение нескольких операций с одной записью в хранилище в конце (при ошибке изменения отменяются)
+    'iter_books' - чтение книг из хранилища по одной, без загрузки каталога в память
     'change_book_status' - изменение статуса книги в библиотеке, вводимый статус проходит валидацию
                              и должен иметь одно из двух значений: "выдана" или "в наличии".
-    'save_list_book' - сохранение списка книнг в json-файл
+    'save_list_book' - сохранение списка книнг в json-файл (сразу или через планировщик scheduler)
+    'write_changes' - запись изменений в хранилище под блокировкой записи
     'load_from_file_list_book' - чтение списка книг из json-файла           
     'print_list_books' - вывод списка книг в консоль  
+
+    print_list_books и search_book с параметром streaming=True читают файл потоком через iter_books: память не зависит
+    от размера каталога, первые книги выводятся сразу, а результаты поиска идут в порядке хранения, без ранжирования.
+
+    Книги хранятся в Catalogue, поэтому поиск по id и по точному значению поля не требует перебора всего списка.
+    Библиотека работает в резидентном режиме: список книг загружается из файла один раз и хранится в памяти.
+    Перед каждой операцией проверяется сигнатура файла (inode, размер, время изменения), и файл перечитывается
+    только если его изменил кто-то другой. После сохранения сигнатура обновляется, поэтому собственные записи
+    не приводят к повторному разбору файла. При resident = False файл перечитывается перед каждой операцией.
+
+    Книги, прочитанные из хранилища, уже проверены при записи, поэтому при trusted_load = True они создаются без повторной
+    валидации полей. При trusted_load = False каждая запись проходит проверки Book, как при ручном вводе.
+
+    Способ хранения задается объектом storage (см. модуль storage): по умолчанию JsonStorage перезаписывает
+    весь файл при сохранении, JournalStorage дописывает только изменения в журнал, а binary_storage.BinaryStorage хранит
+    каталог в компактном двоичном формате и меняет статусы книг на месте.
+
+    Изменяющие операции выполняются под блокировкой записи хранилища (см. storage.FileStorage): загрузка, изменение
+    и сохранение идут одной транзакцией, поэтому несколько процессов, работающих с одним файлом, не теряют изменения
+    друг друга. Если номер поколения хранилища изменился с момента загрузки, каталог перед изменением перечитывается.
+
+    Если к библиотеке подключен планировщик (persistence.SaveScheduler), save_list_book только передает ему изменения,
+    а запись выполняется в фоновом потоке. Если к моменту записи файл успел изменить другой процесс, write_changes
+    применяет накопленные изменения к актуальному содержимому хранилища, а каталог перечитывается при следующей операции.
+    Запись всего каталога без списка изменений (save_list_book()) слить с чужими изменениями нельзя, поэтому если
+    хранилище успели изменить, write_changes отказывается от нее с RuntimeError, не затирая чужие изменения.
     """
     filename: str = 'library.json'
-
-    def __init__(self):
-        self.books: List[Book] = []
+    resident: bool = True
+    trusted_load: bool = True
+    bulk_chunk_size: int = 1000
+
+    def __init__(self, filename: Optional[str] = None, storage: Optional[Union[JsonStorage, JournalStorage]] = None):
+        self.books: Catalogue = Catalogue()
+        self.storage: Union[JsonStorage, JournalStorage] = storage or JsonStorage(filename or self.filename)
+        self.filename: str = self.storage.filename
+        self._file_signature: Optional[Any] = None
+        self._generation: Optional[int] = None
+        self._transaction_depth: int = 0
+        self.scheduler: Optional['SaveScheduler'] = None
+        self._batch: Optional[List[Change]] = None
+        self._batch_full: bool = False
+
+    @contextmanager
+    def write_transaction(self) -> Iterator[None]: # блокировка записи на время загрузки, изменения и сохранения каталога
+        self._transaction_depth += 1
+        try:
+            with self.storage.write_lock():
+                self.load_from_file_list_book(force=self.storage.generation() != self._generation)
+                yield
+        finally:
+            self._transaction_depth -= 1
+        if self._transaction_depth == 0 and self.scheduler is not None:
+            self.scheduler.wait()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]: # изменения внутри блока сохраняются одной записью при выходе, при ошибке отменяются
+        with self.write_transaction():
+            self._batch, self._batch_full = [], False
+            try:
+                yield
+            except BaseException:
+                self._batch = None
+                self.load_from_file_list_book(force=True)
+                raise
+            changes, full, self._batch = self._batch, self._batch_full, None
+            if full:
+                self.save_list_book()
+            elif changes:
+                self.save_list_book(*changes)
 
     def add_book(self, title, author, year) -> NoReturn: #Добавляет книгу в список books и в файл
-        new_book = Book(title, author, year)
-        self.load_from_file_list_book()
-        self.books.append(new_book)
-        self.save_list_book()
+        with self.write_transaction(): # id выдается после загрузки каталога, когда счетчик уже не меньше id в хранилище
+            new_book = Book(title, author, year)
+            self.books.append(new_book)
+            self.save_list_book({'op': 'add', 'book': new_book.to_dict()})
         print(f"Книга \"{title}\" успешно сохранена", end='\n\n')
 
+    def add_books(self, rows: Iterable[Dict[str, Any]],
+                  on_reject: Optional[Callable[[Dict[str, Any], Exception], None]] = None) -> int: # добавляет книги из потока, возвращает их число
+        # изменения по книгам нужны только планировщику и блоку batch; без них каталог сохраняется целиком
+        # под той же блокировкой записи, поэтому чужие изменения не затираются, а память не удваивается
+        changes: Optional[List[Change]] = [] if self.scheduler is not None or self._batch is not None else None
+        added_ids = array('q') # для отмены хранятся только id добавленных книг, по 8 байт
+        with self.write_transaction():
+            try:
+                for chunk in paginate(rows, self.bulk_chunk_size):
+                    for book in self._books_from_rows(chunk, on_reject):
+                        self.books.append(book)
+                        added_ids.append(book.id)
+                        if changes is not None:
+                            changes.append({'op': 'add', 'book': book.to_dict()})
+            except Exception:
+                for id in added_ids:
+                    self.books.remove(id)
+                raise
+            if changes is None:
+                self.save_list_book()
+            else:
+                self.save_list_book(*changes)
+        print(f"Добавлено книг: {len(added_ids)}", end='\n\n')
+        return len(added_ids)
+
+    @classmethod
+    def _books_from_rows(cls, rows: List[Dict[str, Any]],
+                         on_reject: Optional[Callable[[Dict[str, Any], Exception], None]]) -> Iterator[Book]: # книги из записей импорта, id выдаются на все записи сразу
+        # id отклоненных записей не возвращаются счетчику и остаются пропусками в нумерации, как остаток блока IdAllocator
+        for row, id in zip(rows, Book.id_allocator.allocate(len(rows))):
+            try:
+                book = Book(cls._row_field(row, 'title'), cls._row_field(row, 'author'),
+                            cls._row_field(row, 'year'), id, cls._row_field(row, 'status') or 'в наличии')
+            except (ValueError, AttributeError) as e:
+                if on_reject is None:
+                    raise ValueError(f"Некорректная запись {row}: {e}")
+                on_reject(row, e)
+                continue
+            yield book
+
+    @staticmethod
+    def _row_field(row: Dict[str, Any], name: str) -> str: # значение поля импортируемой записи в виде строки
+        value = row.get(name)
+        return '' if value is None else str(value)
+
     def remove_book(self, id: str) -> NoReturn: #удаляет книгу из books и из файла
         if not id.isdigit():
             raise ValueError("ID книги должен быть числом.")
         id: int = int(id)
+        with self.write_transaction():
+            book = self.books.remove(id)
+            if book is None:
+                raise ValueError(f"Книга с ID {id} не найдена.\n\n")
+            self.save_list_book({'op': 'remove', 'id': id})
+        print(f"Книга \"{book.title}\" была успешно удалена.", end='\n\n')
+
+    def search_book(self, search_field: str, streaming: bool = False) -> NoReturn: #выводит список книг соответствующих поисковой строке
+        found: bool = False
+        if streaming:
+            matches = record_matcher(search_field)
+            books = (book for book in self.iter_books() if matches(book.to_dict()))
+        else:
+            books = (book for page in self.find_books(search_field) for book in page)
+        for book in books:
+            found = True
+            print(book)
+        if not found:
+            print("Ни одна книга не соответствует поисковому запросу.", end="\n\n")
+
+    def find_books(self, search_field: str, page_size: int = 20) -> Iterator[List[Book]]: # страницы книг, соответствующих поисковой строке
         self.load_from_file_list_book()
-        book_found: bool = False
+        return paginate(self.books.search(search_field), page_size)
 
-        for book in self.books:
-            if book.id == id:
-                book_found = True
-                self.books = [book for book in self.books if book.id != id]
-                self.save_list_book()
-        if book_found:
-            print(f"Книга \"{book.title}\" была успешно удалена.", end='\n\n')
-        else:
-            raise ValueError(f"Книга с ID {id} не найдена.\n\n")
+    def list_books(self, offset: int = 0, limit: int = 20, sort_by: str = 'id',
+                   status: Optional[str] = None) -> Iterator[Book]: # страница каталога, упорядоченного по полю sort_by
+        self.load_from_file_list_book()
+        return self.books.page(offset, limit, sort_by, status)
 
-    def search_book(self, search_field: str) -> NoReturn: #выводит список книг соответствующих поисковой строке
+    def count_books(self, status: Optional[str] = None, author: Optional[str] = None) -> int:
         self.load_from_file_list_book()
-        search_books = []
-        for book in self.books:
-            if book.title == search_field or book.author == search_field or book.year == search_field:
-                search_books.append(book)
-                print(book)
-        if not search_books:
-            print("Ни одна книга не соответствует поисковому запросу.", end="\n\n")
+        return self.books.count(status, author)
+
+    def available_books(self, author: str) -> List[Book]: # книги автора в наличии, перебираются только книги этого автора
+        self.load_from_file_list_book()
+        return [book for book in self.books.find('author', author) if book.status == BookStatus.AVAILABLE]
+
+    def change_statuses(self, statuses: Dict[int, str]) -> List[Book]: # изменяет статусы книг {id: статус} одним сохранением
+        with self.write_transaction():
+            books = []
+            for id, status in statuses.items():
+                book = self.books.get(id)
+                if book is None:
+                    raise ValueError(f"Книга с ID {id} не найдена.")
+                books.append((book, parse_status(status)))
+            for book, status in books:
+                self.books.update(book.id, status=status)
+            self.save_list_book(*({'op': 'status', 'id': book.id, 'status': status.value} for book, status in books))
+        return [book for book, _ in books]
 
     def change_book_status(self, id: str, new_status: str) -> None: # изменяет статус книги в библиотеке и обновляет файл со списком книг
         if not id.isdigit():
             raise ValueError("ID книги должен быть целым числом.")
         id = int(id)
-        book_found = False
-        self.load_from_file_list_book()
-        for book in self.books:
-            if book.id == id:
-                book.status = new_status
-                book_found = True
-                print(f"Статус книги \"{book.title}\" изменен на \"{book.status}\"")
-                self.save_list_book()
-                return
-        if not book_found:
-            raise ValueError(f"Книга с ID {id} не найдена.\n\n")
-
-    def save_list_book(self) -> NoReturn: # сохраняет список books в файл со списком книг
+        with self.write_transaction():
+            book = self.books.get(id)
+            if book is None:
+                raise ValueError(f"Книга с ID {id} не найдена.\n\n")
+            self.books.update(id, status=new_status)
+            self.save_list_book({'op': 'status', 'id': id, 'status': book.status})
+        print(f"Статус книги \"{book.title}\" изменен на \"{book.status}\"")
+
+    def save_list_book(self, *changes: Change) -> NoReturn: # сохраняет список books (или только изменения changes) в хранилище
+        if self._batch is not None:
+            self._batch.extend(changes)
+            self._batch_full = self._batch_full or not changes
+            return
+        if self.scheduler is not None:
+            self.scheduler.submit(changes)
+            if self._transaction_depth == 0:
+                self.scheduler.wait()
+            return
         try:
-            with open(self.filename, 'w') as f:
-                json.dump([book.to_dict() for book in self.books], f, indent=4)
+            self.write_changes(changes)
         except json.JSONDecodeError as e:
             print(f"Ошибка парсинга JSON: {e}")
         except Exception as e:
             raise RuntimeError(f"Возникло исключение: {e}\n\n")
 
-    def load_from_file_list_book(self) -> NoReturn: # читает список книг из файла в books
+    def write_changes(self, changes: Tuple[Change, ...] = (),
+                      records: Optional[Iterable[Dict[str, Any]]] = None) -> None: # пустой changes - запись всего каталога из памяти; records - каталог после changes, если они еще не применены к books
+        with self.storage.write_lock():
+            stale = self._generation is not None and self.storage.generation() != self._generation
+            if stale and not changes:
+                raise RuntimeError("Каталог изменен другим процессом после загрузки, запись всего каталога отменена.")
+            if records is None:
+                records = (book.to_dict() for book in self.books)
+            merged = bool(changes) and stale
+            if merged:
+                records = self._merge_changes(changes)
+            self.storage.save(records, changes)
+            self._generation = self.storage.bump_generation()
+        self._file_signature = None if merged else self.storage.signature()
+
+    def _merge_changes(self, changes: Tuple[Change, ...]) -> List[Dict[str, Any]]: # изменения поверх актуального содержимого хранилища
+        try:
+            records = {record['id']: record for record in self.storage.load()}
+        except (FileNotFoundError, json.JSONDecodeError):
+            records = {}
+        for change in changes:
+            apply_change(records, change)
+        return list(records.values())
+
+    def load_from_file_list_book(self, force: bool = False) -> NoReturn: # читает список книг из хранилища в books, если файл изменился
+        signature = self.storage.signature()
+        if self.resident and not force and signature is not None and signature == self._file_signature:
+            return
+        if self.scheduler is not None and self.scheduler.pending: # несохраненные изменения записываются до перечитывания
+            self.scheduler.flush()
+            signature = self.storage.signature()
+        generation = self.storage.generation()
         try:
-            with open(self.filename, 'r') as f:
-                books_data = json.load(f)
-                self.books = [Book.from_dict(book) for book in books_data]
+            self.books = Catalogue(Book.from_dict(book, self.trusted_load) for book in self.storage.load())
+            if self.books:
+                Book.id_allocator.ensure_above(max(book.id for book in self.books))
         except FileNotFoundError as e:
             print("Файла с библиотекой нет. Будет создан пустой файл.")
-            with open(self.filename, 'w') as f:
-                pass
+            self.storage.create()
+            signature = self.storage.signature()
         except json.JSONDecodeError as e:
             print(f"Ничего не прочитано из json файла с библотекой.")
         except Exception as e:
             raise RuntimeError(f"Возникло исключение: {e}")
+        self._file_signature = signature
+        self._generation = generation
 
-    def print_list_books(self) -> NoReturn: # выводит в консоль список books
-        self.load_from_file_list_book()
-        if self.books:
-            print("Список книг в библиотеке:")
-            for book in self.books:
-                print(book)
+    def iter_books(self) -> Iterator[Book]: # книги из хранилища по одной, каталог в память не загружается
+        try:
+            for record in self.storage.iter_records():
+                yield Book.from_dict(record, self.trusted_load)
+        except FileNotFoundError:
+            return
+
+    def print_list_books(self, streaming: bool = False) -> NoReturn: # выводит в консоль список books
+        if streaming:
+            books = self.iter_books()
         else:
+            self.load_from_file_list_book()
+            books = iter(self.books)
+        book = next(books, None)
+        if book is None:
             print('В библиотеке нет книг', end='\n\n')
+            return
+        print("Список книг в библиотеке:")
+        print(book)
+        for book in books:
+            print(book)
 
 
 class LibraryManagement:
@@ -213,9 +609,43 @@ class LibraryManagement:
     'delete_book_from_library' - запрашивает у пользователя id удаляемой книги и инициирует удаление книги из библиотеки.
     'search_book_in_library' - запрашивает у пользователя поисковую строку и инициирует поиск по библиотеке.
     'change_book_status_in_library' - запрашивает у пользователя id  и новый статус книги и инициирует изменение статуса книги в библиотеке.
+    'view_books_in_library' - постраничный просмотр каталога с сортировкой и отбором по статусу,
+                              каждая страница выводится в консоль одной записью
+    'show_stats' - выводит статистику производительности (при первом вызове включает ее сбор)
     'start_managing_library' - запускает управления библиотекой для пользователя.
+    'run_command' - выполняет одну команду командной строки (python main.py add|remove|search|list|status ...)
+    'run_batch' - выполняет команды из сценария (по одной в строке) с одной записью изменений в конце
+
+    Библиотека (library) и сбор статистики (instrumentation) создаются при первом обращении, а не при импорте модуля.
+
+    Статистику собирает instrumentation (см. модуль instrumentation): пока сбор не включен пунктом меню 7
+    или флагом --stats, методы библиотеки работают без замеров. Каждая команда меню замеряется отдельно.
+
+    Пока меню работает, изменения сохраняет фоновый планировщик (persistence.SaveScheduler) с уровнем надежности
+    durability, поэтому команды не ждут записи на диск. Накопленные изменения записываются при выходе через пункт 6
+    и при получении сигнала SIGTERM.
     """
-    library: Library = Library()
+    page_size: int = 20
+    durability: str = 'async'
+    _library: Optional[Library] = None
+    _instrumentation: Optional['Instrumentation'] = None
+
+    @property
+    def library(self) -> Library: # библиотека по умолчанию общая для всех экземпляров, как прежний атрибут класса
+        if self._library is None:
+            LibraryManagement._library = Library()
+        return self._library
+
+    @library.setter
+    def library(self, value: Library) -> None:
+        self._library = value
+
+    @property
+    def instrumentation(self) -> 'Instrumentation':
+        if self._instrumentation is None:
+            from instrumentation import Instrumentation
+            LibraryManagement._instrumentation = Instrumentation(Library, Book)
+        return self._instrumentation
 
     def add_book_in_library(self) -> NoReturn:
         title: str = input("Введите название книги: ")
@@ -238,37 +668,193 @@ class LibraryManagement:
             "Введите новый статус (\"в наличии\" или \"выдана\"): ")
         self.library.change_book_status(id, new_status)
 
-    def start_managing_library(self) -> NoReturn:
-        print("Добро пожаловать в библиотеку!")
+    def view_books_in_library(self) -> NoReturn:
+        sort_by: str = input("Сортировать по полю (id, title, author, year), Enter - по id: ").strip() or 'id'
+        status: Optional[str] = input(
+            "Показать книги со статусом (\"в наличии\" или \"выдана\"), Enter - все книги: ").strip() or None
+        Catalogue.validate_page(0, self.page_size, sort_by, status)
+        total = self.library.count_books(status)
+        if total == 0:
+            print('В библиотеке нет книг', end='\n\n')
+            return
+        pages = (total + self.page_size - 1) // self.page_size
+        page = 0
         while True:
-            try:
-                menu: int = int(input(
-                    "Введите число от 1 до 6:\n\
+            books = self.library.list_books(page * self.page_size, self.page_size, sort_by, status)
+            sys.stdout.write(self.format_page(books, page + 1, pages))
+            sys.stdout.flush()
+            command = input("Enter - следующая страница, п - предыдущая, в - выход: ").strip().lower()
+            if command == 'в':
+                break
+            if command == 'п':
+                page = max(page - 1, 0)
+            elif page + 1 < pages:
+                page += 1
+            else:
+                break
+        print()
+
+    def show_stats(self) -> NoReturn:
+        if not self.instrumentation.enabled:
+            self.instrumentation.enable()
+            print("Сбор статистики включен, отчет выводится этим же пунктом меню.", end='\n\n')
+            return
+        print(self.instrumentation.report())
+
+    @staticmethod
+    def format_page(books: Iterable[Book], number: int, pages: int) -> str: # текст страницы для вывода одной записью
+        return f"Страница {number} из {pages}:\n" + ''.join(f"{book}\n" for book in books)
+
+    def start_managing_library(self) -> NoReturn: # изменения сохраняются в фоне и записываются при выходе (пункт 6 или SIGTERM)
+        from persistence import SaveScheduler
+        print("Добро пожаловать в библиотеку!")
+        scheduler = SaveScheduler(self.library, self.durability)
+        previous_handler = signal.signal(signal.SIGTERM, self._exit_on_signal)
+        try:
+            while True:
+                try:
+                    menu: int = int(input(
+                        "Введите число от 1 до 7:\n\
                             1 - Добавить книгу\n\
                             2 - Удалить книгу\n\
                             3 - Поиск книги\n\
                             4 - Отображение всех книг\n\
                             5 - Изменить статус книги\n\
-                            6 - Выход\n\n"))
-
-                if menu == 1:
-                    self.add_book_in_library()
-                elif menu == 2:
-                    self.delete_book_from_library()
-                elif menu == 3:
-                    self.search_book_in_library()
-                elif menu == 4:
-                    self.library.print_list_books()
-                elif menu == 5:
-                    self.change_book_status_in_library()
-                elif menu == 6:
-                    print("До встречи!")
-                    break
-                else:
-                    print("Введен некорректный пункт меню", end="\n\n")
-            except Exception as e:
-                print(f"{e}", end="\n\n")
+                            6 - Выход\n\
+                            7 - Статистика производительности\n\n"))
+
+                    if menu == 6:
+                        print("До встречи!")
+                        break
+                    command = self.commands.get(menu)
+                    if command is None:
+                        print("Введен некорректный пункт меню", end="\n\n")
+                        continue
+                    with self.instrumentation.command(command.__name__):
+                        command(self)
+                except Exception as e:
+                    print(f"{e}", end="\n\n")
+        finally:
+            scheduler.close()
+            signal.signal(signal.SIGTERM, previous_handler)
+
+    @staticmethod
+    def _exit_on_signal(signum: int, frame: Any) -> NoReturn:
+        raise SystemExit(0)
+
+    def run_command(self, args: 'argparse.Namespace') -> NoReturn: # выполняет одну команду командной строки
+        if args.command == 'add':
+            self.library.add_book(args.title, args.author, args.year)
+        elif args.command == 'remove':
+            self.library.remove_book(args.id)
+        elif args.command == 'search':
+            self.library.search_book(args.query, streaming=args.streaming)
+        elif args.command == 'list':
+            Catalogue.validate_page(args.offset, args.limit, args.sort_by, args.status)
+            books = list(self.library.list_books(args.offset, args.limit, args.sort_by, args.status))
+            if not books:
+                print('В библиотеке нет книг', end='\n\n')
+            sys.stdout.write(''.join(f"{book}\n" for book in books))
+        elif args.command == 'status':
+            self.library.change_book_status(args.id, args.status)
+
+    def run_batch(self, lines: Iterable[str], parser: 'argparse.ArgumentParser') -> int: # выполняет команды сценария, возвращает их число
+        import io
+        import shlex
+        count = 0
+        output = io.StringIO() # сообщения команд выводятся только после сохранения сценария
+        with self.library.batch(), redirect_stdout(output):
+            for number, line in enumerate(lines, 1):
+                words = shlex.split(line, comments=True)
+                if not words:
+                    continue
+                try:
+                    args = parser.parse_args(words)
+                except SystemExit:
+                    args = None
+                if args is None or args.command in (None, 'batch'):
+                    raise ValueError(f"Строка {number}: некорректная команда: {line.strip()}\n"
+                                     "Сценарий отменен, изменения не сохранены.")
+                try:
+                    self.run_command(args)
+                except Exception as e:
+                    raise ValueError(f"Строка {number}: {str(e).strip()}\nСценарий отменен, изменения не сохранены.") from e
+                count += 1
+        sys.stdout.write(output.getvalue())
+        return count
+
+    commands: Dict[int, Callable[['LibraryManagement'], None]] = {
+        1: add_book_in_library,
+        2: delete_book_from_library,
+        3: search_book_in_library,
+        4: view_books_in_library,
+        5: change_book_status_in_library,
+        7: show_stats,
+    }
+
+
+def build_parser() -> 'argparse.ArgumentParser':
+    import argparse
+    parser = argparse.ArgumentParser(description="Управление библиотекой книг. Без команды запускается меню.")
+    parser.add_argument('--filename', help=f"файл каталога (по умолчанию {Library.filename})")
+    parser.add_argument('--stats', action='store_true', help="собирать статистику производительности и вывести ее при выходе")
+    parser.add_argument('--profile', action='store_true', help="профилировать каждую команду через cProfile (включает --stats)")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="замерять пиковую память каждой команды через tracemalloc (включает --stats)")
+    commands = parser.add_subparsers(dest='command', metavar='команда')
+    add = commands.add_parser('add', help="добавить книгу")
+    add.add_argument('title')
+    add.add_argument('author')
+    add.add_argument('year')
+    remove = commands.add_parser('remove', help="удалить книгу")
+    remove.add_argument('id')
+    search = commands.add_parser('search', help="найти книги по названию, автору или году")
+    search.add_argument('query')
+    search.add_argument('--streaming', action='store_true', help="читать файл потоком, без загрузки каталога в память")
+    listing = commands.add_parser('list', help="вывести страницу каталога")
+    listing.add_argument('--offset', type=int, default=0)
+    listing.add_argument('--limit', type=int, default=LibraryManagement.page_size)
+    listing.add_argument('--sort-by', default='id', choices=Catalogue.sortable_fields)
+    listing.add_argument('--status', help="только книги с этим статусом")
+    status = commands.add_parser('status', help="изменить статус книги")
+    status.add_argument('id')
+    status.add_argument('status')
+    batch = commands.add_parser('batch', help="выполнить команды из файла (по одной в строке) с одной записью в конце")
+    batch.add_argument('script', nargs='?', default='-', help="файл сценария, по умолчанию стандартный ввод")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> NoReturn:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    management: LibraryManagement = LibraryManagement()
+    if args.filename:
+        management.library = Library(args.filename)
+    instrumentation = management.instrumentation if args.stats or args.profile or args.trace_memory else None
+    if instrumentation is not None:
+        instrumentation.profile, instrumentation.trace_memory = args.profile, args.trace_memory
+        instrumentation.enable()
+    try:
+        if args.command is None:
+            management.start_managing_library()
+            return
+        with instrumentation.command(args.command) if instrumentation is not None else nullcontext():
+            if args.command != 'batch':
+                management.run_command(args)
+            elif args.script == '-':
+                print(f"Выполнено команд: {management.run_batch(sys.stdin, parser)}")
+            else:
+                with open(args.script, encoding='utf-8') as script:
+                    print(f"Выполнено команд: {management.run_batch(script, parser)}")
+    except (ValueError, RuntimeError, OSError) as e:
+        if args.command is None:
+            raise
+        print(str(e).strip(), file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if instrumentation is not None:
+            print(instrumentation.report())
+            instrumentation.disable()
 
 if __name__ == '__main__':
-    l: LibraryManagement = LibraryManagement()
-    l.start_managing_library()
+    main()
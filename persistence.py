@@ -0,0 +1,170 @@
+"""
+Фоновое сохранение каталога. SaveScheduler принимает изменения библиотеки вместо немедленной записи
+и сохраняет их в хранилище в отдельном потоке, объединяя несколько изменений в одну запись.
+Уровни надежности (durability):
+'sync'  - каждое изменение записывается сразу, как без планировщика
+'group' - операция ждет записи, но изменения, накопившиеся во время предыдущей записи, сохраняются вместе (group commit)
+'async' - операция не ждет диска, изменения записываются раз в interval секунд или при накоплении max_pending изменений
+"""
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from storage import Change
+
+DURABILITY_LEVELS = ('sync', 'group', 'async')
+
+
+class SaveScheduler:
+    """
+    Класс SaveScheduler сохраняет изменения библиотеки в фоновом потоке.
+    Описание методов класса:
+    'submit' - прием изменений от Library.save_list_book
+    'wait' - ожидание записи принятых изменений (только для durability = 'group')
+    'flush' - немедленная запись всех накопленных изменений
+    'close' - остановка фонового потока с записью накопленных изменений
+    'stats' - счетчики: число ожидающих записи изменений, число записей и их длительность
+
+    Планировщик подключается к библиотеке при создании (library.scheduler). Запись выполняется через
+    Library.write_changes под блокировкой записи хранилища, поэтому снимок каталога не может разойтись
+    с изменениями, которые вносятся в это время. Если запись не удалась, изменения остаются в очереди
+    и записываются повторно через interval секунд.
+    """
+    interval: float = 1.0
+    max_pending: int = 1000
+
+    def __init__(self, library: Any, durability: str = 'async', interval: Optional[float] = None,
+                 max_pending: Optional[int] = None):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Уровень надежности должен быть одним из следующих: {', '.join(DURABILITY_LEVELS)}")
+        self.library = library
+        self.durability: str = durability
+        self.interval: float = self.interval if interval is None else interval
+        self.max_pending: int = max_pending or self.max_pending
+        self.flushes: int = 0
+        self.flushed_changes: int = 0
+        self.errors: int = 0
+        self.last_flush_ms: float = 0.0
+        self.max_flush_ms: float = 0.0
+        self.total_flush_ms: float = 0.0
+        self._condition = threading.Condition()
+        self._pending: List[Change] = []
+        self._full: bool = False
+        self._first_pending: Optional[float] = None
+        self._submitted: int = 0
+        self._flushed: int = 0
+        self._error: Optional[Exception] = None
+        self._stopping: bool = False
+        self._thread: Optional[threading.Thread] = None
+        if durability != 'sync':
+            self._thread = threading.Thread(target=self._run, name='library-save', daemon=True)
+            self._thread.start()
+        library.scheduler = self
+
+    @property
+    def pending(self) -> int: # число изменений, ожидающих записи
+        with self._condition:
+            return len(self._pending) + self._full
+
+    def submit(self, changes: Sequence[Change]) -> None: # пустой список изменений означает запись всего каталога
+        if self.durability == 'sync':
+            self._write(changes, not changes)
+            return
+        with self._condition:
+            if changes:
+                self._pending.extend(changes)
+            else:
+                self._full = True
+            self._submitted += 1
+            if self._first_pending is None:
+                self._first_pending = time.monotonic()
+            self._condition.notify_all()
+
+    def wait(self) -> None: # вызывается вне блокировки записи, иначе фоновый поток не сможет записать изменения
+        if self.durability != 'group':
+            return
+        with self._condition:
+            target = self._submitted
+            self._condition.wait_for(lambda: self._flushed >= target or self._error is not None)
+            if self._flushed < target:
+                raise RuntimeError(f"Изменения не сохранены: {self._error}")
+
+    def flush(self) -> None:
+        with self.library.storage.write_lock():
+            with self._condition:
+                changes, full, target = self._pending, self._full, self._submitted
+                if not changes and not full:
+                    return
+                self._pending, self._full, self._first_pending = [], False, None
+            try:
+                self._write(changes, full)
+            except Exception as e:
+                with self._condition:
+                    self._pending[:0] = changes
+                    self._full = self._full or full
+                    self._first_pending = self._first_pending or time.monotonic()
+                    self._error = e
+                    self._condition.notify_all()
+                raise
+            with self._condition:
+                self._flushed = target
+                self._error = None
+                self._condition.notify_all()
+
+    def close(self) -> None:
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        if self.library.scheduler is self:
+            self.library.scheduler = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'durability': self.durability,
+            'pending': self.pending,
+            'flushes': self.flushes,
+            'flushed_changes': self.flushed_changes,
+            'errors': self.errors,
+            'last_flush_ms': self.last_flush_ms,
+            'max_flush_ms': self.max_flush_ms,
+            'avg_flush_ms': self.total_flush_ms / self.flushes if self.flushes else 0.0,
+        }
+
+    def _write(self, changes: Sequence[Change], full: bool) -> None:
+        start = time.perf_counter()
+        try:
+            self.library.write_changes(() if full else tuple(changes))
+        except Exception:
+            self.errors += 1
+            raise
+        elapsed = (time.perf_counter() - start) * 1000
+        self.flushes += 1
+        self.flushed_changes += len(changes) or 1
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        self.total_flush_ms += elapsed
+
+    def _due(self) -> Optional[float]: # через сколько секунд пора записывать (0 - сейчас, None - нечего записывать)
+        if self._first_pending is None:
+            return None
+        if self.durability == 'group' or len(self._pending) >= self.max_pending:
+            return 0.0
+        return max(self._first_pending + self.interval - time.monotonic(), 0.0)
+
+    def _run(self) -> None: # фоновый поток записи
+        while True:
+            with self._condition:
+                while not self._stopping:
+                    due = self._due()
+                    if due == 0.0:
+                        break
+                    self._condition.wait(due)
+                if self._stopping:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                time.sleep(self.interval)
@@ -0,0 +1,179 @@
+"""
+Полнотекстовый поиск по каталогу. SearchIndex хранит инвертированный индекс "слово -> книги" по названию,
+автору и году и обновляется при каждом добавлении, удалении или изменении книги.
+Слова нормализуются: NFKC, приведение регистра (casefold), 'ё' -> 'е', а латинские буквы, похожие на кириллические,
+внутри кириллических слов заменяются кириллицей ("Гpибоедов" с латинской 'p' найдет "Грибоедов").
+Каждое слово запроса ищется как префикс, книга попадает в результат, только если совпали все слова запроса (И).
+Результаты упорядочены по релевантности: точное совпадение слова весит больше префиксного, название - больше автора.
+"""
+import heapq
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Set, Tuple, TypeVar
+
+T = TypeVar('T')
+
+FIELD_WEIGHTS: Dict[str, float] = {'title': 2.0, 'author': 1.5, 'year': 1.0}
+PREFIX_FACTOR: float = 0.5
+ESTIMATE_TOKEN_LIMIT: int = 64
+LATIN_TO_CYRILLIC = str.maketrans('aeopcxykmthb', 'аеорсхукмтнв')
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+
+def normalize(word: str) -> str: # приводит слово к виду, в котором оно хранится в индексе
+    word = unicodedata.normalize('NFKC', word).casefold().replace('ё', 'е')
+    if CYRILLIC_RE.search(word):
+        word = word.translate(LATIN_TO_CYRILLIC)
+    return word
+
+
+def tokenize(text: str) -> List[str]: # разбивает строку на нормализованные слова
+    return [normalize(word) for word in WORD_RE.findall(text)]
+
+
+def weighted_tokens(**fields: str) -> Dict[str, float]: # слова полей книги с весом поля, в котором они встретились
+    tokens: Dict[str, float] = {}
+    for field, value in fields.items():
+        weight = FIELD_WEIGHTS[field]
+        for token in tokenize(value):
+            tokens[token] = max(tokens.get(token, 0.0), weight)
+    return tokens
+
+
+def record_matcher(query: str) -> Callable[[Mapping[str, Any]], float]: # функция релевантности записи запросу без индекса (0 - не подходит)
+    terms = set(tokenize(query))
+
+    def score(record: Mapping[str, Any]) -> float:
+        if not terms:
+            return 0.0
+        tokens = weighted_tokens(**{field: str(record[field]) for field in FIELD_WEIGHTS})
+        total = 0.0
+        for term in terms:
+            term_score = SearchIndex._term_score(tokens, term)
+            if not term_score:
+                return 0.0
+            total += term_score
+        return total
+
+    return score
+
+
+def paginate(items: Iterable[T], page_size: int) -> Iterator[List[T]]: # разбивает поток на страницы по page_size элементов
+    page: List[T] = []
+    for item in items:
+        page.append(item)
+        if len(page) == page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+class SearchIndex:
+    """
+    Класс SearchIndex - инвертированный индекс для полнотекстового поиска книг.
+    Описание методов класса:
+    'add' - индексирование полей книги
+    'remove' - удаление книги из индекса
+    'search' - ленивый итератор по id книг, упорядоченных по релевантности запросу
+    """
+    def __init__(self):
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._book_tokens: Dict[int, Dict[str, float]] = {}
+        self._vocabulary: List[str] = []
+        self._new_tokens: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._book_tokens)
+
+    def add(self, id: int, **fields: str) -> None:
+        if id in self._book_tokens:
+            self.remove(id)
+        tokens = weighted_tokens(**fields)
+        self._book_tokens[id] = tokens
+        for token, weight in tokens.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                self._new_tokens.add(token)
+            posting[id] = weight
+
+    def remove(self, id: int) -> None:
+        for token in self._book_tokens.pop(id, {}):
+            posting = self._postings[token]
+            del posting[id]
+            if not posting:
+                del self._postings[token]
+                self._new_tokens.discard(token)
+
+    def _sorted_vocabulary(self) -> List[str]: # отсортированный словарь для поиска по префиксу, новые слова вставляются лениво
+        if self._new_tokens:
+            if len(self._new_tokens) < 1000:
+                for token in self._new_tokens:
+                    insort(self._vocabulary, token)
+            else:
+                self._vocabulary = sorted(set(self._vocabulary) | self._new_tokens)
+            self._new_tokens.clear()
+        if len(self._vocabulary) > 2 * len(self._postings) + 1000:
+            self._vocabulary = sorted(self._postings)
+        return self._vocabulary
+
+    def _term_range(self, term: str) -> Tuple[int, int]: # границы слов с префиксом term в отсортированном словаре
+        vocabulary = self._sorted_vocabulary()
+        return bisect_left(vocabulary, term), bisect_left(vocabulary, term + '\U0010ffff')
+
+    def _estimate(self, term: str) -> int: # оценка числа вхождений слов с префиксом term (по первым ESTIMATE_TOKEN_LIMIT словам)
+        start, end = self._term_range(term)
+        sample = self._vocabulary[start:min(end, start + ESTIMATE_TOKEN_LIMIT)]
+        if not sample:
+            return 0
+        total = sum(len(self._postings.get(token, ())) for token in sample)
+        return total * (end - start) // len(sample)
+
+    def _match_term(self, term: str) -> Dict[int, float]: # книги, содержащие слово с префиксом term, и их вес
+        start, end = self._term_range(term)
+        scores: Dict[int, float] = {}
+        for token in self._vocabulary[start:end]:
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            factor = 1.0 if token == term else PREFIX_FACTOR
+            for id, weight in posting.items():
+                score = weight * factor
+                if score > scores.get(id, 0.0):
+                    scores[id] = score
+        return scores
+
+    @staticmethod
+    def _term_score(tokens: Dict[str, float], term: str) -> float: # вес лучшего совпадения term со словами одной книги
+        best = 0.0
+        for token, weight in tokens.items():
+            if token.startswith(term):
+                best = max(best, weight if token == term else weight * PREFIX_FACTOR)
+        return best
+
+    def search(self, query: str) -> Iterator[int]: # id книг, содержащих все слова запроса, от наиболее релевантных
+        estimates = {term: self._estimate(term) for term in tokenize(query)}
+        terms = sorted(estimates, key=estimates.get)
+        if not terms:
+            return iter(())
+        scores = self._match_term(terms[0])
+        for term in terms[1:]:
+            if not scores:
+                break
+            if len(scores) < estimates[term]:
+                scores = {id: score + term_score for id, score in scores.items()
+                          if (term_score := self._term_score(self._book_tokens[id], term))}
+            else:
+                matches = self._match_term(term)
+                scores = {id: score + matches[id] for id, score in scores.items() if id in matches}
+        return self._ranked(scores)
+
+    @staticmethod
+    def _ranked(scores: Dict[int, float]) -> Iterator[int]: # выдает id по убыванию релевантности, сортируя кучу по мере чтения
+        heap: List[Tuple[float, int]] = [(-score, id) for id, score in scores.items()]
+        heapq.heapify(heap)
+        while heap:
+            yield heapq.heappop(heap)[1]
@@ -0,0 +1,339 @@
+"""
+HTTP/JSON сервис библиотеки на asyncio (только стандартная библиотека).
+Один процесс держит в памяти один экземпляр Library и обслуживает все подключения:
+чтения выполняются сразу в цикле событий и не ждут друг друга, изменения ставятся в очередь
+единственной задачи-писателя, которая применяет их пачками и сохраняет каждую пачку одной записью в хранилище.
+Запуск: python server.py [--host 127.0.0.1] [--port 8080] [--filename library.json] [--journal]
+
+Запросы:
+GET    /books?offset=0&limit=20&sort_by=id&status=... - страница каталога (sort_by: id, title, author, year)
+GET    /books/<id>                 - одна книга
+GET    /search?q=<запрос>&limit=20 - полнотекстовый поиск (см. модуль search)
+POST   /books                      - добавление книги, тело {"title": ..., "author": ..., "year": ...}
+DELETE /books/<id>                 - удаление книги
+PUT    /books/<id>/status          - изменение статуса, тело {"status": ...}
+"""
+import argparse
+import asyncio
+import json
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from main import Book, Library
+from storage import Change, JournalStorage, JsonStorage, Record
+
+REASONS: Dict[int, str] = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+MAX_PAGE_SIZE: int = 1000
+
+Response = Tuple[int, Any]
+Operation = Callable[..., Tuple[Any, Change]]
+
+
+class HttpError(Exception):
+    """
+    Ошибка обработки запроса с кодом ответа HTTP.
+    """
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status: int = status
+
+
+def parse_id(value: str) -> int: # id книги из пути запроса
+    if not value.isdigit():
+        raise HttpError(400, "ID книги должен быть числом.")
+    return int(value)
+
+
+def parse_request_line(line: bytes) -> Tuple[str, str, str]: # метод, путь и версия HTTP из строки запроса
+    parts = line.decode('latin-1').split()
+    if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+        raise HttpError(400, "Некорректная строка запроса.")
+    return parts[0], parts[1], parts[2]
+
+
+def content_length(headers: Dict[str, str]) -> int: # длина тела запроса из заголовка Content-Length
+    value = headers.get('content-length', '0')
+    if not value.isdigit():
+        raise HttpError(400, "Заголовок Content-Length должен быть неотрицательным числом.")
+    return int(value)
+
+
+def query_int(query: Dict[str, List[str]], name: str, default: int) -> int: # целочисленный параметр строки запроса
+    value = query.get(name, [str(default)])[0]
+    if not value.isdigit():
+        raise HttpError(400, f"Параметр {name} должен быть неотрицательным числом.")
+    return int(value)
+
+
+class LibraryService:
+    """
+    Класс LibraryService обслуживает HTTP-запросы к одной библиотеке.
+    Описание методов класса:
+    'start' - загрузка каталога, запуск задачи-писателя и сервера
+    'stop' - ожидание записи всех принятых изменений и остановка писателя
+    'dispatch' - обработка одного запроса, возвращает код ответа и тело
+
+    Изменения применяются к каталогу только задачей-писателем, поэтому читатели в цикле событий всегда видят
+    согласованный каталог. Писатель забирает из очереди все накопившиеся изменения (не больше batch_size)
+    и проверяет их по каталогу и по изменениям, уже принятым в этой пачке (словарь _pending), не меняя сам каталог.
+    Пачка сохраняется одним вызовом Library.write_changes в отдельном потоке, и только после успешной записи
+    изменения переносятся в каталог, а клиенты получают ответ. Пока пачка пишется, чтения продолжают обслуживаться
+    и видят только сохраненные данные; если запись не удалась, каталог остается прежним, а все запросы пачки
+    получают ошибку. Перечитывание файла каталога тоже выполняется в отдельном потоке.
+    Сервис рассчитан на то, что он единственный пишет в файл библиотеки: изменения, сделанные другими процессами,
+    подхватываются перед применением очередной пачки.
+    """
+    batch_size: int = 256
+
+    def __init__(self, library: Library):
+        self.library: Library = library
+        self.saves: int = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._connections: Set[asyncio.Task] = set()
+        self._pending: Dict[int, Optional[Book]] = {} # id -> книга после изменений пачки (None - книга удалена)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080) -> asyncio.AbstractServer:
+        self.library.load_from_file_list_book()
+        self._queue = asyncio.Queue()
+        self._writer = asyncio.ensure_future(self._write_loop())
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def stop(self) -> None: # вызывается после закрытия сервера: открытые соединения разрываются
+        for connection in list(self._connections):
+            connection.cancel()
+        await self._queue.join()
+        self._writer.cancel()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = asyncio.current_task()
+        self._connections.add(connection)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = parse_request_line(request_line)
+                    headers: Dict[str, str] = {}
+                    while True:
+                        line = await reader.readline()
+                        if not line.strip():
+                            break
+                        name, _, value = line.decode('latin-1').partition(':')
+                        headers[name.strip().lower()] = value.strip()
+                    length = content_length(headers)
+                except HttpError as e: # после некорректного запроса соединение закрывается
+                    writer.write(encode_message(f"HTTP/1.1 {e.status} {REASONS[e.status]}", {'error': str(e)}))
+                    await writer.drain()
+                    break
+                body = await reader.readexactly(length)
+                status, payload = await self.dispatch(method, target, body)
+                writer.write(encode_message(f"HTTP/1.1 {status} {REASONS[status]}", payload))
+                await writer.drain()
+                if version == 'HTTP/1.0' or headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError, asyncio.CancelledError):
+            pass
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+
+    async def dispatch(self, method: str, target: str, body: bytes = b'') -> Response:
+        url = urlsplit(target)
+        path = [part for part in url.path.split('/') if part]
+        query = parse_qs(url.query)
+        try:
+            if path == ['books'] and method == 'GET':
+                return 200, self._list_books(query_int(query, 'offset', 0), query_int(query, 'limit', 20),
+                                             query.get('sort_by', ['id'])[0], query.get('status', [None])[0])
+            if path == ['search'] and method == 'GET':
+                return 200, self._search(query.get('q', [''])[0], query_int(query, 'limit', 20))
+            if path == ['books'] and method == 'POST':
+                data = parse_body(body)
+                return 201, await self._submit(self._add, str(data.get('title', '')), str(data.get('author', '')),
+                                               str(data.get('year', '')))
+            if len(path) == 2 and path[0] == 'books' and method == 'GET':
+                return 200, self._get_book(parse_id(path[1])).to_dict()
+            if len(path) == 2 and path[0] == 'books' and method == 'DELETE':
+                return 200, await self._submit(self._remove, parse_id(path[1]))
+            if len(path) == 3 and path[0] == 'books' and path[2] == 'status' and method == 'PUT':
+                return 200, await self._submit(self._change_status, parse_id(path[1]),
+                                               str(parse_body(body).get('status', '')))
+            raise HttpError(404, f"Нет обработчика для {method} {url.path}")
+        except HttpError as e:
+            return e.status, {'error': str(e)}
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': f"Возникло исключение: {e}"}
+
+    def _list_books(self, offset: int, limit: int, sort_by: str, status: Optional[str]) -> Dict[str, Any]:
+        books = self.library.books.page(offset, min(limit, MAX_PAGE_SIZE), sort_by, status)
+        return {'total': self.library.books.count(status), 'books': [book.to_dict() for book in books]}
+
+    def _search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        return [book.to_dict() for book in islice(self.library.books.search(query), min(limit, MAX_PAGE_SIZE))]
+
+    def _get_book(self, id: int) -> Book:
+        book = self.library.books.get(id)
+        if book is None:
+            raise HttpError(404, f"Книга с ID {id} не найдена.")
+        return book
+
+    async def _submit(self, operation: Operation, *args: Any) -> Any: # ставит изменение в очередь писателя и ждет его сохранения
+        future = asyncio.get_event_loop().create_future()
+        self._queue.put_nowait((operation, args, future))
+        return await future
+
+    def _get_pending(self, id: int) -> Book: # книга с учетом изменений текущей пачки
+        book = self._pending[id] if id in self._pending else self.library.books.get(id)
+        if book is None:
+            raise HttpError(404, f"Книга с ID {id} не найдена.")
+        return book
+
+    def _add(self, title: str, author: str, year: str) -> Tuple[Any, Change]:
+        book = Book(title, author, year)
+        self._pending[book.id] = book
+        return book.to_dict(), {'op': 'add', 'book': book.to_dict()}
+
+    def _remove(self, id: int) -> Tuple[Any, Change]:
+        book = self._get_pending(id)
+        self._pending[id] = None
+        return book.to_dict(), {'op': 'remove', 'id': id}
+
+    def _change_status(self, id: int, new_status: str) -> Tuple[Any, Change]:
+        book = self._get_pending(id)
+        book = self._pending[id] = Book(book.title, book.author, book.year, book.id, new_status)
+        return book.to_dict(), {'op': 'status', 'id': id, 'status': book.status}
+
+    def _pending_records(self) -> Iterator[Record]: # содержимое каталога после пачки, сам каталог не меняется
+        pending = dict(self._pending)
+        for book in self.library.books:
+            if book.id in pending:
+                book = pending.pop(book.id)
+                if book is None:
+                    continue
+            yield book.to_dict()
+        for book in pending.values():
+            if book is not None:
+                yield book.to_dict()
+
+    def _commit(self, changes: List[Change]) -> None: # переносит сохраненные изменения пачки в каталог
+        books = self.library.books
+        for change in changes:
+            if change['op'] == 'add':
+                books.append(Book.from_dict(change['book'], trusted=True))
+            elif change['op'] == 'remove':
+                books.remove(change['id'])
+            else:
+                books.update(change['id'], status=change['status'])
+
+    async def _write_loop(self) -> None: # единственная задача, изменяющая каталог
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._apply_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _apply_batch(self, batch: List[Tuple[Operation, tuple, asyncio.Future]]) -> None: # проверяет пачку изменений, сохраняет ее одной записью и переносит в каталог
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.library.load_from_file_list_book)
+        changes: List[Change] = []
+        applied: List[Tuple[asyncio.Future, Any]] = []
+        self._pending = {}
+        try:
+            for operation, args, future in batch:
+                try:
+                    result, change = operation(*args)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                changes.append(change)
+                applied.append((future, result))
+            if changes:
+                try:
+                    await loop.run_in_executor(None, self.library.write_changes, tuple(changes), self._pending_records())
+                    self._commit(changes)
+                    self.saves += 1
+                except Exception as e:
+                    await loop.run_in_executor(None, lambda: self.library.load_from_file_list_book(force=True))
+                    applied = [(future, e) for future, _ in applied]
+        finally:
+            self._pending = {}
+        for future, result in applied:
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+def parse_body(body: bytes) -> Dict[str, Any]: # тело запроса - json-объект
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        raise HttpError(400, "Тело запроса должно быть json-объектом.")
+    if not isinstance(data, dict):
+        raise HttpError(400, "Тело запроса должно быть json-объектом.")
+    return data
+
+
+def encode_message(start_line: str, payload: Any = None, headers: str = '') -> bytes: # HTTP-сообщение с json-телом
+    body = b'' if payload is None else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = (f"{start_line}\r\n{headers}Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n")
+    return head.encode('latin-1') + body
+
+
+async def send_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, path: str,
+                       payload: Any = None) -> Response: # отправляет запрос по открытому соединению и читает ответ
+    writer.write(encode_message(f"{method} {path} HTTP/1.1", payload, "Host: library\r\n"))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    body = await reader.readexactly(length)
+    return status, json.loads(body) if body else None
+
+
+async def serve(library: Library, host: str, port: int) -> None:
+    service = LibraryService(library)
+    server = await service.start(host, port)
+    print(f"Библиотека доступна по адресу http://{host}:{port}")
+    try:
+        await server.serve_forever()
+    finally:
+        server.close()
+        await service.stop()
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="HTTP/JSON сервис библиотеки")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--filename', default=Library.filename, help="файл каталога")
+    parser.add_argument('--journal', action='store_true', help="дописывать изменения в журнал (JournalStorage)")
+    args = parser.parse_args(argv)
+    storage = JournalStorage(args.filename) if args.journal else JsonStorage(args.filename)
+    try:
+        asyncio.run(serve(Library(storage=storage), args.host, args.port))
+    except KeyboardInterrupt:
+        print("До встречи!")
+
+
+if __name__ == '__main__':
+    main()
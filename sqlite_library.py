@@ -0,0 +1,246 @@
+"""
+Хранение библиотеки в базе SQLite. SqliteLibrary сохраняет публичные методы Library, но не держит
+каталог в памяти: каждая операция выполняется одним запросом к базе с индексами по id, title, author и year.
+Перенос существующего каталога из json: python sqlite_library.py migrate library.json library.db
+"""
+import json
+import sqlite3
+import sys
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NoReturn, Optional
+
+from circulation import BookStatus, parse_status
+from main import Book, Catalogue, Library
+from search import FIELD_WEIGHTS, paginate, tokenize
+
+SCHEMA_VERSION: int = 1 # 1 - добавлена таблица полнотекстового поиска books_fts
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    year TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS books_title ON books (title);
+CREATE INDEX IF NOT EXISTS books_author ON books (author);
+CREATE INDEX IF NOT EXISTS books_year ON books (year);
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(title, author, year, tokenize='unicode61 remove_diacritics 0');
+"""
+
+
+class SqliteLibrary(Library):
+    """
+    Класс SqliteLibrary - библиотека, хранящая книги в файле базы SQLite (режим журнала WAL).
+    Удаление и изменение статуса выполняются одним DELETE/UPDATE по первичному ключу,
+    поиск использует индексы по title, author и year. Список books не заполняется.
+    list_books выполняет ORDER BY ... LIMIT/OFFSET по тем же индексам (регистр учитывается по правилам SQLite).
+    find_books и search_book ищут по словам и началам слов, как Library.find_books, через полнотекстовую таблицу FTS5
+    books_fts (rowid - id книги). В нее записываются слова полей, уже нормализованные функцией search.tokenize,
+    поэтому ё/е, регистр и латинские буквы в кириллических словах сравниваются так же, как в search.SearchIndex.
+    Каждое слово запроса ищется как префикс, результаты упорядочены по bm25 с весами полей search.FIELD_WEIGHTS.
+    Таблица поиска заполняется при первом открытии базы, созданной до ее появления (номер версии схемы в PRAGMA user_version),
+    дальше ее обновляют методы SqliteLibrary. Если книги меняла другая программа, таблицу перестраивает rebuild_search_index.
+    add_books вставляет книги страницами по bulk_chunk_size через executemany в одной транзакции: в памяти находится
+    только текущая страница, а при ошибке в базе не остается ни одной книги из потока.
+    write_transaction и batch открывают транзакцию BEGIN IMMEDIATE (блокировка записи в базу на время блока):
+    изменения всех операций внутри блока фиксируются вместе при выходе и отменяются при ошибке.
+    """
+    filename: str = 'library.db'
+
+    def __init__(self, filename: Optional[str] = None):
+        self.books: Catalogue = Catalogue()
+        self.filename: str = filename or self.filename
+        self.connection: sqlite3.Connection = sqlite3.connect(self.filename)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+        self._transaction_depth: int = 0
+        self._ensure_counter()
+        self._ensure_search_index()
+
+    def _ensure_counter(self) -> None: # счетчик id не должен отставать от максимального id в базе
+        max_id = self.connection.execute('SELECT MAX(id) FROM books').fetchone()[0]
+        if max_id is not None:
+            Book.id_allocator.ensure_above(max_id)
+
+    def _ensure_search_index(self) -> None: # заполняет таблицу поиска в базе прежней версии схемы
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            self.rebuild_search_index()
+            self.connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def rebuild_search_index(self) -> None: # заполняет таблицу поиска заново по всем книгам
+        with self.write_transaction():
+            self.connection.execute('DELETE FROM books_fts')
+            self._index_books(self._select_books())
+
+    def _index_books(self, books: Iterable[Book]) -> None: # добавляет нормализованные слова книг в таблицу поиска
+        self.connection.executemany(
+            'INSERT INTO books_fts (rowid, title, author, year) VALUES (?, ?, ?, ?)',
+            ((book.id, *(' '.join(tokenize(getattr(book, field))) for field in FIELD_WEIGHTS)) for book in books))
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @contextmanager
+    def write_transaction(self) -> Iterator[None]: # транзакция SQLite, вложенные транзакции входят во внешнюю
+        self._transaction_depth += 1
+        try:
+            if self._transaction_depth > 1:
+                yield
+                return
+            with self.connection:
+                self.connection.execute('BEGIN IMMEDIATE')
+                yield
+        finally:
+            self._transaction_depth -= 1
+
+    @contextmanager
+    def batch(self) -> Iterator[None]: # операции внутри блока фиксируются одной транзакцией, при ошибке отменяются
+        with self.write_transaction():
+            yield
+
+    def _get_book(self, id: int) -> Optional[Book]: # читает одну книгу по id
+        row = self.connection.execute(
+            'SELECT id, title, author, year, status FROM books WHERE id = ?', (id,)).fetchone()
+        return self._row_to_book(row) if row else None
+
+    @staticmethod
+    def _row_to_book(row: tuple) -> Book:
+        return Book(row[1], row[2], row[3], row[0], row[4])
+
+    def _select_books(self, where: str = '', params: tuple = ()) -> Iterator[Book]:
+        cursor = self.connection.execute(
+            f'SELECT id, title, author, year, status FROM books {where} ORDER BY id', params)
+        for row in cursor:
+            yield self._row_to_book(row)
+
+    def add_book(self, title, author, year) -> NoReturn:
+        new_book = Book(title, author, year)
+        with self.write_transaction():
+            self.connection.execute('INSERT INTO books (id, title, author, year, status) VALUES (?, ?, ?, ?, ?)',
+                                    (new_book.id, new_book.title, new_book.author, new_book.year, new_book.status))
+            self._index_books((new_book,))
+        print(f"Книга \"{title}\" успешно сохранена", end='\n\n')
+
+    def add_books(self, rows: Iterable[Dict[str, Any]],
+                  on_reject: Optional[Callable[[Dict[str, Any], Exception], None]] = None) -> int: # все книги добавляются одной транзакцией
+        added = 0
+        with self.write_transaction():
+            for chunk in paginate(rows, self.bulk_chunk_size):
+                books = list(self._books_from_rows(chunk, on_reject))
+                self.connection.executemany('INSERT INTO books (id, title, author, year, status) VALUES (?, ?, ?, ?, ?)',
+                                            ((book.id, book.title, book.author, book.year, book.status) for book in books))
+                self._index_books(books)
+                added += len(books)
+        print(f"Добавлено книг: {added}", end='\n\n')
+        return added
+
+    def remove_book(self, id: str) -> NoReturn:
+        if not id.isdigit():
+            raise ValueError("ID книги должен быть числом.")
+        with self.write_transaction():
+            book = self._get_book(int(id))
+            if book is None:
+                raise ValueError(f"Книга с ID {id} не найдена.\n\n")
+            self.connection.execute('DELETE FROM books WHERE id = ?', (book.id,))
+            self.connection.execute('DELETE FROM books_fts WHERE rowid = ?', (book.id,))
+        print(f"Книга \"{book.title}\" была успешно удалена.", end='\n\n')
+
+    def find_books(self, search_field: str, page_size: int = 20) -> Iterator[List[Book]]: # страницы книг, от наиболее релевантных
+        terms = set(tokenize(search_field))
+        if not terms:
+            return iter(())
+        weights = ', '.join(str(weight) for weight in FIELD_WEIGHTS.values())
+        cursor = self.connection.execute(
+            'SELECT books.id, books.title, books.author, books.year, books.status FROM books_fts '
+            'JOIN books ON books.id = books_fts.rowid WHERE books_fts MATCH ? '
+            f'ORDER BY bm25(books_fts, {weights}), books.id',
+            (' AND '.join(f'"{term}"*' for term in sorted(terms)),))
+        return paginate((self._row_to_book(row) for row in cursor), page_size)
+
+    def change_book_status(self, id: str, new_status: str) -> None:
+        if not id.isdigit():
+            raise ValueError("ID книги должен быть целым числом.")
+        with self.write_transaction():
+            book = self._get_book(int(id))
+            if book is None:
+                raise ValueError(f"Книга с ID {id} не найдена.\n\n")
+            book.status = new_status
+            self.connection.execute('UPDATE books SET status = ? WHERE id = ?', (book.status, book.id))
+        print(f"Статус книги \"{book.title}\" изменен на \"{book.status}\"")
+
+    def list_books(self, offset: int = 0, limit: int = 20, sort_by: str = 'id',
+                   status: Optional[str] = None) -> Iterator[Book]:
+        Catalogue.validate_page(offset, limit, sort_by, status)
+        where, params = ('WHERE status = ?', (status,)) if status is not None else ('', ())
+        cursor = self.connection.execute(f'SELECT id, title, author, year, status FROM books {where} '
+                                         f'ORDER BY {sort_by}, id LIMIT ? OFFSET ?', params + (limit, offset))
+        return (self._row_to_book(row) for row in cursor)
+
+    def count_books(self, status: Optional[str] = None, author: Optional[str] = None) -> int:
+        Catalogue.validate_page(0, 0, 'id', status)
+        conditions = {'status': status, 'author': author}
+        where = ' AND '.join(f'{field} = ?' for field, value in conditions.items() if value is not None)
+        params = tuple(value for value in conditions.values() if value is not None)
+        return self.connection.execute(f"SELECT COUNT(*) FROM books {'WHERE ' + where if where else ''}",
+                                       params).fetchone()[0]
+
+    def available_books(self, author: str) -> List[Book]:
+        return list(self._select_books('WHERE author = ? AND status = ?', (author, BookStatus.AVAILABLE.value)))
+
+    def change_statuses(self, statuses: Dict[int, str]) -> List[Book]: # все статусы меняются в одной транзакции
+        with self.write_transaction():
+            books = []
+            for id, status in statuses.items():
+                book = self._get_book(id)
+                if book is None:
+                    raise ValueError(f"Книга с ID {id} не найдена.")
+                book.status = parse_status(status)
+                books.append(book)
+            self.connection.executemany('UPDATE books SET status = ? WHERE id = ?',
+                                        ((book.status.value, book.id) for book in books))
+        return books
+
+    def save_list_book(self, *changes) -> NoReturn: # изменения записываются в базу сразу, отдельное сохранение не нужно
+        pass
+
+    def load_from_file_list_book(self, force: bool = False) -> NoReturn: # данные читаются из базы по запросу
+        pass
+
+    def iter_books(self) -> Iterator[Book]: # книги читаются из базы курсором по одной
+        return self._select_books()
+
+    def print_list_books(self, streaming: bool = False) -> NoReturn:
+        books = self._select_books()
+        book = next(books, None)
+        if book is None:
+            print('В библиотеке нет книг', end='\n\n')
+            return
+        print("Список книг в библиотеке:")
+        print(book)
+        for book in books:
+            print(book)
+
+
+def migrate_from_json(json_filename: str, db_filename: str) -> int: # переносит книги из json-файла в базу, возвращает число книг
+    with open(json_filename, 'r') as f:
+        books = [Book.from_dict(book) for book in json.load(f)]
+    library = SqliteLibrary(db_filename)
+    try:
+        with library.connection:
+            library.connection.executemany(
+                'INSERT OR REPLACE INTO books (id, title, author, year, status) VALUES (?, ?, ?, ?, ?)',
+                ((book.id, book.title, book.author, book.year, book.status) for book in books))
+        library._ensure_counter()
+        library.rebuild_search_index()
+    finally:
+        library.close()
+    return len(books)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'migrate':
+        print("Использование: python sqlite_library.py migrate library.json library.db")
+        sys.exit(1)
+    count = migrate_from_json(sys.argv[2], sys.argv[3])
+    print(f"Перенесено книг: {count}")
@@ -0,0 +1,455 @@
+"""
+Хранилища каталога библиотеки. Хранилище работает со словарями книг в формате library.json
+и ничего не знает о классе Book, поэтому его можно подменять в Library.
+Описание классов:
+'JsonStorage' - весь каталог хранится одним json-массивом и перезаписывается при каждом сохранении
+'JournalStorage' - изменения дописываются в журнал по одной строке, каталог восстанавливается из снимка
+                   и журнала, журнал периодически сворачивается в новый снимок
+'IdAllocator' - выдача уникальных id книг блоками, зарезервированными в файле счетчика под блокировкой
+Запись в файловые хранилища выполняется под блокировкой, см. FileStorage.
+"""
+import io
+import json
+import mmap
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+
+try:
+    import fcntl
+except ImportError: # на Windows блокировки файлов не поддерживаются, работа продолжается без них
+    fcntl = None
+
+Record = Dict[str, Union[str, int]]
+Change = Dict[str, Any]
+Signature = Optional[Tuple[int, int, int]]
+
+READ_CHUNK_SIZE: int = 1 << 16
+WHITESPACE: str = ' \t\n\r'
+
+
+def file_signature(filename: str) -> Signature: # сигнатура файла для определения изменений извне
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def open_file_signature(f: BinaryIO) -> Signature: # сигнатура открытого файла (того, что был открыт, даже если его уже подменили)
+    stat = os.fstat(f.fileno())
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def write_json_atomic(filename: str, records: Iterable[Record], indent: Optional[int] = None) -> None: # записывает каталог во временный файл и подменяет им исходный
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, 'w') as f:
+        if indent is None: # компактный снимок кодируется одним вызовом C-кодировщика json
+            f.write(json.dumps(list(records), separators=(',', ':')))
+        else:
+            json.dump(list(records), f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+def iter_records(filename: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Record]: # читает записи по одной из json-массива или JSON Lines
+    with open(filename, 'rb') as f:
+        yield from iter_file_records(f, chunk_size)
+
+
+def iter_file_records(f: BinaryIO, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Record]: # то же для открытого файла (читается с начала)
+    first = f.read(chunk_size).lstrip()
+    if not first:
+        return
+    f.seek(0)
+    if first[:1] == b'[':
+        text = io.TextIOWrapper(f, encoding='utf-8')
+        try:
+            yield from iter_json_array(text, chunk_size)
+        finally:
+            text.detach()
+    else:
+        yield from iter_json_lines(f)
+
+
+def iter_json_array(f: TextIO, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Record]: # разбирает json-массив по элементам, читая файл блоками
+    decoder = json.JSONDecoder()
+    buffer, position, eof, started = '', 0, False, False
+    while True:
+        while position < len(buffer) and buffer[position] in WHITESPACE:
+            position += 1
+        if position == len(buffer):
+            if eof:
+                raise json.JSONDecodeError("Неожиданный конец json-массива", buffer, position)
+            chunk = f.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        char = buffer[position]
+        if not started:
+            if char != '[':
+                raise json.JSONDecodeError("Ожидается json-массив", buffer, position)
+            started = True
+            position += 1
+        elif char == ',':
+            position += 1
+        elif char == ']':
+            return
+        else:
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+                continue
+            yield record
+
+
+def iter_json_lines(f: BinaryIO) -> Iterator[Record]: # читает JSON Lines из открытого файла через отображение в память
+    if os.fstat(f.fileno()).st_size == 0:
+        return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        for line in iter(mapped.readline, b''):
+            if line.strip():
+                yield json.loads(line)
+
+
+@contextmanager
+def locked(fd: int, exclusive: bool = True) -> Iterator[int]: # держит блокировку fcntl на файловом дескрипторе
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    try:
+        yield fd
+    finally:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def read_int(fd: int, default: int) -> int: # читает число из начала файла
+    data = os.pread(fd, 64, 0).strip()
+    return int(data) if data.isdigit() else default
+
+
+def write_int(fd: int, value: int) -> None: # записывает число в начало файла (числа только растут, поэтому без усечения)
+    os.pwrite(fd, str(value).encode(), 0)
+
+
+def apply_change(records: Dict[int, Record], change: Change) -> None: # применяет одно изменение из журнала к каталогу
+    op = change['op']
+    if op == 'add':
+        records[change['book']['id']] = change['book']
+    elif op == 'remove':
+        records.pop(change['id'], None)
+    elif op == 'status':
+        if change['id'] in records:
+            records[change['id']] = dict(records[change['id']], status=change['status'])
+    else:
+        raise ValueError(f"Неизвестная операция в журнале: {op}")
+
+
+class FileStorage:
+    """
+    Общая часть файловых хранилищ: блокировка записи и номер поколения каталога.
+    Запись выполняется под исключительной блокировкой fcntl файла <filename>.lock (блокировка повторно входимая
+    в пределах процесса). В этом же файле хранится номер поколения, который увеличивается при каждом сохранении:
+    писатель, у которого номер поколения отличается от сохраненного при загрузке, знает, что его копия каталога
+    устарела, и перечитывает ее. Читатели блокировку не берут: файлы подменяются атомарно (запись во временный файл
+    и переименование), поэтому читатель всегда видит целую версию каталога и не ждет писателей.
+    """
+    def __init__(self, filename: str):
+        self.filename: str = filename
+        self.lock_filename: str = f"{filename}.lock"
+        self._lock_fd: Optional[int] = None
+        self._lock_depth: int = 0
+        self._thread_lock = threading.RLock()
+
+    @contextmanager
+    def write_lock(self) -> Iterator[None]: # исключительная блокировка записи в хранилище
+        with self._thread_lock:
+            if self._lock_depth == 0:
+                fd = os.open(self.lock_filename, os.O_RDWR | os.O_CREAT, 0o644)
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                self._lock_fd = fd
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    fd, self._lock_fd = self._lock_fd, None
+                    os.close(fd)
+
+    def generation(self) -> int: # номер поколения каталога, читается без блокировки (0 - файла блокировки нет или он пуст)
+        try:
+            with open(self.lock_filename, 'rb') as f:
+                data = f.read().strip()
+        except FileNotFoundError:
+            return 0
+        if not data:
+            return 0
+        return int(data) if data.isdigit() else -1
+
+    def bump_generation(self) -> int: # увеличивает номер поколения, вызывается под блокировкой записи
+        if self._lock_fd is None:
+            raise RuntimeError("Номер поколения меняется только под блокировкой записи.")
+        generation = read_int(self._lock_fd, 0) + 1
+        write_int(self._lock_fd, generation)
+        return generation
+
+
+class JsonStorage(FileStorage):
+    """
+    Хранилище в одном json-файле. При сохранении файл перезаписывается целиком, изменения игнорируются.
+    По умолчанию снимок пишется без отступов (indent = None): так он меньше и записывается в несколько раз быстрее.
+    """
+    indent: Optional[int] = None
+
+    def __init__(self, filename: str = 'library.json'):
+        super().__init__(filename)
+
+    def signature(self) -> Signature:
+        return file_signature(self.filename)
+
+    def load(self) -> List[Record]: # читает каталог из файла
+        with open(self.filename, 'r') as f:
+            return json.load(f)
+
+    def iter_records(self) -> Iterator[Record]: # читает каталог по одной записи, не загружая файл целиком
+        return iter_records(self.filename)
+
+    def create(self) -> None: # создает пустой файл каталога
+        with open(self.filename, 'w') as f:
+            pass
+
+    def save(self, records: Iterable[Record], changes: Tuple[Change, ...] = ()) -> None: # перезаписывает каталог целиком
+        write_json_atomic(self.filename, records, self.indent)
+
+
+class JournalStorage(FileStorage):
+    """
+    Хранилище со снимком и журналом изменений.
+    Снимок - обычный файл library.json, поэтому существующий каталог подхватывается без конвертации,
+    а свернутый журнал можно использовать как экспорт. Каждое изменение (добавление, удаление, смена статуса)
+    дописывается в журнал одной строкой json, поэтому стоимость записи не зависит от размера каталога.
+    При загрузке журнал проигрывается поверх снимка. Недописанная последняя строка (например, после сбоя)
+    при чтении отбрасывается, а перед следующей дозаписью журнал обрезается до последней целой записи.
+    Когда в журнале накапливается compact_threshold записей, он сворачивается в новый снимок.
+    Повторное применение журнала к снимку, в который он уже свернут, неверно: старое добавление может вернуть
+    удаленную книгу, а старая смена статуса - отменить более новую. Поэтому снимок и журнал читаются согласованно:
+    - при сворачивании новый снимок сначала записывается во временный файл, в журнал дописывается отметка
+      {"op": "compact", "snapshot": сигнатура нового снимка}, затем снимок подменяется и журнал очищается;
+      записи журнала до отметки, сделанной для прочитанного снимка, уже входят в него и пропускаются
+      (так же читается журнал, оставшийся после сбоя между подменой снимка и очисткой журнала);
+    - читатель открывает снимок, читает журнал и проверяет, что снимок за это время не подменили,
+      иначе чтение повторяется (журнал мог быть очищен раньше, чем прочитан, и тогда его изменений нет в открытом снимке).
+    """
+    indent: Optional[int] = None
+
+    def __init__(self, filename: str = 'library.json', journal_filename: Optional[str] = None,
+                 compact_threshold: int = 10000, fsync: bool = False):
+        super().__init__(filename)
+        self.journal_filename: str = journal_filename or f"{filename}.journal"
+        self.compact_threshold: int = compact_threshold
+        self.fsync: bool = fsync
+        self.journal_records: int = 0
+
+    def signature(self) -> Optional[Tuple[Signature, Signature]]:
+        snapshot, journal = file_signature(self.filename), file_signature(self.journal_filename)
+        if snapshot is None and journal is None:
+            return None
+        return snapshot, journal
+
+    def load(self) -> List[Record]: # читает снимок и проигрывает поверх него журнал
+        f, changes = self._open_snapshot()
+        records: Dict[int, Record] = {}
+        if f is None:
+            if changes is None:
+                raise FileNotFoundError(f"Нет ни снимка {self.filename}, ни журнала {self.journal_filename}")
+            content = b''
+        else:
+            with f:
+                content = f.read()
+        if content.strip():
+            records = {record['id']: record for record in json.loads(content)}
+        for change in changes or ():
+            apply_change(records, change)
+        return list(records.values())
+
+    def iter_records(self) -> Iterator[Record]: # читает снимок по одной записи, применяя к ним изменения из журнала
+        overlay: Dict[int, Optional[Record]] = {}
+        statuses: Dict[int, str] = {}
+        f, changes = self._open_snapshot()
+        for change in changes or ():
+            if change['op'] == 'add':
+                overlay[change['book']['id']] = change['book']
+            elif change['op'] == 'remove':
+                overlay[change['id']] = None
+            elif change['id'] in overlay:
+                if overlay[change['id']] is not None:
+                    overlay[change['id']] = dict(overlay[change['id']], status=change['status'])
+            else:
+                statuses[change['id']] = change['status']
+        if f is not None:
+            with f:
+                for record in iter_file_records(f):
+                    if record['id'] in overlay:
+                        record = overlay.pop(record['id'])
+                        if record is None:
+                            continue
+                    elif record['id'] in statuses:
+                        record = dict(record, status=statuses[record['id']])
+                    yield record
+        for record in overlay.values():
+            if record is not None:
+                yield record
+
+    def _open_snapshot(self) -> Tuple[Optional[BinaryIO], Optional[List[Change]]]: # открытый снимок (None, если его нет) и журнал к нему
+        while True:
+            try:
+                f: Optional[BinaryIO] = open(self.filename, 'rb')
+            except FileNotFoundError:
+                f = None
+            snapshot = None if f is None else open_file_signature(f)
+            changes = self._read_journal(snapshot)
+            if file_signature(self.filename) == snapshot:
+                return f, changes
+            if f is not None: # снимок подменили во время чтения журнала
+                f.close()
+
+    def _read_journal(self, snapshot: Signature = None) -> Optional[List[Change]]: # целые записи журнала, не вошедшие в снимок snapshot (None, если журнала нет)
+        try:
+            with open(self.journal_filename, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.journal_records = 0
+            return None
+        changes = [json.loads(line) for line in data[:data.rfind(b'\n') + 1].splitlines() if line.strip()]
+        marks = [position for position, change in enumerate(changes) if change['op'] == 'compact']
+        if marks and snapshot is not None and tuple(changes[marks[-1]]['snapshot']) == snapshot:
+            changes = changes[marks[-1] + 1:]
+        changes = [change for change in changes if change['op'] != 'compact']
+        self.journal_records = len(changes)
+        return changes
+
+    def _repair_tail(self) -> None: # обрезает недописанную последнюю строку журнала, вызывается под блокировкой записи
+        try:
+            with open(self.journal_filename, 'r+b') as f:
+                size = f.seek(0, os.SEEK_END)
+                if size == 0:
+                    return
+                f.seek(size - 1) # обычно журнал цел и заканчивается переводом строки - достаточно прочитать один байт
+                if f.read(1) == b'\n':
+                    return
+                position = size - 1 # последний байт уже проверен
+                while position > 0:
+                    start = max(position - READ_CHUNK_SIZE, 0)
+                    f.seek(start)
+                    newline = f.read(position - start).rfind(b'\n')
+                    if newline != -1:
+                        position = start + newline + 1
+                        break
+                    position = start
+                if position < size:
+                    f.truncate(position)
+        except FileNotFoundError:
+            pass
+
+    def create(self) -> None: # создает пустой снимок каталога
+        write_json_atomic(self.filename, [])
+
+    def save(self, records: Iterable[Record], changes: Tuple[Change, ...] = ()) -> None: # дописывает изменения в журнал
+        if not changes:
+            self.compact(records)
+            return
+        with self.write_lock():
+            self._append(changes)
+            self.journal_records += len(changes)
+            if self.journal_records >= self.compact_threshold:
+                self.compact(records)
+
+    def _append(self, changes: Iterable[Change]) -> None: # дописывает записи в журнал, вызывается под блокировкой записи
+        self._repair_tail()
+        with open(self.journal_filename, 'a') as f:
+            f.write(''.join(json.dumps(change) + '\n' for change in changes))
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def compact(self, records: Iterable[Record]) -> None: # сворачивает журнал в новый снимок
+        with self.write_lock():
+            tmp_filename = f"{self.filename}.compact"
+            write_json_atomic(tmp_filename, records, self.indent)
+            if os.path.exists(self.journal_filename):
+                self._append(({'op': 'compact', 'snapshot': file_signature(tmp_filename)},))
+            os.replace(tmp_filename, self.filename)
+            with open(self.journal_filename, 'w'):
+                pass
+            self.journal_records = 0
+
+
+class IdAllocator:
+    """
+    Класс IdAllocator выдает id новых книг. Файл счетчика хранит следующий свободный id.
+    Под блокировкой файла резервируется сразу блок id, дальше они выдаются из памяти без обращения к диску,
+    поэтому несколько процессов, добавляющих книги одновременно, никогда не получат одинаковый id.
+    Размер блока удваивается с каждым резервированием (1, 2, 4, ... до max_block): при ручном добавлении
+    id идут подряд, а при массовой загрузке обращения к файлу редки. Невыданный остаток блока при выходе теряется.
+    Описание методов класса:
+    'next_id' - следующий id
+    'allocate' - список из count новых id
+    'ensure_above' - восстановление счетчика, если он отсутствует или отстает от максимального id в хранилище
+    """
+    def __init__(self, filename: str = 'counter.txt', max_block: int = 1000):
+        self.filename: str = filename
+        self.max_block: int = max_block
+        self._block: int = 1
+        self._next: int = 0
+        self._end: int = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _counter(self) -> Iterator[int]: # открывает файл счетчика под исключительной блокировкой
+        fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            with locked(fd):
+                yield fd
+        finally:
+            os.close(fd)
+
+    def _reserve(self, count: int) -> None: # резервирует в файле блок не меньше count id
+        size = max(count, self._block)
+        with self._counter() as fd:
+            start = max(read_int(fd, 1), 1)
+            write_int(fd, start + size)
+        self._next, self._end = start, start + size
+        self._block = min(self._block * 2, self.max_block)
+
+    def next_id(self) -> int:
+        with self._lock:
+            if self._next >= self._end:
+                self._reserve(1)
+            self._next += 1
+            return self._next - 1
+
+    def allocate(self, count: int) -> List[int]:
+        with self._lock:
+            ids = list(range(self._next, min(self._end, self._next + count)))
+            self._next += len(ids)
+            if len(ids) < count:
+                self._reserve(count - len(ids))
+                ids.extend(range(self._next, self._next + count - len(ids)))
+                self._next = ids[-1] + 1
+            return ids
+
+    def ensure_above(self, max_id: int) -> None: # гарантирует, что следующие id будут больше max_id
+        with self._lock:
+            if self._next > max_id:
+                return
+            with self._counter() as fd:
+                if read_int(fd, 1) <= max_id:
+                    write_int(fd, max_id + 1)
+            self._next = self._end = 0
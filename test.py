@@ -1,10 +1,50 @@
-from main import Book, Library, LibraryManagement
+from main import Book, Catalogue, Library, LibraryManagement, main
+from storage import JournalStorage, JsonStorage, IdAllocator, file_signature, iter_json_array, iter_records, write_json_atomic
+from sqlite_library import SqliteLibrary, migrate_from_json
+from search import SearchIndex, normalize, paginate
+from catalogue_io import import_catalogue, export_catalogue
+from server import LibraryService, send_request
+from circulation import BookStatus, Circulation, Loan, LoanTable
+from persistence import SaveScheduler
+from instrumentation import Instrumentation
+from binary_storage import BinaryCatalogue, BinaryStorage, binary_to_json, json_to_binary, write_binary
+from bench import compare_results, generate_realistic_catalogue
+from datetime import date
+import asyncio
 import unittest
 from unittest.mock import patch, mock_open
-from datetime import datetime
 import os
+import io
+import contextlib
+import json
+import tempfile
+import multiprocessing
+import time
+import threading
+import tracemalloc
+import signal
+import subprocess
+import sys
 
-class TestBook(unittest.TestCase):
+class TempDirTestCase(unittest.TestCase):
+    """
+    Базовый класс тестов: временный каталог self.tmp и временный файл счетчика id, чтобы тесты не трогали counter.txt.
+    Тест выполняется во временном каталоге, поэтому файлы блокировки библиотеки по умолчанию создаются там же.
+    """
+    def setUp(self): # id новых книг выдаются из временного файла счетчика, начиная с 1
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        self.id_allocator = Book.id_allocator
+        Book.id_allocator = IdAllocator(os.path.join(self.tmp.name, 'counter.txt'))
+
+    def tearDown(self):
+        Book.id_allocator = self.id_allocator
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+
+class TestBook(TempDirTestCase):
     """
     Тестирование класса Book: инициализации создаваемого объекта и считываемого из файла, 
     проверка присваеваемых значений в поля, преобразование объекта book в словарь и из словаря в объект book
@@ -44,11 +84,11 @@ class TestBook(unittest.TestCase):
         with self.assertRaises(ValueError): # тестирование присваемого статуса книги, который не является допустимым
             book = Book(title="Название", author="Автор", id=5, year="2000", status="другой статус")
 
-    @patch('builtins.open', new_callable=mock_open)
-    def test_get_id_counter(self, mock_file): # тестирование получения id_counter из файла. Возвращаемое значение должно быть на единицу больше прочитанного
-        mock_file.return_value.read.return_value = '2'
-        new_id = Book.get_id_counter()
-        self.assertEqual(new_id, 2)
+    def test_get_id_counter(self): # тестирование получения id_counter из файла. Следующий вызов возвращает значение на единицу больше
+        with open(Book.id_allocator.filename, 'w') as f:
+            f.write('2')
+        self.assertEqual(Book.get_id_counter(), 2)
+        self.assertEqual(Book.get_id_counter(), 3)
 
     def test_to_dict(self):  #тестирование преобразования объекта book  в словарь
         book = Book(title="Название", author="Автор", id=5, year="2000")
@@ -76,12 +116,25 @@ class TestBook(unittest.TestCase):
         self.assertEqual(book.year, "2000")
         self.assertEqual(book.status, 'в наличии')
 
+    def test_from_dict_trusted(self): # доверенная загрузка создает такую же книгу без валидации полей
+        data = {'id': 1, 'title': "Название", 'author': "Автор", 'year': "2000", 'status': 'в наличии'}
+        self.assertEqual(Book.from_dict(data, trusted=True).to_dict(), Book.from_dict(data).to_dict())
+        with self.assertRaises(ValueError):
+            Book.from_dict(dict(data, year="3000"))
+
+    def test_compact_representation(self): # книга хранится без словаря атрибутов, повторяющиеся строки разделяются
+        book1 = Book.from_dict({'id': 1, 'title': "Первая", 'author': "".join(["Ав", "тор"]), 'year': "2000", 'status': 'выдана'})
+        book2 = Book("Вторая", "".join(["Авт", "ор"]), "2000", id=2, status="выдана")
+        self.assertFalse(hasattr(book1, '__dict__'))
+        self.assertIs(book1.author, book2.author)
+        self.assertIs(book1.status, book2.status)
+
     def test_str_method(self): # тестирование преобразования объекта Book в строку
         book = Book(title="Название", author="Автор", id=5, year="2000")
         expected_str = f"id: {book.id}\nНазвание: Название\nАвтор: Автор\nГод издания: 2000\nСтатус: в наличии\n"
         self.assertEqual(str(book), expected_str)
 
-class TestLibrary(unittest.TestCase):
+class TestLibrary(TempDirTestCase):
     """
     Тестирование методов класса Library с использованием подмены чтения и записи данных в файловой системе.
     """
@@ -104,6 +157,15 @@ class TestLibrary(unittest.TestCase):
         mock_save.assert_called_once() 
         mock_print.assert_called_once_with("Книга \"Название\" успешно сохранена", end='\n\n')
 
+    @patch('builtins.print')
+    def test_add_book_without_counter(self, mock_print): # без файла счетчика новая книга не получает id книги из каталога
+        filename = os.path.join(self.tmp.name, 'library.json')
+        write_json_atomic(filename, [{'id': id, 'title': f"Книга {id}", 'author': "Автор", 'year': "2000",
+                                      'status': 'в наличии'} for id in (1, 2, 3)])
+        Library(filename).add_book("Новая", "Автор", "2001")
+        self.assertEqual([(book.id, book.title) for book in Library(filename).iter_books()],
+                         [(1, "Книга 1"), (2, "Книга 2"), (3, "Книга 3"), (4, "Новая")])
+
     @patch('builtins.print')
     @patch.object(Library, 'save_list_book')
     @patch.object(Library, 'load_from_file_list_book')
@@ -174,7 +236,7 @@ class TestLibrary(unittest.TestCase):
     def test_print_list_books(self, mock_open, mock_load, mock_save, mock_print): # тестирование вывода списка книг в терминал
         library = Library()
         new_book1 = Book("Название1", "Автор1", "2000")
-        new_book2 = Book("Название2", "Автор2", "2000")
+        new_book2 = Book("Название2", "Автор2", "2000", id=2)
         library.books.append(new_book1)
         library.books.append(new_book2)
         library.print_list_books()
@@ -193,5 +255,1122 @@ class TestLibrary(unittest.TestCase):
         mock_print.assert_called_once_with('В библиотеке нет книг', end='\n\n')
 
 
+def allocate_ids(filename, count, queue): # выдает count id в отдельном процессе
+    allocator = IdAllocator(filename, max_block=8)
+    queue.put([allocator.next_id() for _ in range(count)])
+
+
+class TestIdAllocator(unittest.TestCase):
+    """
+    Тестирование выдачи id блоками: рост блоков, массовая выдача, восстановление счетчика и работа нескольких процессов.
+    """
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, 'counter.txt')
+        self.allocator = IdAllocator(self.filename, max_block=4)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read_counter(self):
+        with open(self.filename) as f:
+            return int(f.read())
+
+    def test_blocks_grow_up_to_max_block(self): # файл счетчика хранит конец зарезервированного блока
+        self.assertEqual([self.allocator.next_id() for _ in range(3)], [1, 2, 3])
+        self.assertEqual(self.read_counter(), 4)
+        self.allocator.next_id()
+        self.assertEqual(self.read_counter(), 8)
+        self.assertEqual([self.allocator.next_id() for _ in range(8)], list(range(5, 13)))
+        self.assertEqual(self.read_counter(), 16)
+
+    def test_allocate_many(self): # массовая выдача резервирует недостающие id одним блоком
+        self.allocator.next_id()
+        self.assertEqual(self.allocator.allocate(100), list(range(2, 102)))
+        self.assertEqual(self.read_counter(), 102)
+
+    def test_ensure_above_repairs_stale_counter(self): # счетчик, отстающий от хранилища, переставляется за максимальный id
+        self.allocator.ensure_above(41)
+        self.assertEqual(self.allocator.next_id(), 42)
+        self.allocator.ensure_above(10)
+        self.assertEqual(self.allocator.next_id(), 43)
+
+    def test_concurrent_processes_get_unique_ids(self): # несколько процессов не получают одинаковых id
+        queue = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=allocate_ids, args=(self.filename, 200, queue)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        ids = [id for _ in processes for id in queue.get(timeout=30)]
+        for process in processes:
+            process.join()
+        self.assertEqual(len(ids), len(set(ids)))
+
+
+class TestCatalogue(unittest.TestCase):
+    """
+    Тестирование каталога книг с индексами по id, title, author и year.
+    """
+    def setUp(self):
+        self.book1 = Book("Название", "Автор", "2000", id=1)
+        self.book2 = Book("Другое", "Автор", "2001", id=2)
+        self.catalogue = Catalogue([self.book1, self.book2])
+
+    def test_get_and_find(self): # поиск по id и по точному значению поля
+        self.assertIs(self.catalogue.get(2), self.book2)
+        self.assertIsNone(self.catalogue.get(3))
+        self.assertEqual({book.id for book in self.catalogue.find('author', "Автор")}, {1, 2})
+        self.assertEqual(self.catalogue.find('year', "2001"), [self.book2])
+        self.assertEqual(self.catalogue.find('title', "Нет такой"), [])
+
+    def test_remove_updates_indexes(self): # удаленная книга пропадает из всех индексов
+        self.assertIs(self.catalogue.remove(1), self.book1)
+        self.assertIsNone(self.catalogue.remove(1))
+        self.assertEqual(self.catalogue.find('title', "Название"), [])
+        self.assertEqual(self.catalogue.find('author', "Автор"), [self.book2])
+        self.assertEqual(len(self.catalogue), 1)
+
+    def test_update_reindexes_book(self): # изменение поля переносит книгу в индексе
+        self.catalogue.update(1, title="Новое название")
+        self.assertEqual(self.catalogue.find('title', "Название"), [])
+        self.assertEqual(self.catalogue.find('title', "Новое название"), [self.book1])
+        with self.assertRaises(ValueError):
+            self.catalogue.update(1, year="abc")
+
+    def test_sequence_access(self): # доступ по порядковому номеру в порядке добавления
+        self.assertIs(self.catalogue[0], self.book1)
+        self.assertIs(self.catalogue[-1], self.book2)
+        with self.assertRaises(IndexError):
+            self.catalogue[2]
+
+    def test_page_follows_changes(self): # отсортированные страницы обновляются при добавлении, изменении и удалении книг
+        self.assertEqual(list(self.catalogue.page(0, 10, 'title')), [self.book2, self.book1])
+        self.assertEqual(list(self.catalogue.page(0, 10, 'id', 'выдана')), [])
+        book3 = Book("азбука", "Автор", "1999", id=3)
+        self.catalogue.append(book3)
+        self.catalogue.update(1, status='выдана')
+        self.assertEqual(list(self.catalogue.page(0, 10, 'title')), [book3, self.book2, self.book1])
+        self.assertEqual(list(self.catalogue.page(1, 1, 'year')), [self.book1])
+        self.assertEqual(list(self.catalogue.page(0, 10, 'id', 'выдана')), [self.book1])
+        self.assertEqual(self.catalogue.count('в наличии'), 2)
+        self.catalogue.remove(2)
+        self.assertEqual(list(self.catalogue.page(0, 10, 'title', 'в наличии')), [book3])
+        with self.assertRaises(ValueError):
+            self.catalogue.page(0, 10, 'status')
+
+
+    def test_duplicate_id(self): # append не заменяет книгу с тем же id, замена выполняется только через replace
+        duplicate = Book("Чужая", "Другой автор", "2002", id=1)
+        with self.assertRaises(ValueError):
+            self.catalogue.append(duplicate)
+        self.assertIs(self.catalogue.get(1), self.book1)
+        self.assertIs(self.catalogue.replace(duplicate), self.book1)
+        self.assertEqual(self.catalogue.find('title', "Название"), [])
+        self.assertEqual(self.catalogue.find('author', "Другой автор"), [duplicate])
+        self.assertEqual(len(self.catalogue), 2)
+
+class TestSearch(unittest.TestCase):
+    """
+    Тестирование полнотекстового поиска: нормализация слов, поиск по префиксу, несколько слов в запросе и ранжирование.
+    """
+    def setUp(self):
+        self.catalogue = Catalogue([
+            Book("Горе от ума", "Александр Грибоедов", "1825", id=1),
+            Book("Ёлка", "Иван Петров", "1990", id=2),
+            Book("Грибоедов и его время", "Иван Петров", "1990", id=3),
+        ])
+
+    def search_ids(self, query):
+        return [book.id for book in self.catalogue.search(query)]
+
+    def test_normalize(self): # регистр, буква ё и латинские буквы внутри кириллического слова
+        self.assertEqual(normalize("ГРИБОЕДОВ"), "грибоедов")
+        self.assertEqual(normalize("Ёлка"), "елка")
+        self.assertEqual(normalize("Гpибоедов"), "грибоедов")
+        self.assertEqual(normalize("Tolstoy"), "tolstoy")
+
+    def test_word_and_prefix_search(self): # поиск по слову и по началу слова
+        self.assertEqual(self.search_ids("Грибоедов"), [3, 1])
+        self.assertEqual(self.search_ids("гриб"), [3, 1])
+        self.assertEqual(self.search_ids("елка"), [2])
+        self.assertEqual(self.search_ids("1825"), [1])
+        self.assertEqual(self.search_ids("Толстой"), [])
+
+    def test_all_terms_must_match(self): # в результат попадают книги, содержащие все слова запроса
+        self.assertEqual(self.search_ids("грибоедов горе"), [1])
+        self.assertEqual(self.search_ids("петров гриб"), [3])
+        self.assertEqual(self.search_ids("петров горе"), [])
+
+    def test_index_follows_changes(self): # индекс обновляется при добавлении, удалении и переименовании книг
+        self.search_ids("горе")
+        self.catalogue.update(1, title="Война и мир")
+        self.assertEqual(self.search_ids("горе"), [])
+        self.assertEqual(self.search_ids("война"), [1])
+        self.catalogue.remove(3)
+        self.assertEqual(self.search_ids("грибоедов"), [1])
+        self.catalogue.append(Book("Горе и радость", "Автор", "2000", id=4))
+        self.assertEqual(self.search_ids("горе"), [4])
+
+    def test_paginate(self): # разбиение результатов на страницы
+        self.assertEqual(list(paginate(range(5), 2)), [[0, 1], [2, 3], [4]])
+        index = SearchIndex()
+        for id in range(50):
+            index.add(id, title=f"Книга {id}")
+        self.assertEqual(len(next(paginate(index.search("книга"), 10))), 10)
+
+
+class TestLibraryResident(TempDirTestCase):
+    """
+    Тестирование резидентного режима: файл библиотеки разбирается один раз и перечитывается только при изменении извне.
+    """
+    def setUp(self):
+        super().setUp()
+        self.library = Library(filename=os.path.join(self.tmp.name, 'library.json'))
+        with open(self.library.filename, 'w') as f:
+            json.dump([{'id': 1, 'title': "Название", 'author': "Автор", 'year': "2000", 'status': 'в наличии'}], f)
+
+    def test_load_skips_unchanged_file(self): # повторная загрузка неизмененного файла не разбирает его заново
+        self.library.load_from_file_list_book()
+        with patch.object(Book, 'from_dict') as mock_from_dict:
+            self.library.load_from_file_list_book()
+            mock_from_dict.assert_not_called()
+        self.assertEqual(len(self.library.books), 1)
+
+    @patch('builtins.print')
+    def test_own_save_does_not_trigger_reload(self, mock_print): # после собственного сохранения файл не перечитывается
+        self.library.change_book_status("1", "выдана")
+        with patch.object(Book, 'from_dict') as mock_from_dict:
+            self.library.load_from_file_list_book()
+            mock_from_dict.assert_not_called()
+        self.assertEqual(self.library.books[0].status, "выдана")
+
+    @patch('builtins.print')
+    def test_first_change_does_not_trigger_reload(self, mock_print): # первое изменение после загрузки не перечитывает файл
+        self.library.load_from_file_list_book()
+        with patch.object(Book, 'from_dict') as mock_from_dict:
+            self.library.change_book_status("1", "выдана")
+            mock_from_dict.assert_not_called()
+        self.assertEqual(self.library.books[0].status, "выдана")
+
+    def test_external_change_triggers_reload(self): # изменение файла извне приводит к повторной загрузке
+        self.library.load_from_file_list_book()
+        with open(self.library.filename, 'w') as f:
+            json.dump([{'id': 2, 'title': "Другое", 'author': "Автор", 'year': "2001", 'status': 'выдана'},
+                       {'id': 3, 'title': "Третья", 'author': "Автор", 'year': "2002", 'status': 'выдана'}], f)
+        self.library.load_from_file_list_book()
+        self.assertEqual([book.id for book in self.library.books], [2, 3])
+
+    def test_load_memory_and_time_are_bounded(self): # память на книгу ограничена, доверенная загрузка заметно быстрее проверяемой
+        max_bytes_per_book, max_trusted_share, count = 400, 0.45, 2000 # сейчас около 250 байт и 0.3 времени проверяемой загрузки
+        records = list(generate_realistic_catalogue(count, seed=1))
+        write_json_atomic(self.library.filename, records)
+        tracemalloc.start()
+        try:
+            self.library.load_from_file_list_book(force=True)
+            traced = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(self.library.books), count)
+        self.assertLess(traced / count, max_bytes_per_book)
+
+        def materialize(trusted): # лучшее из трех время создания книг из записей хранилища
+            best = float('inf')
+            for _ in range(3):
+                start = time.perf_counter()
+                for record in records:
+                    Book.from_dict(record, trusted)
+                best = min(best, time.perf_counter() - start)
+            return best
+        self.assertLess(materialize(True), materialize(False) * max_trusted_share)
+
+
+class TestJournalStorage(TempDirTestCase):
+    """
+    Тестирование хранилища с журналом изменений: дозапись, восстановление после сбоя и сворачивание в снимок.
+    """
+    def setUp(self):
+        super().setUp()
+        self.filename = os.path.join(self.tmp.name, 'library.json')
+        with open(self.filename, 'w') as f:
+            json.dump([{'id': 1, 'title': "Название", 'author': "Автор", 'year': "2000", 'status': 'в наличии'}], f)
+        self.storage = JournalStorage(self.filename, compact_threshold=3)
+
+    def test_changes_are_appended_and_replayed(self): # изменения не трогают снимок и восстанавливаются при загрузке
+        with open(self.filename) as f:
+            snapshot = f.read()
+        self.storage.save([], ({'op': 'status', 'id': 1, 'status': 'выдана'},))
+        self.storage.save([], ({'op': 'add', 'book': {'id': 2, 'title': "Другое", 'author': "Автор",
+                                                      'year': "2001", 'status': 'в наличии'}},))
+        with open(self.filename) as f:
+            self.assertEqual(f.read(), snapshot)
+        records = JournalStorage(self.filename).load()
+        self.assertEqual([(r['id'], r['status']) for r in records], [(1, 'выдана'), (2, 'в наличии')])
+
+    def test_torn_last_line_is_discarded(self): # недописанная последняя строка журнала отбрасывается при чтении и обрезается при записи
+        self.storage.save([], ({'op': 'remove', 'id': 1},))
+        with open(self.storage.journal_filename, 'a') as f:
+            f.write('{"op": "add", "bo')
+        self.assertEqual(self.storage.load(), [])
+        self.storage.save([], ({'op': 'remove', 'id': 2},))
+        with open(self.storage.journal_filename) as f:
+            self.assertEqual(f.read(), '{"op": "remove", "id": 1}\n{"op": "remove", "id": 2}\n')
+
+    def test_repair_tail_reads_only_torn_part(self): # целый журнал не перечитывается, длинный обрывок обрезается по блокам
+        self.storage.save([], ({'op': 'remove', 'id': 1},))
+        reads = []
+
+        def recording_open(*args, **kwargs): # открывает файл и запоминает размеры прочитанных блоков
+            f = open(*args, **kwargs)
+            read = f.read
+            f.read = lambda size=-1: reads.append(size) or read(size)
+            return f
+        with patch('storage.open', side_effect=recording_open, create=True):
+            self.storage._repair_tail()
+        self.assertEqual(reads, [1])
+        with open(self.storage.journal_filename, 'a') as f:
+            f.write('{"op": "add", "book": {"title": "Недописанная')
+        with patch('storage.READ_CHUNK_SIZE', 4):
+            self.storage._repair_tail()
+        with open(self.storage.journal_filename) as f:
+            self.assertEqual(f.read(), '{"op": "remove", "id": 1}\n')
+
+    @patch('builtins.print')
+    def test_journal_is_compacted_past_threshold(self, mock_print): # журнал сворачивается в снимок после compact_threshold записей
+        library = Library(storage=self.storage)
+        for _ in range(3):
+            library.change_book_status("1", "выдана")
+        self.assertEqual(os.path.getsize(self.storage.journal_filename), 0)
+        with open(self.filename) as f:
+            self.assertEqual(json.load(f)[0]['status'], 'выдана')
+
+    def test_compaction_during_read_is_retried(self): # снимок, подмененный сворачиванием во время чтения журнала, читается заново
+        record = {'id': 1, 'title': "Название", 'author': "Автор", 'year': "2000", 'status': 'в наличии'}
+        self.storage.save([], ({'op': 'add', 'book': dict(record, id=2)},))
+        writer = JournalStorage(self.filename)
+        read_journal = self.storage._read_journal
+
+        def read_then_compact(snapshot): # другой процесс удаляет книгу и сворачивает журнал сразу после чтения журнала
+            changes = read_journal(snapshot)
+            if os.path.getsize(self.storage.journal_filename):
+                writer.save([], ({'op': 'remove', 'id': 2},))
+                writer.compact([record])
+            return changes
+
+        for read in (self.storage.load, lambda: list(self.storage.iter_records())):
+            self.storage.save([], ({'op': 'add', 'book': dict(record, id=2)},))
+            with patch.object(self.storage, '_read_journal', side_effect=read_then_compact):
+                self.assertEqual(read(), [record])
+
+    def test_journal_folded_into_snapshot_is_skipped(self): # записи до отметки сворачивания уже входят в снимок и не применяются повторно
+        self.storage.save([], ({'op': 'status', 'id': 1, 'status': 'выдана'},))
+        with open(self.storage.journal_filename) as f:
+            stale = f.read()
+        self.storage.compact([{'id': 1, 'title': "Название", 'author': "Автор", 'year': "2000", 'status': 'в наличии'}])
+        with open(self.storage.journal_filename, 'w') as f: # сбой между подменой снимка и очисткой журнала
+            f.write(stale + json.dumps({'op': 'compact', 'snapshot': file_signature(self.filename)}) + '\n')
+        self.assertEqual(self.storage.load()[0]['status'], 'в наличии')
+        self.assertEqual(next(self.storage.iter_records())['status'], 'в наличии')
+        self.storage.save([], ({'op': 'status', 'id': 1, 'status': 'выдана'},))
+        self.assertEqual(self.storage.load()[0]['status'], 'выдана')
+
+
+class TestStreaming(TempDirTestCase):
+    """
+    Тестирование потокового чтения каталога из json-массива и JSON Lines.
+    """
+    def setUp(self):
+        super().setUp()
+        self.records = [{'id': 1, 'title': "Горе от ума", 'author': "Александр Грибоедов", 'year': "1825", 'status': 'в наличии'},
+                        {'id': 2, 'title': "Скобки ]}[{", 'author': "Автор", 'year': "2000", 'status': 'выдана'}]
+        self.filename = os.path.join(self.tmp.name, 'library.json')
+        with open(self.filename, 'w') as f:
+            json.dump(self.records, f, indent=4)
+
+    def test_iter_json_array_small_chunks(self): # элементы массива разбираются по одному при любом размере блока
+        for chunk_size in (1, 5, 1000):
+            with open(self.filename) as f:
+                self.assertEqual(list(iter_json_array(f, chunk_size)), self.records)
+        with self.assertRaises(json.JSONDecodeError):
+            list(iter_json_array(io.StringIO('[{"id": 1},'), 4))
+
+    def test_iter_json_lines(self): # файл JSON Lines читается через отображение в память
+        filename = os.path.join(self.tmp.name, 'library.jsonl')
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in self.records))
+        self.assertEqual(list(iter_records(filename)), self.records)
+
+    def test_journal_iter_records_matches_load(self): # поток из снимка и журнала совпадает с полной загрузкой
+        storage = JournalStorage(self.filename)
+        storage.save([], ({'op': 'status', 'id': 1, 'status': 'выдана'}, {'op': 'remove', 'id': 2},
+                          {'op': 'add', 'book': dict(self.records[1], id=3)}))
+        self.assertEqual(list(storage.iter_records()), storage.load())
+
+    @patch('builtins.print')
+    def test_streaming_print_and_search(self, mock_print): # вывод и поиск без загрузки каталога в память
+        library = Library(self.filename)
+        with patch.object(Library, 'load_from_file_list_book') as mock_load:
+            library.print_list_books(streaming=True)
+            library.search_book("гриб", streaming=True)
+            mock_load.assert_not_called()
+        printed = [call.args[0].id for call in mock_print.call_args_list if isinstance(call.args[0], Book)]
+        self.assertEqual(printed, [1, 2, 1])
+        self.assertEqual(len(library.books), 0)
+
+
+class TestSqliteLibrary(TempDirTestCase):
+    """
+    Тестирование библиотеки на SQLite: перенос каталога из json и операции над отдельными строками базы.
+    """
+    def setUp(self):
+        super().setUp()
+        json_filename = os.path.join(self.tmp.name, 'library.json')
+        with open(json_filename, 'w') as f:
+            json.dump([{'id': 1, 'title': "Название", 'author': "Автор", 'year': "2000", 'status': 'в наличии'},
+                       {'id': 2, 'title': "Другое", 'author': "Автор", 'year': "2001", 'status': 'выдана'}], f)
+        self.db_filename = os.path.join(self.tmp.name, 'library.db')
+        self.assertEqual(migrate_from_json(json_filename, self.db_filename), 2)
+        self.library = SqliteLibrary(self.db_filename)
+
+    def tearDown(self):
+        self.library.close()
+        super().tearDown()
+
+    def test_indexes_exist(self): # проверка наличия индексов по полям поиска
+        indexes = {row[0] for row in self.library.connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertTrue({'books_title', 'books_author', 'books_year'} <= indexes)
+
+    @patch('builtins.print')
+    def test_search_book(self, mock_print): # поиск по словам и началам слов, как в Library.search_book
+        self.library.search_book("Автор")
+        self.assertEqual([call.args[0].id for call in mock_print.call_args_list], [1, 2])
+        mock_print.reset_mock()
+        self.library.search_book("друг")
+        self.assertEqual([call.args[0].id for call in mock_print.call_args_list], [2])
+
+    @patch('builtins.print')
+    @patch.object(Book, 'get_id_counter', return_value=3)
+    def test_find_books(self, mock_counter, mock_print): # поиск по словам и началам слов, как в Library.find_books
+        self.library.add_book("Война и мир", "Лев Толстой", "1869")
+        self.assertEqual([[book.id for book in page] for page in self.library.find_books("Война")], [[3]])
+        self.assertEqual([[book.id for book in page] for page in self.library.find_books("толст войн")], [[3]])
+        self.assertEqual([[book.id for book in page] for page in self.library.find_books("автор", page_size=1)], [[1], [2]])
+        self.assertEqual(list(self.library.find_books("Пушкин")), [])
+        self.assertEqual([[book.id for book in page] for page in self.library.find_books("ВОЙНА лeв")], [[3]])
+        first, second = self.library.find_books("автор", page_size=1), self.library.find_books("другое")
+        self.assertEqual([book.id for book in next(first)], [1])
+        self.assertEqual([book.id for book in next(second)], [2])
+        self.library.remove_book("3")
+        self.assertEqual(list(self.library.find_books("война")), [])
+
+    def test_change_statuses_and_counts(self): # статусы нескольких книг меняются одной транзакцией
+        self.assertEqual(self.library.count_books('выдана', "Автор"), 1)
+        self.library.change_statuses({1: 'выдана', 2: 'в наличии'})
+        self.assertEqual([book.id for book in self.library.available_books("Автор")], [2])
+        with self.assertRaises(ValueError):
+            self.library.change_statuses({1: 'в наличии', 3: 'выдана'})
+        self.assertEqual(self.library._get_book(1).status, 'выдана')
+
+    def test_list_books(self): # страницы упорядочены по полю и отбираются по статусу
+        self.assertEqual([book.id for book in self.library.list_books(0, 10, 'title')], [2, 1])
+        self.assertEqual([book.id for book in self.library.list_books(0, 10, 'id', 'выдана')], [2])
+        self.assertEqual(self.library.count_books('в наличии'), 1)
+
+    @patch('builtins.print')
+    def test_change_book_status(self, mock_print): # изменение статуса сохраняется в базе
+        self.library.change_book_status("1", "выдана")
+        self.assertEqual(self.library._get_book(1).status, "выдана")
+        with self.assertRaises(ValueError):
+            self.library.change_book_status("1", "другой статус")
+
+    @patch('builtins.print')
+    @patch.object(Book, 'get_id_counter', return_value=3)
+    def test_add_and_remove_book(self, mock_counter, mock_print): # добавление и удаление книги
+        self.library.add_book("Новая", "Автор", "2010")
+        self.assertEqual(self.library._get_book(3).title, "Новая")
+        self.library.remove_book("3")
+        self.assertIsNone(self.library._get_book(3))
+        with self.assertRaises(ValueError):
+            self.library.remove_book("3")
+
+    @patch('builtins.print')
+    @patch.object(Book, 'get_id_counter', side_effect=[3, 4, 5])
+    def test_batch(self, mock_counter, mock_print): # операции блока фиксируются одной транзакцией, при ошибке отменяются
+        other = SqliteLibrary(self.db_filename)
+        self.addCleanup(other.close)
+        with self.library.batch():
+            self.library.add_book("Новая", "Автор", "2010")
+            self.library.change_book_status("1", "выдана")
+            self.assertIsNone(other._get_book(3))
+        self.assertEqual(other._get_book(3).title, "Новая")
+        with self.assertRaises(ValueError):
+            with self.library.batch():
+                self.library.remove_book("3")
+                self.library.remove_book("9")
+        self.assertEqual(self.library._get_book(3).title, "Новая")
+        self.assertEqual(self.library._get_book(1).status, "выдана")
+
+    @patch('builtins.print')
+    def test_add_book_after_migration(self, mock_print): # после переноса каталога счетчик id не отстает от id в базе
+        self.library.add_book("Новая", "Автор", "2010")
+        self.assertEqual([book.id for book in self.library.iter_books()], [1, 2, 3])
+
+    def test_iter_books(self): # книги читаются из базы по одной в порядке id
+        books = self.library.iter_books()
+        self.assertEqual(next(books).id, 1)
+        self.assertEqual([book.title for book in books], ["Другое"])
+
+    @patch('builtins.print')
+    def test_add_books(self, mock_print): # книги добавляются одной транзакцией после уже имеющихся id
+        rejected = []
+        rows = [{'title': "Новая", 'author': "Автор", 'year': 2010}, {'title': "", 'author': "Автор"}]
+        self.assertEqual(self.library.add_books(rows, on_reject=lambda row, e: rejected.append(row)), 1)
+        self.assertEqual(rejected, [rows[1]])
+        self.assertEqual(self.library._get_book(3).title, "Новая")
+        with self.assertRaises(ValueError):
+            self.library.add_books([{'title': "Еще одна", 'author': "Автор", 'year': "2011"}, {'title': "Книга"}])
+        self.assertEqual(self.library.count_books(), 3)
+
+
+class TestBulkImport(TempDirTestCase):
+    """
+    Тестирование массового добавления книг, импорта и экспорта в форматах CSV и JSON Lines.
+    """
+    def setUp(self):
+        super().setUp()
+        self.library = Library(filename=os.path.join(self.tmp.name, 'library.json'))
+        self.csv_filename = os.path.join(self.tmp.name, 'books.csv')
+        with open(self.csv_filename, 'w', encoding='utf-8') as f:
+            f.write("title,author,year\nГоре от ума,Александр Грибоедов,1825\n,Без названия,2000\nЕлка,Иван Петров,1990\n")
+
+    @patch('builtins.print')
+    def test_add_books_saves_once(self, mock_print): # все книги сохраняются одной записью в хранилище
+        rows = [{'title': f"Книга {number}", 'author': "Автор", 'year': 2000} for number in range(2500)]
+        with patch.object(self.library.storage, 'save', wraps=self.library.storage.save) as mock_save:
+            self.assertEqual(self.library.add_books(rows), 2500)
+            mock_save.assert_called_once()
+        self.assertEqual([book.id for book in self.library.books], list(range(1, 2501)))
+
+    @patch('builtins.print')
+    def test_add_books_peak_memory_is_bounded(self, mock_print): # без планировщика изменения по книгам не копятся рядом с каталогом
+        max_bytes_per_book, count = 450, 5000 # сейчас около 270 байт; со словарем изменения на книгу было около 650
+        rows = ({key: value for key, value in record.items() if key != 'id'} for record in generate_realistic_catalogue(count, seed=1))
+        tracemalloc.start()
+        try:
+            with patch.object(self.library.storage, 'save'):
+                self.library.add_books(rows)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(self.library.books), count)
+        self.assertLess(peak / count, max_bytes_per_book)
+
+    @patch('builtins.print')
+    def test_add_books_without_handler_rolls_back(self, mock_print): # без обработчика некорректная запись отменяет добавление
+        with self.assertRaises(ValueError):
+            self.library.add_books([{'title': "Книга", 'author': "Автор", 'year': "2000"}, {'title': "Книга"}])
+        self.assertEqual(len(self.library.books), 0)
+
+    @patch('builtins.print')
+    def test_import_csv_with_rejects(self, mock_print): # некорректные строки попадают в файл отклоненных записей
+        rejects_filename = os.path.join(self.tmp.name, 'rejects.jsonl')
+        self.assertEqual(import_catalogue(self.library, self.csv_filename, rejects_filename), (2, 1))
+        self.assertEqual([book.title for book in self.library.books], ["Горе от ума", "Елка"])
+        with open(rejects_filename, encoding='utf-8') as f:
+            reject = json.loads(f.readline())
+        self.assertEqual(reject['row']['author'], "Без названия")
+
+    @patch('builtins.print')
+    def test_export_and_import_jsonl(self, mock_print): # выгруженный каталог загружается в другую библиотеку
+        import_catalogue(self.library, self.csv_filename)
+        jsonl_filename = os.path.join(self.tmp.name, 'books.jsonl')
+        self.assertEqual(export_catalogue(self.library, jsonl_filename), 2)
+        other = Library(filename=os.path.join(self.tmp.name, 'other.json'))
+        self.assertEqual(import_catalogue(other, jsonl_filename), (2, 0))
+        self.assertEqual([book.author for book in other.books], ["Александр Грибоедов", "Иван Петров"])
+
+
+def add_books_in_process(filename, counter_filename, journal, count): # добавляет count книг в отдельном процессе
+    Book.id_allocator = IdAllocator(counter_filename)
+    library = Library(storage=JournalStorage(filename) if journal else JsonStorage(filename))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for number in range(count):
+            library.add_book(f"Книга {os.getpid()} {number}", "Автор", "2000")
+
+
+def change_statuses_in_process(filename, journal, ids): # выдает книги с id из ids в отдельном процессе
+    library = Library(storage=JournalStorage(filename, compact_threshold=10) if journal else JsonStorage(filename))
+    with contextlib.redirect_stdout(io.StringIO()):
+        for id in ids:
+            library.change_book_status(str(id), "выдана")
+
+
+class TestConcurrency(TempDirTestCase):
+    """
+    Тестирование одновременной работы нескольких процессов с одним файлом библиотеки: ни одно изменение не теряется.
+    """
+    processes: int = 4
+    books_per_process: int = 25
+
+    def run_processes(self, target, args_list):
+        processes = [multiprocessing.Process(target=target, args=args) for args in args_list]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=60)
+            self.assertEqual(process.exitcode, 0)
+
+    def run_writers(self, journal):
+        filename = os.path.join(self.tmp.name, 'library.json')
+        counter_filename = os.path.join(self.tmp.name, 'counter.txt')
+        self.run_processes(add_books_in_process,
+                           [(filename, counter_filename, journal, self.books_per_process)] * self.processes)
+        return Library(storage=JournalStorage(filename) if journal else JsonStorage(filename))
+
+    def run_status_changes(self, journal): # каждый процесс выдает свои книги, id процессов чередуются
+        filename = os.path.join(self.tmp.name, 'library.json')
+        library = Library(storage=JournalStorage(filename) if journal else JsonStorage(filename))
+        count = self.processes * self.books_per_process
+        with patch('builtins.print'):
+            library.add_books({'title': f"Книга {number}", 'author': "Автор", 'year': "2000"} for number in range(count))
+        ids = [book.id for book in library.books]
+        self.run_processes(change_statuses_in_process,
+                           [(filename, journal, ids[number::self.processes]) for number in range(self.processes)])
+        statuses = {book.id: book.status for book in Library(storage=JournalStorage(filename) if journal
+                                                             else JsonStorage(filename)).iter_books()}
+        self.assertEqual(statuses, dict.fromkeys(ids, "выдана"))
+
+    def assert_no_lost_books(self, library):
+        library.load_from_file_list_book()
+        ids = [book.id for book in library.books]
+        self.assertEqual(len(ids), self.processes * self.books_per_process)
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_concurrent_add_json(self): # процессы дописывают книги в общий json-файл
+        self.assert_no_lost_books(self.run_writers(journal=False))
+
+    def test_concurrent_add_journal(self): # процессы дописывают книги в общий журнал
+        self.assert_no_lost_books(self.run_writers(journal=True))
+
+    def test_concurrent_status_changes_json(self): # процессы меняют статусы разных книг в общем json-файле
+        self.run_status_changes(journal=False)
+
+    def test_concurrent_status_changes_journal(self): # то же в общем журнале со сжатием в снимок
+        self.run_status_changes(journal=True)
+
+    @patch('builtins.print')
+    def test_stale_library_reloads_before_change(self, mock_print): # изменение в другом экземпляре видно перед записью
+        first, second = Library(), Library()
+        first.add_book("Первая", "Автор", "2000")
+        second.load_from_file_list_book()
+        first.add_book("Вторая", "Автор", "2001")
+        second.change_book_status("1", "выдана")
+        self.assertEqual([(book.title, book.status) for book in Library().iter_books()],
+                         [("Первая", "выдана"), ("Вторая", "в наличии")])
+
+
+class TestListing(TempDirTestCase):
+    """
+    Тестирование постраничного вывода каталога: list_books и просмотр страниц в LibraryManagement.
+    """
+    def setUp(self):
+        super().setUp()
+        self.library = Library(filename=os.path.join(self.tmp.name, 'library.json'))
+        with patch('builtins.print'):
+            self.library.add_books({'title': f"Книга {number:02}", 'author': "Автор", 'year': "2000"}
+                                   for number in range(45, 0, -1))
+            self.library.change_book_status("1", "выдана")
+
+    def test_list_books(self): # страница книг в порядке названия и с отбором по статусу
+        self.assertEqual([book.title for book in self.library.list_books(0, 3, 'title')],
+                         ["Книга 01", "Книга 02", "Книга 03"])
+        self.assertEqual([book.id for book in self.library.list_books(40, 10)], [41, 42, 43, 44, 45])
+        self.assertEqual([book.id for book in self.library.list_books(status='выдана')], [1])
+        self.assertEqual(self.library.count_books('в наличии'), 44)
+        with self.assertRaises(ValueError):
+            self.library.list_books(0, 10, 'publisher')
+
+    @patch('builtins.print')
+    @patch('builtins.input', side_effect=['title', '', '', 'п', '', '', 'в'])
+    def test_view_books_writes_page_at_once(self, mock_input, mock_print): # каждая страница выводится одной записью
+        management = LibraryManagement()
+        management.library = self.library
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout, patch.object(stdout, 'write',
+                                                                                 wraps=stdout.write) as mock_write:
+            management.view_books_in_library()
+        pages = [call.args[0] for call in mock_write.call_args_list]
+        self.assertEqual([page.splitlines()[0] for page in pages],
+                         ["Страница 1 из 3:", "Страница 2 из 3:", "Страница 1 из 3:", "Страница 2 из 3:", "Страница 3 из 3:"])
+        self.assertEqual(pages[0].count("Название:"), 20)
+        self.assertIn("Название: Книга 45", pages[-1])
+
+
+class TestCirculation(TempDirTestCase):
+    """
+    Тестирование выдачи книг: статусы-перечисления, счетчики доступности, таблица выдач и выдача/возврат пачками.
+    """
+    def setUp(self):
+        super().setUp()
+        self.library = Library(filename=os.path.join(self.tmp.name, 'library.json'))
+        with patch('builtins.print'):
+            self.library.add_books([{'title': "Горе от ума", 'author': "Грибоедов", 'year': "1825"},
+                                    {'title': "Евгений Онегин", 'author': "Пушкин", 'year': "1833"},
+                                    {'title': "Капитанская дочка", 'author': "Пушкин", 'year': "1836"}])
+        self.circulation = Circulation(self.library)
+
+    def test_status_is_enum(self): # статус книги - значение перечисления, равное строке из файла
+        book = Book("Название", "Автор", "2000", id=1, status='Выдана')
+        self.assertIs(book.status, BookStatus.ISSUED)
+        self.assertEqual(book.to_dict()['status'], 'выдана')
+        self.assertIs(Book.from_dict(book.to_dict(), trusted=True).status, BookStatus.ISSUED)
+
+    def test_counters_follow_changes(self): # счетчики по статусам и авторам обновляются вместе с каталогом
+        self.assertEqual(self.library.count_books('в наличии', "Пушкин"), 2)
+        self.library.books.update(2, status='выдана')
+        self.assertEqual(self.library.count_books('выдана'), 1)
+        self.assertEqual([book.id for book in self.library.available_books("Пушкин")], [3])
+        self.library.books.remove(3)
+        self.assertEqual(self.library.count_books('в наличии', "Пушкин"), 0)
+        self.assertEqual(self.library.count_books(author="Пушкин"), 1)
+
+    def test_loan_table_indexes(self): # выдачи ищутся по читателю и по сроку возврата
+        loans = LoanTable([Loan(1, "Иванов", date(2024, 3, 1)), Loan(2, "Петров", date(2024, 1, 1))])
+        loans.add(Loan(3, "Иванов", date(2024, 2, 1)))
+        self.assertEqual([loan.id for loan in loans.borrowed_by("Иванов")], [3, 1])
+        self.assertEqual([loan.id for loan in loans.overdue(date(2024, 2, 15))], [2, 3])
+        self.assertEqual(loans.remove(2).borrower, "Петров")
+        self.assertEqual([loan.id for loan in loans.overdue(date(2024, 2, 15))], [3])
+
+    @patch('builtins.print')
+    def test_batch_checkout_and_checkin(self, mock_print): # выдача и возврат нескольких книг одним сохранением
+        with patch.object(Library, 'save_list_book', wraps=self.library.save_list_book) as mock_save:
+            loans = self.circulation.checkout([1, 3], "Иванов", date(2024, 1, 10))
+            mock_save.assert_called_once()
+        self.assertEqual([loan.id for loan in loans], [1, 3])
+        with self.assertRaises(ValueError):
+            self.circulation.checkout([2, 3], "Петров")
+        self.assertEqual(self.library.books.get(2).status, 'в наличии')
+        other = Circulation(Library(filename=self.library.filename))
+        self.assertEqual([loan.id for loan in other.overdue(date(2024, 1, 11))], [1, 3])
+        self.assertEqual([loan.id for loan in other.checkin([3])], [3])
+        self.assertEqual([loan.id for loan in self.circulation.borrowed_by("Иванов")], [1])
+        self.assertEqual(self.circulation.library.count_books('выдана'), 1)
+
+    @patch('builtins.print')
+    def test_loans_of_returned_books_are_dropped(self, mock_print): # выдачи книг, возвращенных в обход Circulation, отбрасываются
+        self.circulation.checkout([1, 2], "Иванов")
+        self.library.change_book_status("1", "в наличии")
+        self.assertEqual([loan.id for loan in Circulation(self.library).borrowed_by("Иванов")], [2])
+
+
+class TestSaveScheduler(TempDirTestCase):
+    """
+    Тестирование фонового сохранения: объединение изменений, уровни надежности, запись при выходе и слияние с чужими изменениями.
+    """
+    def setUp(self):
+        super().setUp()
+        self.filename = os.path.join(self.tmp.name, 'library.json')
+        self.library = Library(self.filename)
+        with patch('builtins.print'):
+            self.library.add_books([{'title': "Горе от ума", 'author': "Грибоедов", 'year': "1825"},
+                                    {'title': "Евгений Онегин", 'author': "Пушкин", 'year': "1833"}])
+
+    def statuses(self):
+        with open(self.filename) as f:
+            return [record['status'] for record in json.load(f)]
+
+    def wait_for(self, condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    @patch('builtins.print')
+    def test_async_changes_are_coalesced(self, mock_print): # изменения копятся в памяти и записываются одной записью
+        scheduler = SaveScheduler(self.library, 'async', interval=60)
+        self.library.change_book_status("1", "выдана")
+        self.library.change_book_status("2", "выдана")
+        self.assertEqual(scheduler.pending, 2)
+        self.assertEqual(self.statuses(), ['в наличии', 'в наличии'])
+        scheduler.close()
+        self.assertEqual(self.statuses(), ['выдана', 'выдана'])
+        self.assertEqual((scheduler.stats()['flushes'], scheduler.stats()['pending']), (1, 0))
+        with open(self.filename) as f:
+            self.assertNotIn('\n', f.read())
+        self.assertIsNone(self.library.scheduler)
+
+    @patch('builtins.print')
+    def test_max_pending_triggers_flush(self, mock_print): # накопление max_pending изменений запускает запись в фоне
+        scheduler = SaveScheduler(self.library, 'async', interval=60, max_pending=2)
+        self.library.change_book_status("1", "выдана")
+        self.library.change_book_status("2", "выдана")
+        self.wait_for(lambda: scheduler.flushes == 1)
+        self.assertEqual(self.statuses(), ['выдана', 'выдана'])
+        scheduler.close()
+
+    @patch('builtins.print')
+    def test_group_commit_waits_for_write(self, mock_print): # при group операция завершается после записи
+        scheduler = SaveScheduler(self.library, 'group', interval=60)
+        self.library.change_book_status("1", "выдана")
+        self.assertEqual(self.statuses(), ['выдана', 'в наличии'])
+        self.assertEqual(scheduler.pending, 0)
+        scheduler.close()
+
+    @patch('builtins.print')
+    def test_flush_merges_changes_of_other_process(self, mock_print): # чужие изменения не теряются при фоновой записи
+        scheduler = SaveScheduler(self.library, 'async', interval=60)
+        self.library.change_book_status("1", "выдана")
+        Library(self.filename).change_book_status("2", "выдана")
+        scheduler.flush()
+        self.assertEqual(self.statuses(), ['выдана', 'выдана'])
+        self.assertEqual([book.status for book in self.library.list_books()], ['выдана', 'выдана'])
+        scheduler.close()
+
+    @patch('builtins.print')
+    def test_flush_merges_added_books(self, mock_print): # книги, добавленные add_books, сливаются с чужими изменениями
+        scheduler = SaveScheduler(self.library, 'async', interval=60)
+        self.library.add_books([{'title': "Мертвые души", 'author': "Гоголь", 'year': "1842"}])
+        Library(self.filename).change_book_status("2", "выдана")
+        scheduler.flush()
+        self.assertEqual(self.statuses(), ['в наличии', 'выдана', 'в наличии'])
+        scheduler.close()
+
+    @patch('builtins.print')
+    def test_stale_full_write_is_refused(self, mock_print): # запись всего устаревшего каталога не затирает чужие изменения
+        Library(self.filename).change_book_status("2", "выдана")
+        with self.assertRaises(RuntimeError):
+            self.library.write_changes()
+        self.assertEqual(self.statuses(), ['в наличии', 'выдана'])
+
+    @patch('builtins.print')
+    @patch('builtins.input', side_effect=['5', '1', 'выдана', '6'])
+    def test_menu_exit_flushes(self, mock_input, mock_print): # выход из меню записывает накопленные изменения
+        management = LibraryManagement()
+        management.library = self.library
+        management.start_managing_library()
+        self.assertEqual(self.statuses(), ['выдана', 'в наличии'])
+        self.assertIsNone(self.library.scheduler)
+
+
+    def test_sigterm_flushes(self): # SIGTERM завершает меню с записью накопленных изменений
+        script = ("import sys; sys.path.insert(0, sys.argv[1]); from main import Library, LibraryManagement; "
+                  "LibraryManagement._library = Library(sys.argv[2]); LibraryManagement().start_managing_library()")
+        process = subprocess.Popen([sys.executable, '-c', script, self.cwd, self.filename],
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, cwd=self.tmp.name, text=True)
+        process.stdin.write("5\n1\nвыдана\n")
+        process.stdin.flush()
+        for line in process.stdout:
+            if "изменен" in line:
+                break
+        process.send_signal(signal.SIGTERM)
+        self.assertEqual(process.wait(timeout=10), 0)
+        process.stdin.close()
+        process.stdout.close()
+        self.assertEqual(self.statuses(), ['выдана', 'в наличии'])
+
+
+class TestServer(TempDirTestCase):
+    """
+    Тестирование HTTP/JSON сервиса: обработка запросов и сохранение изменений пачками.
+    """
+    def run_scenario(self, scenario):
+        async def run():
+            service = LibraryService(Library(filename=os.path.join(self.tmp.name, 'library.json')))
+            with patch('builtins.print'):
+                server = await service.start('127.0.0.1', 0)
+            service.address = server.sockets[0].getsockname()[:2]
+            reader, writer = await asyncio.open_connection(*service.address)
+            try:
+                await scenario(service, lambda *args: send_request(reader, writer, *args))
+            finally:
+                writer.close()
+                server.close()
+                await service.stop()
+        asyncio.run(run())
+
+    def test_requests(self): # добавление, поиск, список, изменение статуса и удаление через HTTP
+        async def scenario(service, request):
+            status, book = await request('POST', '/books', {'title': "Горе от ума", 'author': "Грибоедов", 'year': "1825"})
+            self.assertEqual((status, book['status']), (201, 'в наличии'))
+            self.assertEqual((await request('POST', '/books', {'title': "Книга"}))[0], 400)
+            self.assertEqual((await request('GET', '/search?q=%D0%B3%D0%BE%D1%80%D0%B5'))[1][0]['id'], book['id'])
+            self.assertEqual((await request('GET', '/books'))[1]['total'], 1)
+            status, changed = await request('PUT', f"/books/{book['id']}/status", {'status': 'выдана'})
+            self.assertEqual((status, changed['status']), (200, 'выдана'))
+            self.assertEqual((await request('DELETE', f"/books/{book['id']}"))[0], 200)
+            self.assertEqual((await request('GET', f"/books/{book['id']}"))[0], 404)
+            self.assertEqual((await request('GET', '/books/abc'))[0], 400)
+        self.run_scenario(scenario)
+        self.assertEqual(list(Library(filename=os.path.join(self.tmp.name, 'library.json')).iter_books()), [])
+
+    def test_concurrent_writes_are_batched(self): # одновременные изменения сохраняются меньшим числом записей
+        async def scenario(service, request):
+            requests = [service.dispatch('POST', '/books', json.dumps(
+                {'title': f"Книга {number}", 'author': "Автор", 'year': "2000"}).encode()) for number in range(50)]
+            responses = await asyncio.gather(*requests)
+            self.assertEqual([status for status, _ in responses], [201] * 50)
+            self.assertLess(service.saves, 50)
+        self.run_scenario(scenario)
+        self.assertEqual(len(list(Library(filename=os.path.join(self.tmp.name, 'library.json')).iter_books())), 50)
+
+    def test_batch_is_visible_after_save(self): # пока пачка пишется, читатели не видят ее, при ошибке записи каталог не меняется
+        async def scenario(service, request):
+            saving, release = asyncio.Event(), threading.Event()
+            loop = asyncio.get_event_loop()
+            write_changes = service.library.write_changes
+
+            def slow_write(*args):
+                loop.call_soon_threadsafe(saving.set)
+                release.wait(5)
+                write_changes(*args)
+
+            with patch.object(service.library, 'write_changes', side_effect=slow_write):
+                adding = asyncio.ensure_future(service.dispatch('POST', '/books', json.dumps(
+                    {'title': "Книга", 'author': "Автор", 'year': "2000"}).encode()))
+                await saving.wait()
+                self.assertEqual((await request('GET', '/books'))[1]['total'], 0)
+                release.set()
+                status, book = await adding
+            self.assertEqual((await request('GET', f"/books/{book['id']}"))[0], 200)
+            with patch.object(service.library, 'write_changes', side_effect=OSError("Диск заполнен")):
+                responses = await asyncio.gather(service.dispatch('DELETE', f"/books/{book['id']}"),
+                                                 service.dispatch('POST', '/books', json.dumps(
+                                                     {'title': "Другая", 'author': "Автор", 'year': "2001"}).encode()))
+            self.assertEqual([status for status, _ in responses], [500, 500])
+            self.assertEqual((await request('GET', '/books'))[1]['books'], [book])
+        self.run_scenario(scenario)
+
+    def test_malformed_request_line(self): # на некорректную строку запроса сервер отвечает 400 и закрывает соединение
+        async def scenario(service, request):
+            reader, writer = await asyncio.open_connection(*service.address)
+            writer.write(b"GARBAGE\r\n\r\n")
+            await writer.drain()
+            self.assertEqual((await reader.readline()).split()[1], b'400')
+            writer.close()
+        self.run_scenario(scenario)
+
+
+
+class TestInstrumentation(TempDirTestCase):
+    """
+    Тестирование сбора статистики: подмена методов при включении, счетчики вызовов, ввода-вывода и кэша, профиль команды.
+    """
+    def setUp(self):
+        super().setUp()
+        self.library = Library(filename=os.path.join(self.tmp.name, 'library.json'))
+        self.instrumentation = Instrumentation(Library, Book)
+        self.addCleanup(self.instrumentation.disable)
+
+    def test_disabled_leaves_classes_unchanged(self): # выключенный сбор не оставляет оберток в классах
+        originals = (Library.__dict__['add_book'], JsonStorage.__dict__['save'], Book.__dict__['from_dict'])
+        self.instrumentation.enable()
+        self.assertIsNot(Library.__dict__['add_book'], originals[0])
+        with self.assertRaises(RuntimeError):
+            Instrumentation(Library, Book).enable()
+        self.instrumentation.disable()
+        self.assertEqual((Library.__dict__['add_book'], JsonStorage.__dict__['save'], Book.__dict__['from_dict']), originals)
+        self.assertIsNone(Instrumentation.active)
+
+    @patch('builtins.print')
+    def test_binary_storage_counters(self, mock_print): # вызовы и байты двоичного хранилища тоже считаются
+        library = Library(storage=BinaryStorage(os.path.join(self.tmp.name, 'library.bin')))
+        self.instrumentation.enable()
+        library.add_book("Название", "Автор", "2000")
+        Library(storage=BinaryStorage(library.filename)).count_books()
+        stats = self.instrumentation.stats()
+        self.assertEqual(stats['calls']['BinaryStorage.save']['count'], 1)
+        self.assertEqual(stats['calls']['BinaryStorage.load']['count'], 2)
+        self.assertEqual(stats['bytes_written'], os.path.getsize(library.filename))
+
+    @patch('builtins.print')
+    def test_journal_compact_bytes_counted_once(self, mock_print): # запись снимка внутри save не учитывается второй раз
+        library = Library(storage=JournalStorage(os.path.join(self.tmp.name, 'library.json'), compact_threshold=1))
+        library.add_book("Название", "Автор", "2000")
+        self.instrumentation.enable()
+        library.change_book_status(str(library.books[0].id), "выдана")
+        stats = self.instrumentation.stats()
+        self.assertEqual(stats['calls']['JournalStorage.compact']['count'], 1)
+        self.assertEqual(os.path.getsize(library.storage.journal_filename), 0)
+        self.assertEqual(stats['bytes_written'], os.path.getsize(library.filename))
+
+    def test_failed_enable_rolls_back(self): # если подменить метод не удалось, уже подмененные методы возвращаются
+        originals = (Library.__dict__['add_book'], JsonStorage.__dict__['load'])
+        with patch.dict('instrumentation.STORAGE_METHODS', {JsonStorage: ('load', 'missing')}):
+            with self.assertRaises(KeyError):
+                self.instrumentation.enable()
+        self.assertEqual((Library.__dict__['add_book'], JsonStorage.__dict__['load']), originals)
+        self.assertFalse(self.instrumentation.enabled)
+        self.assertIsNone(Instrumentation.active)
+
+    @patch('builtins.print')
+    def test_counters(self, mock_print): # вызовы, байты, созданные книги и попадания в кэш каталога
+        self.library.add_book("Название", "Автор", "2000")
+        self.instrumentation.enable()
+        self.library.add_book("Другая", "Автор", "2001")
+        self.library.count_books()
+        Library(self.library.filename).count_books()
+        stats = self.instrumentation.stats()
+        self.assertEqual(stats['calls']['Library.add_book']['count'], 1)
+        self.assertEqual(stats['calls']['JsonStorage.save']['count'], 1)
+        self.assertEqual(stats['calls']['JsonStorage.load']['count'], 1)
+        self.assertEqual(stats['bytes_written'], os.path.getsize(self.library.filename))
+        self.assertEqual(stats['bytes_read'], os.path.getsize(self.library.filename))
+        self.assertEqual(stats['books_materialized'], 2)
+        self.assertEqual((stats['cache_hits'], stats['cache_misses']), (2, 1))
+        self.assertIn("Library.add_book", self.instrumentation.report())
+
+    @patch('builtins.print')
+    def test_command_profile(self, mock_print): # профиль cProfile и пиковая память команды
+        output = io.StringIO()
+        self.instrumentation.profile, self.instrumentation.trace_memory = True, True
+        self.instrumentation.output = output
+        self.instrumentation.enable()
+        with self.instrumentation.command('add_book_in_library'):
+            self.library.add_book("Название", "Автор", "2000")
+        self.assertIn("add_book", output.getvalue())
+        command = self.instrumentation.stats()['commands']['add_book_in_library']
+        self.assertEqual(command['count'], 1)
+        self.assertGreater(command['peak_bytes'], 0)
+
+
+class TestBinaryStorage(TempDirTestCase):
+    """
+    Тестирование двоичного формата каталога: перевод из json и обратно, чтение и изменение книг на месте, работа Library.
+    """
+    def setUp(self):
+        super().setUp()
+        self.records = [{'id': id, 'title': f"Название {id}", 'author': f"Автор {id % 3}", 'year': str(2000 + id % 5),
+                         'status': 'выдана' if id % 2 else 'в наличии'} for id in (7, 3, 12, 1)]
+        self.json_filename = os.path.join(self.tmp.name, 'library.json')
+        self.filename = os.path.join(self.tmp.name, 'library.bin')
+        with open(self.json_filename, 'w') as f:
+            json.dump(self.records, f, indent=4)
+
+    def test_json_round_trip(self): # перевод в двоичный формат и обратно сохраняет записи и их порядок
+        self.assertEqual(json_to_binary(self.json_filename, self.filename), 4)
+        self.assertLess(os.path.getsize(self.filename), os.path.getsize(self.json_filename))
+        self.assertEqual(binary_to_json(self.filename, os.path.join(self.tmp.name, 'copy.json')), 4)
+        with open(os.path.join(self.tmp.name, 'copy.json')) as f:
+            self.assertEqual(json.load(f), self.records)
+        with self.assertRaises(ValueError):
+            write_binary(self.filename, [dict(self.records[0], year=2000)])
+
+    def test_random_access_and_status_in_place(self): # чтение книги по id и изменение статуса без перезаписи файла
+        write_binary(self.filename, self.records)
+        signature = os.stat(self.filename)
+        with BinaryCatalogue(self.filename, writable=True) as catalogue:
+            self.assertEqual(len(catalogue), 4)
+            self.assertEqual(catalogue.get(12), self.records[2])
+            self.assertIsNone(catalogue.get(5))
+            catalogue.set_status(12, 'выдана')
+            with self.assertRaises(KeyError):
+                catalogue.set_status(5, 'выдана')
+        with BinaryCatalogue(self.filename) as catalogue:
+            self.assertEqual(catalogue.get(12)['status'], 'выдана')
+        self.assertEqual((os.stat(self.filename).st_ino, os.stat(self.filename).st_size),
+                         (signature.st_ino, signature.st_size))
+
+    def test_corrupted_file(self): # файл другого формата не открывается
+        with open(self.filename, 'wb') as f:
+            f.write(b'[]')
+        with self.assertRaises(ValueError):
+            BinaryCatalogue(self.filename)
+
+    @patch('builtins.print')
+    def test_library_with_binary_storage(self, mock_print): # Library сохраняет изменения статусов на месте, остальные - перезаписью
+        write_binary(self.filename, self.records)
+        library = Library(storage=BinaryStorage(self.filename))
+        other = Library(storage=BinaryStorage(self.filename))
+        other.load_from_file_list_book()
+        inode = os.stat(self.filename).st_ino
+        library.change_book_status("12", "выдана")
+        self.assertEqual(os.stat(self.filename).st_ino, inode)
+        self.assertEqual(other.books.get(12).status, 'в наличии')
+        self.assertEqual(other.count_books('выдана'), 4)
+        library.add_book("Новая", "Автор", "2020")
+        library.remove_book("7")
+        self.assertEqual([book.id for book in Library(storage=BinaryStorage(self.filename)).list_books(limit=10)],
+                         [1, 3, 12, 13])
+
+
+class TestCommandLine(TempDirTestCase):
+    """
+    Тестирование командной строки: отдельные команды, сценарий с одной записью в конце, отмена сценария при ошибке.
+    """
+    def setUp(self):
+        super().setUp()
+        self.filename = os.path.join(self.tmp.name, 'library.json')
+
+    def run_main(self, *argv: str, stdin: str = '') -> str: # вывод main с перехватом стандартных потоков
+        self.output = io.StringIO()
+        with contextlib.redirect_stdout(self.output), contextlib.redirect_stderr(self.output), \
+                patch('sys.stdin', io.StringIO(stdin)):
+            main(['--filename', self.filename, *argv])
+        return self.output.getvalue()
+
+    def test_commands(self): # add, status, list, search и remove
+        self.run_main('add', "Мастер и Маргарита", "Михаил Булгаков", "1967")
+        self.run_main('add', "Белая гвардия", "Михаил Булгаков", "1925")
+        self.run_main('status', '1', 'выдана')
+        self.assertIn("Белая гвардия", self.run_main('list', '--sort-by', 'title', '--limit', '1'))
+        self.assertNotIn("Белая гвардия", self.run_main('list', '--status', 'выдана'))
+        self.assertIn("Мастер и Маргарита", self.run_main('search', 'мастер'))
+        self.run_main('remove', '2')
+        self.assertEqual([book.id for book in Library(self.filename).list_books()], [1])
+        with self.assertRaises(SystemExit):
+            self.run_main('remove', '2')
+
+    def test_batch_is_saved_once(self): # команды сценария выполняются над одним каталогом и сохраняются одной записью
+        script = 'add "Горе от ума" "Александр Грибоедов" 1825\n# комментарий\n\nstatus 1 выдана\nadd Идиот "Фёдор Достоевский" 1869\n'
+        with patch.object(JsonStorage, 'save', autospec=True, side_effect=JsonStorage.save) as mock_save:
+            output = self.run_main('batch', stdin=script)
+        self.assertEqual(mock_save.call_count, 1)
+        self.assertIn("Выполнено команд: 3", output)
+        self.assertEqual([(book.id, book.status) for book in Library(self.filename).list_books()],
+                         [(1, 'выдана'), (2, 'в наличии')])
+
+    def test_batch_error_cancels_changes(self): # при ошибке в сценарии не сохраняется ни одно его изменение
+        self.run_main('add', "Горе от ума", "Александр Грибоедов", "1825")
+        with self.assertRaises(SystemExit) as error:
+            self.run_main('batch', stdin='status 1 выдана\nremove 99\n')
+        self.assertEqual(error.exception.code, 1)
+        self.assertNotIn("изменен на", self.output.getvalue())
+        self.assertIn("Сценарий отменен", self.output.getvalue())
+        with self.assertRaises(SystemExit):
+            self.run_main('batch', stdin='status 1 выдана\nunknown 1\n')
+        self.assertEqual([book.status for book in Library(self.filename).list_books()], ['в наличии'])
+
+    def test_import_is_lazy(self): # импорт main не создает библиотеку и не загружает модули фоновой записи и статистики
+        script = ("import sys; sys.path.insert(0, sys.argv[1]); import main; "
+                  "print(main.LibraryManagement._library, 'persistence' in sys.modules, 'instrumentation' in sys.modules)")
+        output = subprocess.run([sys.executable, '-c', script, self.cwd], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.split(), ['None', 'False', 'False'])
+
+
+class TestBench(unittest.TestCase):
+    """
+    Тестирование генератора реалистичного каталога и сравнения результатов замеров.
+    """
+    def test_realistic_catalogue(self): # записи проходят валидацию Book, названия кириллические, авторы распределены неравномерно
+        records = list(generate_realistic_catalogue(2000, seed=1))
+        self.assertEqual([record['id'] for record in records], list(range(1, 2001)))
+        self.assertEqual(records, list(generate_realistic_catalogue(2000, seed=1)))
+        for record in records:
+            Book.from_dict(record)
+            self.assertTrue(any('а' <= char.lower() <= 'я' for char in record['title']))
+        counts = sorted((sum(1 for record in records if record['author'] == author)
+                         for author in {record['author'] for record in records}), reverse=True)
+        self.assertGreater(counts[0], 10 * counts[len(counts) // 2])
+
+    def test_compare_results(self): # ухудшение засчитывается с учетом направления метрики и порога
+        previous = {'operations': {'1000': {'add.p95_ms': 1.0, 'add.ops_per_sec': 1000.0, 'search.p95_ms': 2.0}}}
+        current = {'operations': {'1000': {'add.p95_ms': 1.5, 'add.ops_per_sec': 1200.0, 'search.p95_ms': 2.1,
+                                           'remove.p95_ms': 5.0}}}
+        with contextlib.redirect_stdout(io.StringIO()):
+            regressions = compare_results(previous, current, 0.1)
+        self.assertEqual(regressions, ['operations 1000 add.p95_ms'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            regressions = compare_results(current, previous, 0.1)
+        self.assertEqual(regressions, ['operations 1000 add.ops_per_sec'])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file